@@ -0,0 +1,73 @@
+"""录制与回放: 磁带保存对局参数，回放得到完全相同的一局"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from undercover_game.cassette import Cassette, record_game, replay_game
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.prompts import HistoryPolicy
+from undercover_game.sinks import NullSink
+from undercover_game.words import WORD_PAIRS, WindowSampler
+
+
+def test_replay_uses_recorded_history_policy(tmp_path: Path) -> None:
+    path = tmp_path / "game.cassette"
+    history = HistoryPolicy(recent_rounds=1, max_prompt_tokens=400)
+    recorded = record_game(
+        path,
+        llm=FakeLLM(),
+        seed=3,
+        num_players=8,
+        num_undercover=2,
+        sink=NullSink(),
+        history=history,
+    )
+
+    assert Cassette.load(path).meta["history"] == {
+        "recent_rounds": 1,
+        "max_prompt_tokens": 400,
+    }
+    # 提示词随 HistoryPolicy 变化，参数没还原时回放会找不到请求
+    replayed = replay_game(path, sink=NullSink())
+    assert replayed["game_log"] == recorded["game_log"]
+
+
+def test_record_rejects_custom_summarize(tmp_path: Path) -> None:
+    history = HistoryPolicy(summarize=lambda name, descriptions: descriptions[-1])
+    with pytest.raises(ValueError, match="clip_summary"):
+        record_game(
+            tmp_path / "game.cassette",
+            llm=FakeLLM(),
+            num_players=5,
+            sink=NullSink(),
+            history=history,
+        )
+
+
+def test_replay_uses_recorded_sampler_pair(tmp_path: Path) -> None:
+    path = tmp_path / "game.cassette"
+    sampler = WindowSampler(WORD_PAIRS, seed=5)
+    sampler.draw()  # 回放时的抽样器位置与录制时不同也不影响
+    recorded = record_game(
+        path, llm=FakeLLM(), seed=1, num_players=5, sink=NullSink(), words=sampler
+    )
+
+    assert Cassette.load(path).meta["words"] == list(recorded["words"])
+    replayed = replay_game(path, sink=NullSink())
+    assert replayed["words"] == recorded["words"]
+    assert replayed["game_log"] == recorded["game_log"]
+
+
+def test_replay_uses_recorded_kinds(tmp_path: Path) -> None:
+    path = tmp_path / "game.cassette"
+    kinds = ["heuristic"] * 4 + ["ai"]
+    recorded = record_game(
+        path, llm=FakeLLM(), seed=2, num_players=5, sink=NullSink(), kinds=kinds
+    )
+
+    assert Cassette.load(path).meta["kinds"] == kinds
+    replayed = replay_game(path, sink=NullSink())
+    assert replayed["game_log"] == recorded["game_log"]
@@ -0,0 +1,57 @@
+"""检查点续跑: 中断后用同一个 thread_id 继续，结果与不中断运行相同"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from undercover_game.checkpoints import sqlite_checkpointer
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.game import UndercoverGame
+from undercover_game.sinks import NullSink
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashingLLM(FakeLLM):
+    """第 crash_at 次调用时抛出异常，模拟进程中断"""
+
+    def __init__(self, crash_at: int) -> None:
+        super().__init__()
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise Interrupted
+        yield from super().stream(prompt, **kwargs)
+
+
+def _game(seed: int | None, llm: Any) -> UndercoverGame:
+    return UndercoverGame(7, 2, llm=llm, sink=NullSink(), seed=seed)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_resumed_game_matches_uninterrupted_run(tmp_path: Path, seed: int) -> None:
+    expected = _game(seed, FakeLLM()).run()
+    checkpointer = sqlite_checkpointer(tmp_path / "games.sqlite")
+
+    # 第二轮描述时中断，此时第一轮的淘汰（可能是平票）已经写入检查点
+    with pytest.raises(Interrupted):
+        _game(seed, CrashingLLM(crash_at=16)).run(
+            checkpointer=checkpointer, thread_id="game", durability="sync"
+        )
+    # 续跑的进程用不同的种子新建游戏，随机源状态应来自检查点
+    resumed = _game(seed + 100, FakeLLM()).run(
+        checkpointer=checkpointer, thread_id="game", durability="sync"
+    )
+
+    assert resumed["game_log"] == expected["game_log"]
+    assert resumed["winner"] == expected["winner"]
@@ -0,0 +1,238 @@
+"""UndercoverGame 的对局流程"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import replace
+from typing import Any
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.game import GameLog, UndercoverGame, append_log, compiled_graph
+from undercover_game.players import player_name
+from undercover_game.prompts import Transcript
+from undercover_game.sinks import NullSink
+
+
+def test_reused_instance_deals_fresh_players() -> None:
+    game = UndercoverGame(5, 1, llm=FakeLLM(), sink=NullSink(), seed=0)
+    states = [game.run() for _ in range(4)]
+
+    # 同一个种子的随机源继续往下走，几局的词语不全相同
+    assert len({state["words"] for state in states}) > 1
+    state = states[-1]
+    for record in state["players"]:
+        player = game.agents[record.name]
+        assert player.word == state["words"][record.undercover]
+        assert player.is_undercover == record.undercover
+    # 历史文本只包含本局的描述
+    descriptions = state["descriptions"]
+    assert game.transcript.sync(descriptions) == Transcript().sync(descriptions)
+
+
+def test_game_log_appends_without_disturbing_earlier_views() -> None:
+    base = append_log(GameLog(), ["开始"])
+    tip = append_log(base, ["玩家A: 红色"])
+    assert tip == ["开始", "玩家A: 红色"]
+    assert base == ["开始"]
+
+    # 条件边先在通道的拷贝上应用写入，正式应用同一个写入时复用底层列表
+    write = ["玩家B 被淘汰"]
+    local = append_log(tip, write)
+    applied = append_log(tip, write)
+    assert applied == local == ["开始", "玩家A: 红色", "玩家B 被淘汰"]
+    assert applied._lines is tip._lines
+
+    # 从旧视图分叉追加不同的行时复制，已有的视图不变
+    branch = append_log(base, ["玩家C: 水果"])
+    assert branch == ["开始", "玩家C: 水果"]
+    assert applied == ["开始", "玩家A: 红色", "玩家B 被淘汰"]
+    assert append_log(["旧检查点"], ["下一行"]) == ["旧检查点", "下一行"]
+
+
+def _scan(state: dict) -> tuple[list[str], int]:
+    """不用索引，直接扫描玩家表得到存活名单和存活卧底数"""
+    alive = [p for p in state["players"] if p.alive]
+    return [p.name for p in alive], sum(p.undercover for p in alive)
+
+
+def _state(players: list, eliminated: list[str]) -> dict:
+    """和淘汰阶段一样，玩家表里被淘汰的记录标记为 alive=False"""
+    out = set(eliminated)
+    players = [replace(p, alive=p.name not in out) for p in players]
+    return {"players": players, "eliminated": eliminated}
+
+
+def test_alive_index_follows_eliminations() -> None:
+    game = UndercoverGame(30, 4, llm=FakeLLM(), sink=NullSink(), seed=0)
+    _, players = game.create_players()
+    assert [p.name for p in players[25:28]] == ["玩家Z", "玩家AA", "玩家AB"]
+    index = game.alive_index(_state(players, []))
+
+    # 每次淘汰都在同一个索引上增量更新
+    eliminated: list[str] = []
+    for name in ["玩家AA", "玩家A", player_name(29)]:
+        eliminated.append(name)
+        state = _state(players, list(eliminated))
+        assert game.alive_index(state) is index
+        assert list(index.alive) == _scan(state)[0]
+        assert index.undercover_alive == _scan(state)[1]
+        assert index.civilian_alive == len(index.alive) - index.undercover_alive
+
+    # 淘汰记录与索引不一致（换了一局或从检查点回退）时重建
+    forked = _state(players, ["玩家B"])
+    rebuilt = game.alive_index(forked)
+    assert rebuilt is not index
+    assert list(rebuilt.alive) == _scan(forked)[0]
+    assert rebuilt.undercover_alive == _scan(forked)[1]
+
+
+def test_alive_index_matches_finished_games() -> None:
+    game = UndercoverGame(40, 6, llm=FakeLLM(), sink=NullSink(), seed=1)
+    for _ in range(3):
+        state = game.run()
+        alive, undercover_alive = _scan(state)
+        index = game.alive_index(state)
+        assert list(index.alive) == alive
+        assert index.undercover_alive == undercover_alive
+        assert [p.name for p in state["players"] if p.alive] == alive
+
+
+class InflightLLM(FakeLLM):
+    """记录同时进行中的流式调用数的最大值"""
+
+    def __init__(self) -> None:
+        super().__init__(ttft=0.005)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        with self._lock:
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            yield from super().stream(prompt, **kwargs)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_concurrent_votes_match_sequential(seed: int) -> None:
+    results = {}
+    for concurrent in (False, True):
+        llm = InflightLLM()
+        game = UndercoverGame(
+            6, 2, concurrent_votes=concurrent, llm=llm, sink=NullSink(), seed=seed
+        )
+        results[concurrent] = game.run()
+        # 逐个投票时同一时刻只有一个请求；并发投票时所有存活玩家同时请求
+        assert (llm.max_inflight > 1) == concurrent
+
+    # 并发收集的票按座位顺序记录，对局与逐个投票完全相同
+    assert results[True]["game_log"] == results[False]["game_log"]
+    assert results[True]["vote_history"] == results[False]["vote_history"]
+
+
+class AsyncInflightLLM(FakeLLM):
+    """记录同时进行中的异步流式调用数的最大值"""
+
+    def __init__(self) -> None:
+        super().__init__(ttft=0.005)
+        self.inflight = 0
+        self.max_inflight = 0
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            async for chunk in super().astream(prompt, **kwargs):
+                yield chunk
+        finally:
+            self.inflight -= 1
+
+
+@pytest.mark.parametrize("concurrent_votes", [False, True])
+def test_arun_matches_run(concurrent_votes: bool) -> None:
+    for seed in range(3):
+        expected = UndercoverGame(
+            6,
+            2,
+            concurrent_votes=concurrent_votes,
+            llm=FakeLLM(),
+            sink=NullSink(),
+            seed=seed,
+        ).run()
+        game = UndercoverGame(
+            6,
+            2,
+            concurrent_votes=concurrent_votes,
+            llm=FakeLLM(),
+            sink=NullSink(),
+            seed=seed,
+        )
+        result = asyncio.run(game.arun())
+        assert result["game_log"] == expected["game_log"]
+        assert result["winner"] == expected["winner"]
+
+
+def test_arun_games_share_one_event_loop() -> None:
+    llm = AsyncInflightLLM()
+    games = [
+        UndercoverGame(5, 1, llm=llm, sink=NullSink(), seed=seed) for seed in range(4)
+    ]
+
+    async def run_all() -> list:
+        return await asyncio.gather(*(game.arun() for game in games))
+
+    results = asyncio.run(run_all())
+    # 各局逐个发言，但多局的请求在同一个事件循环里交错进行
+    assert llm.max_inflight > 1
+    for seed, result in enumerate(results):
+        expected = UndercoverGame(5, 1, llm=FakeLLM(), sink=NullSink(), seed=seed).run()
+        assert result["game_log"] == expected["game_log"]
+
+
+class CountingGame(UndercoverGame):
+    """覆盖阶段方法的子类，共享的状态图也要调用到子类的实现"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.describe_rounds = 0
+
+    def _describe_phase(self, state: dict) -> dict:
+        self.describe_rounds += 1
+        return super()._describe_phase(state)
+
+
+def test_games_share_compiled_graph() -> None:
+    assert compiled_graph() is compiled_graph()
+    assert compiled_graph(use_async=True) is not compiled_graph()
+
+    game = CountingGame(5, 1, llm=FakeLLM(), sink=NullSink(), seed=0)
+    state = game.run()
+    assert game.describe_rounds == state["round_num"] > 0
+
+
+def test_shared_graph_keeps_games_apart() -> None:
+    # 同一个编译好的图上并发运行参数不同的几局，每局只用自己的参数和玩家
+    settings = [(5, 1, 0), (8, 2, 1), (12, 3, 2)]
+
+    async def run_all() -> list:
+        games = [
+            UndercoverGame(n, k, llm=FakeLLM(ttft=0.002), sink=NullSink(), seed=seed)
+            for n, k, seed in settings
+        ]
+        return await asyncio.gather(*(game.arun() for game in games))
+
+    for (n, k, seed), result in zip(settings, asyncio.run(run_all())):
+        expected = UndercoverGame(n, k, llm=FakeLLM(), sink=NullSink(), seed=seed).run()
+        assert len(result["players"]) == n
+        assert result["game_log"] == expected["game_log"]
@@ -0,0 +1,95 @@
+"""RateGovernor 的重试（429 之外的 5xx / 超时 / 连接错误也退避重试）和共享实例的指标"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from undercover_game import players
+from undercover_game.governor import GovernedLLM, RateGovernor
+from undercover_game.hedging import HedgedLLM
+from undercover_game.metrics import MetricsRegistry
+from undercover_game.players import LLM_METRICS, AIPlayer, get_llm
+
+REQUEST = httpx.Request("POST", "http://mock/v1/chat/completions")
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    response = httpx.Response(status, request=REQUEST)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+class FlakyLLM:
+    """前几次调用依次抛出 errors 里的异常，之后正常回复"""
+
+    def __init__(self, *errors: BaseException) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        yield AIMessageChunk(content="玩家B")
+
+
+def _governor(**kwargs: Any) -> RateGovernor:
+    return RateGovernor(max_concurrency=1, backoff_base=0.001, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        _status_error(500),
+        _status_error(503),
+        openai.APITimeoutError(request=REQUEST),
+        openai.APIConnectionError(request=REQUEST),
+    ],
+)
+def test_transient_errors_are_retried(error: BaseException) -> None:
+    llm = FlakyLLM(error)
+    governor = _governor()
+    chunks = list(GovernedLLM(llm, governor).stream("提示词"))
+
+    assert [chunk.content for chunk in chunks] == ["玩家B"]
+    assert llm.calls == 2
+    assert governor.metrics.counters["llm_governor_retries_total"] == {(): 1}
+
+
+def test_client_errors_are_not_retried() -> None:
+    llm = FlakyLLM(_status_error(400))
+    with pytest.raises(openai.APIStatusError):
+        list(GovernedLLM(llm, _governor()).stream("提示词"))
+    assert llm.calls == 1
+
+
+def test_retries_are_bounded() -> None:
+    llm = FlakyLLM(*[_status_error(502) for _ in range(5)])
+    with pytest.raises(openai.APIStatusError):
+        list(GovernedLLM(llm, _governor(max_retries=2)).stream("提示词"))
+    assert llm.calls == 3
+
+
+def test_shared_llm_keeps_process_registry(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(players, "_global_llm", None)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "2")
+    monkeypatch.setenv("LLM_HEDGE_QUANTILE", "0.9")
+    for name in ("LLM_MAX_RPM", "LLM_MAX_TPM", "LLM_CACHE_PATH"):
+        monkeypatch.delenv(name, raising=False)
+
+    # 两局的玩家拿到同一个共享实例，各自的注册表不会替换限流器和对冲请求的注册表
+    AIPlayer("玩家A", "苹果", False, metrics=MetricsRegistry())
+    AIPlayer("玩家B", "苹果", False, metrics=MetricsRegistry())
+    llm = get_llm()
+    assert isinstance(llm, HedgedLLM)
+    assert llm.metrics is LLM_METRICS
+    assert isinstance(llm.llm, GovernedLLM)
+    assert llm.llm.governor.metrics is LLM_METRICS
@@ -0,0 +1,50 @@
+"""启发式玩家的词语特征（内置词有专门的特征，其他词退化为固定的通用描述），以及直接运行的对局"""
+
+from __future__ import annotations
+
+import pytest
+
+from undercover_game.fake_llm import DESCRIPTIONS, FakeLLM
+from undercover_game.game import UndercoverGame
+from undercover_game.heuristic import ATTRIBUTES, word_attributes
+from undercover_game.sinks import NullSink
+from undercover_game.words import WORD_PAIRS
+
+
+def test_attributes_cover_builtin_pairs() -> None:
+    for civilian, undercover in WORD_PAIRS:
+        assert word_attributes(civilian) == ATTRIBUTES[civilian]
+        assert word_attributes(undercover) == ATTRIBUTES[undercover]
+
+
+def test_unknown_words_fall_back_to_generic_descriptions() -> None:
+    # 语料库中的词不在属性表里: 只能用通用描述，且同一个词总是得到同样的几条
+    attributes = word_attributes("榴莲")
+    generic = {description.rstrip("。") for description in DESCRIPTIONS}
+
+    assert "榴莲" not in ATTRIBUTES
+    assert len(attributes) == 3
+    assert set(attributes) <= generic
+    assert word_attributes("榴莲") == attributes
+
+
+@pytest.mark.parametrize("moderator_votes", [False, True])
+@pytest.mark.parametrize("kinds", [["heuristic"] * 7, ["heuristic"] * 6 + ["ai"]])
+def test_run_direct_matches_graph_run(kinds: list[str], moderator_votes: bool) -> None:
+    for seed in range(10):
+        states = [
+            getattr(
+                UndercoverGame(
+                    7,
+                    2,
+                    llm=FakeLLM(),
+                    sink=NullSink(),
+                    seed=seed,
+                    kinds=kinds,
+                    moderator_votes=moderator_votes,
+                ),
+                method,
+            )()
+            for method in ("run", "run_direct")
+        ]
+        assert states[0] == states[1]
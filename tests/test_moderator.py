@@ -0,0 +1,95 @@
+"""主持人模式: 一次结构化输出请求得到所有票，缺票或回复不合法时退回逐个投票"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import pytest
+
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.game import UndercoverGame
+from undercover_game.metrics import MetricsRegistry
+from undercover_game.moderator import parse_ballots
+from undercover_game.sinks import NullSink
+
+BALLOTS = {"玩家A": ["玩家B", "玩家C"], "玩家B": ["玩家A", "玩家C"]}
+
+
+class PartialLLM(FakeLLM):
+    """主持人的回复漏掉第一个投票者"""
+
+    def structured_reply(self, prompt: Any, response_format: dict) -> str:
+        ballots = json.loads(super().structured_reply(prompt, response_format))
+        if response_format["json_schema"]["name"] == "votes":
+            del ballots[next(iter(ballots))]
+        return json.dumps(ballots, ensure_ascii=False)
+
+
+def test_parse_ballots_is_strict() -> None:
+    assert parse_ballots('{"玩家A": "玩家B", "玩家B": "玩家C"}', BALLOTS) == {
+        "玩家A": "玩家B",
+        "玩家B": "玩家C",
+    }
+    # 投给自己、未知的投票者和非字符串的票都丢弃
+    assert (
+        parse_ballots('{"玩家A": "玩家A", "玩家B": 1, "玩家Z": "玩家A"}', BALLOTS) == {}
+    )
+    assert parse_ballots('{"玩家A": "玩家B"} 多余的解释', BALLOTS) is None
+    assert parse_ballots('["玩家B"]', BALLOTS) is None
+
+
+def _game(llm: Any, metrics: MetricsRegistry, seed: int = 0) -> UndercoverGame:
+    return UndercoverGame(
+        6, 2, moderator_votes=True, llm=llm, sink=NullSink(), seed=seed, metrics=metrics
+    )
+
+
+def test_one_request_per_round() -> None:
+    metrics = MetricsRegistry()
+    game = _game(FakeLLM(), metrics)
+    state = game.run()
+    rounds = state["round_num"]
+
+    assert [phase for phase, *_ in game.active_moderator.timings] == [
+        "vote_batch"
+    ] * rounds
+    assert all(
+        phase == "describe"
+        for player in game.agents.values()
+        for phase, *_ in player.timings
+    )
+    assert metrics.counters["vote_batch_total"] == {(("outcome", "ok"),): rounds}
+    # 每轮的票按座位顺序记录，包含所有存活玩家
+    for votes in state["vote_history"]:
+        seats = [p.name for p in state["players"] if p.name in votes]
+        assert list(votes) == seats
+
+
+def _alive_counts(state: dict) -> list[int]:
+    """每轮投票时的存活人数"""
+    n = len(state["players"])
+    return [n - i for i in range(len(state["vote_history"]))]
+
+
+@pytest.mark.parametrize(
+    ("llm", "outcome"),
+    [(PartialLLM(), "partial"), (FakeLLM(chatter=True), "malformed")],
+)
+def test_missing_ballots_fall_back_to_player_votes(llm: Any, outcome: str) -> None:
+    metrics = MetricsRegistry()
+    game = _game(llm, metrics)
+    state = game.run()
+    rounds = state["round_num"]
+
+    fallbacks = sum(
+        phase == "vote"
+        for player in game.agents.values()
+        for phase, *_ in player.timings
+    )
+    assert metrics.counters["vote_batch_total"] == {(("outcome", outcome),): rounds}
+    assert metrics.counters["vote_batch_fallbacks_total"] == {(): fallbacks}
+    # 缺一票时每轮退回一次，回复不合法时所有人都退回逐个投票
+    alive = _alive_counts(state)
+    assert fallbacks == (rounds if outcome == "partial" else sum(alive))
+    assert [len(votes) for votes in state["vote_history"]] == alive
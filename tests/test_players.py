@@ -0,0 +1,146 @@
+"""AIPlayer 流式调用: 满足结束条件时立即关闭流、读到最后的 usage chunk，以及投票解析失败的计数"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from undercover_game.metrics import MetricsRegistry
+from undercover_game.mock_server import make_server
+from undercover_game.players import AIPlayer
+from undercover_game.sinks import NullSink
+
+USAGE = {
+    "input_tokens": 120,
+    "output_tokens": 8,
+    "total_tokens": 128,
+    "input_token_details": {"cache_read": 64},
+}
+
+
+class OpenAIStyleLLM:
+    """像 OpenAI 一样先发内容 chunk，最后单独发一个只带 usage 的空 chunk"""
+
+    def __init__(self, reply: str) -> None:
+        self.reply = reply
+        self.read = 0
+        self.kwargs: dict[str, Any] = {}
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        self.kwargs = kwargs
+        for i in range(0, len(self.reply), 2):
+            self.read += 1
+            yield AIMessageChunk(content=self.reply[i : i + 2])
+        self.read += 1
+        yield AIMessageChunk(content="", usage_metadata=USAGE)
+
+
+def test_vote_closes_stream_at_stop() -> None:
+    llm = OpenAIStyleLLM("玩家B。因为他的描述太笼统了")
+    metrics = MetricsRegistry()
+    player = AIPlayer("玩家A", "苹果", False, llm=llm, sink=NullSink(), metrics=metrics)
+
+    assert player.vote(["玩家B", "玩家C"], {"玩家B": ["水果"]}) == "玩家B"
+    # 读到 "B。" 就关闭流，后面的内容和 usage chunk 都不再读取
+    assert llm.read == 2
+    assert player.prompt_usage == []
+    assert metrics.counters["llm_usage_unknown_total"] == {(("phase", "vote"),): 1}
+
+
+def test_uncut_reply_records_usage_from_final_chunk() -> None:
+    llm = OpenAIStyleLLM("玩家")
+    player = AIPlayer("玩家A", "苹果", False, llm=llm, sink=NullSink())
+
+    # 回复里没有合法的名字，不会提前结束，一直读到最后的 usage chunk
+    player.vote(["玩家B", "玩家C"], {"玩家B": ["水果"]})
+    assert llm.read == 2
+    assert player.prompt_usage == [("vote", 0, 120, 64)]
+
+
+def test_structured_vote_closes_stream_at_brace() -> None:
+    llm = OpenAIStyleLLM('{"vote": "玩家C"} 因为他的描述太笼统了')
+    metrics = MetricsRegistry()
+    player = AIPlayer("玩家A", "苹果", False, llm=llm, sink=NullSink(), metrics=metrics)
+    player.structured_votes = True
+
+    assert player.vote(["玩家B", "玩家C"], {"玩家B": ["水果"]}) == "玩家C"
+    # 可选玩家作为枚举写进 JSON Schema，读到右花括号就关闭流
+    schema = llm.kwargs["response_format"]["json_schema"]["schema"]
+    assert schema["properties"]["vote"]["enum"] == ["玩家B", "玩家C"]
+    assert llm.read == 8
+    assert "vote_parse_failures_total" not in metrics.counters
+    assert "vote_fallbacks_total" not in metrics.counters
+
+
+@pytest.mark.parametrize(
+    ("structured", "reply", "vote", "failures", "fallbacks"),
+    [
+        (True, '{"vote": "玩家D"}', "玩家B", 1, 1),
+        (True, "我投玩家C", "玩家C", 1, 0),
+        (True, "不知道", "玩家B", 1, 1),
+        (False, "我投玩家C", "玩家C", 0, 0),
+        (False, "不知道", "玩家B", 1, 1),
+    ],
+)
+def test_vote_parse_failures_are_counted(
+    structured: bool, reply: str, vote: str, failures: int, fallbacks: int
+) -> None:
+    metrics = MetricsRegistry()
+    player = AIPlayer(
+        "玩家A",
+        "苹果",
+        False,
+        llm=OpenAIStyleLLM(reply),
+        sink=NullSink(),
+        metrics=metrics,
+    )
+    player.structured_votes = structured
+
+    # JSON 解析失败时再从文本里找名字，都找不到才投给第一个可选玩家
+    assert player.vote(["玩家B", "玩家C"], {"玩家B": ["水果"]}) == vote
+    mode = "structured" if structured else "text"
+    labels = (("mode", mode), ("player", "玩家A"))
+    counters = metrics.counters
+    assert counters.get("vote_parse_failures_total", {}).get(labels, 0) == failures
+    assert counters.get("vote_fallbacks_total", {}).get(labels, 0) == fallbacks
+
+
+def test_mock_server_usage_for_describe_and_vote() -> None:
+    from langchain_openai import ChatOpenAI
+
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    metrics = MetricsRegistry()
+    try:
+        host, port = server.server_address[:2]
+        llm = ChatOpenAI(
+            api_key="mock",
+            base_url=f"http://{host}:{port}/v1",
+            model="mock",
+            streaming=True,
+            stream_usage=True,
+            max_retries=0,
+        )
+        player = AIPlayer(
+            "玩家A", "苹果", False, llm=llm, sink=NullSink(), metrics=metrics
+        )
+        player.describe(1, {})
+        player.describe(2, {"玩家A": player.descriptions})
+        player.vote(["玩家B", "玩家C"], {"玩家A": player.descriptions})
+        player.structured_votes = True
+        player.vote(["玩家B", "玩家C"], {"玩家A": player.descriptions})
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # 描述由服务端的 stop 结束，读到最后的 usage；投票在名字处提前关闭，用量未知
+    assert [phase for phase, *_ in player.prompt_usage] == ["describe", "describe"]
+    assert all(tokens > 0 for _, _, tokens, _ in player.prompt_usage)
+    assert metrics.counters["llm_usage_unknown_total"] == {(("phase", "vote"),): 2}
+    # 服务端模拟前缀缓存: 第二次描述与第一次共享玩家身份前缀
+    assert player.prompt_usage[0][3] == 0
+    assert player.prompt_usage[1][3] > 0
@@ -0,0 +1,76 @@
+"""Transcript 的增量历史和 HistoryPolicy 的折叠"""
+
+from __future__ import annotations
+
+from undercover_game.prompts import HistoryPolicy, Transcript
+
+ROUNDS = {
+    "玩家A": ["红色的", "很甜", "长在树上"],
+    "玩家B": ["圆形的", "可以榨汁", "秋天成熟"],
+}
+
+
+def _upto(rounds: int) -> dict[str, list[str]]:
+    return {name: descs[:rounds] for name, descs in ROUNDS.items()}
+
+
+def test_incremental_sync_matches_full_rebuild() -> None:
+    transcript = Transcript()
+    for rounds in range(1, 4):
+        text = transcript.sync(_upto(rounds))
+    assert text == Transcript().sync(ROUNDS)
+    # 同一轮里按座位顺序，之后才是下一轮
+    assert text.splitlines()[:3] == [
+        "第1轮 玩家A: 红色的",
+        "第1轮 玩家B: 圆形的",
+        "第2轮 玩家A: 很甜",
+    ]
+
+    # 描述数没有变化时直接返回缓存的文本
+    assert transcript.sync(ROUNDS) is text
+
+
+def test_sync_handles_players_added_and_reordered() -> None:
+    transcript = Transcript()
+    transcript.sync({"玩家A": ["红色的"]})
+    transcript.sync({"玩家A": ["红色的"], "玩家B": ["圆形的"]})
+    text = transcript.sync({"玩家B": ["圆形的", "可以榨汁"], "玩家A": ["红色的"]})
+    assert text == "第1轮 玩家A: 红色的\n第1轮 玩家B: 圆形的\n第2轮 玩家B: 可以榨汁\n"
+
+
+def test_policy_folds_old_rounds_into_summaries() -> None:
+    calls: list[tuple[str, list[str]]] = []
+
+    def summarize(name: str, descriptions: list[str]) -> str:
+        calls.append((name, list(descriptions)))
+        return "/".join(descriptions)
+
+    transcript = Transcript(HistoryPolicy(recent_rounds=1, summarize=summarize))
+    assert transcript.sync(_upto(1)) == "第1轮 玩家A: 红色的\n第1轮 玩家B: 圆形的\n"
+
+    transcript.sync(_upto(2))
+    text = transcript.sync(ROUNDS)
+    assert text == (
+        "第2轮及之前（摘要）:\n"
+        "玩家A: 红色的/很甜\n"
+        "玩家B: 圆形的/可以榨汁\n"
+        "第3轮 玩家A: 长在树上\n"
+        "第3轮 玩家B: 秋天成熟\n"
+    )
+    # 每次折叠只为有新描述被折叠的玩家生成一次摘要
+    assert sorted(calls) == [
+        ("玩家A", ["红色的"]),
+        ("玩家A", ["红色的", "很甜"]),
+        ("玩家B", ["圆形的"]),
+        ("玩家B", ["圆形的", "可以榨汁"]),
+    ]
+
+
+def test_default_summary_clips_descriptions() -> None:
+    transcript = Transcript(HistoryPolicy(recent_rounds=2))
+    long = {"玩家A": ["这是一句超过十六个字的很长很长的描述呀", "第二轮", "第三轮"]}
+    text = transcript.sync(long)
+    assert text.startswith(
+        "第1轮及之前（摘要）:\n玩家A: 这是一句超过十六个字的很长很长的\n"
+    )
+    assert text.endswith("第2轮 玩家A: 第二轮\n第3轮 玩家A: 第三轮\n")
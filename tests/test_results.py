@@ -0,0 +1,41 @@
+"""结果库: 延迟分桶在提交时写入汇总表，主持人的调用也记录在内"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.game import UndercoverGame
+from undercover_game.results import ResultStore
+from undercover_game.sinks import NullSink
+
+
+def test_latencies_include_moderator_calls(tmp_path: Path) -> None:
+    store = ResultStore(tmp_path / "results.sqlite")
+    calls = 0
+    for seed in range(3):
+        game = UndercoverGame(
+            5,
+            1,
+            llm=FakeLLM(),
+            sink=NullSink(),
+            seed=seed,
+            moderator_votes=True,
+            results=store,
+        )
+        game.run()
+        assert game.active_moderator is not None
+        calls += sum(len(agent.timings) for agent in game.agents.values())
+        calls += len(game.active_moderator.timings)
+
+    # 查询前先提交，内存中累加的分桶随之写入
+    percentiles = store.latency_percentiles()
+    assert sum(phase["count"] for phase in percentiles.values()) == calls
+    assert len(store) == 3
+    store.close()
+
+
+def test_no_moderator_without_moderator_votes() -> None:
+    game = UndercoverGame(5, 1, llm=FakeLLM(), sink=NullSink(), seed=1)
+    game.run()
+    assert game.active_moderator is None
@@ -0,0 +1,37 @@
+"""批量模拟: 多进程分片的直方图合并后，与单进程运行的统计一致"""
+
+from __future__ import annotations
+
+import pickle
+
+from undercover_game.metrics import MetricsRegistry
+from undercover_game.simulate import simulate
+
+
+def test_registry_round_trips_and_merges() -> None:
+    left = MetricsRegistry()
+    left.inc("calls_total", phase="vote")
+    left.observe("latency_seconds", 0.1, phase="vote")
+    right = pickle.loads(pickle.dumps(left))
+    right.inc("calls_total", phase="vote")
+    right.observe("latency_seconds", 0.3, phase="describe")
+
+    left.merge(right)
+    assert left.counters["calls_total"] == {(("phase", "vote"),): 3}
+    merged = left.merged("latency_seconds", ())[()]
+    assert merged.count == 3
+
+
+def test_sharded_run_matches_single_process() -> None:
+    single = simulate(12, workers=1, seed=3)
+    sharded = simulate(12, workers=2, seed=3)
+
+    assert sharded.wins == single.wins
+    assert sharded.rounds == single.rounds
+    assert sharded.game_latency["count"] == 12
+    assert set(sharded.call_latency) == {"describe", "vote"}
+    for phase, stats in single.call_latency.items():
+        for metric in ("ttft", "total"):
+            assert (
+                sharded.call_latency[phase][metric]["count"] == stats[metric]["count"]
+            )
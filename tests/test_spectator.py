@@ -0,0 +1,150 @@
+"""观战服务: 观众掉队时的丢弃和合并，新观众的回放，WebSocket 关闭握手"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+from undercover_game.spectator import BroadcastSink, make_server
+
+
+def _token(player: str, text: str) -> dict[str, str]:
+    return {"player": player, "phase": "describe", "text": text}
+
+
+def _events(messages: list[bytes]) -> list[tuple[str, str]]:
+    decoded = [json.loads(message) for message in messages]
+    return [
+        (e["event"], e.get("text") or e.get("line") or str(e.get("count", "")))
+        for e in decoded
+    ]
+
+
+def test_slow_viewer_loses_oldest_tokens_and_gets_them_coalesced() -> None:
+    sink = BroadcastSink(maxsize=2)
+    subscriber = sink.subscribe()
+    sink.emit("log", line="开始")
+    for text in ("红", "色", "的", "水果"):
+        sink.emit("token", **_token("玩家1", text))
+    sink.emit("log", line="结束")
+
+    # token 日志只保留最近 2 条，其他事件都还在；相邻的 token 合并成一条
+    assert _events(subscriber.get(0)) == [
+        ("dropped", "2"),
+        ("log", "开始"),
+        ("token", "的水果"),
+        ("log", "结束"),
+    ]
+    assert (subscriber.dropped, subscriber.coalesced) == (2, 1)
+    assert subscriber.get(0) == []
+
+
+def test_full_log_without_tokens_drops_oldest_event() -> None:
+    sink = BroadcastSink(maxsize=2)
+    subscriber = sink.subscribe()
+    for line in ("一", "二", "三"):
+        sink.emit("log", line=line)
+    assert _events(subscriber.get(0)) == [
+        ("dropped", "1"),
+        ("log", "二"),
+        ("log", "三"),
+    ]
+
+
+def test_new_viewer_replays_current_game_without_tokens() -> None:
+    sink = BroadcastSink()
+    first = sink.subscribe()
+    sink.emit("game_start", game=1)
+    sink.emit("log", line="第一局")
+    sink.emit("game_start", game=2)
+    sink.emit("token", **_token("玩家1", "红色"))
+    sink.emit("log", line="第二局")
+
+    late = sink.subscribe()
+    assert _events(late.get(0)) == [("game_start", ""), ("log", "第二局")]
+    assert len(first) == 5
+    seqs = [json.loads(m)["seq"] for m in first.get(0)]
+    assert seqs == [1, 2, 3, 4, 5]
+
+
+def test_waiting_viewer_wakes_on_emit_and_close() -> None:
+    sink = BroadcastSink()
+    subscriber = sink.subscribe()
+    results: list[list[bytes] | None] = []
+
+    def read() -> None:
+        results.append(subscriber.get(5))
+        results.append(subscriber.get(5))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    time.sleep(0.05)
+    sink.emit("log", line="开始")
+    deadline = time.monotonic() + 5
+    while not results and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.close()
+    reader.join(5)
+
+    assert _events(results[0]) == [("log", "开始")]
+    assert results[1] is None
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def test_websocket_close_handshake() -> None:
+    sink = BroadcastSink()
+    server = make_server(sink, port=0, heartbeat=0.05)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sock = socket.create_connection(server.server_address[:2], timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall(
+            (
+                "GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            ).encode()
+        )
+        response = b""
+        while b"\r\n\r\n" not in response:
+            response += sock.recv(1024)
+        assert response.startswith(b"HTTP/1.1 101")
+
+        # 客户端的关闭帧带掩码，状态码 1000
+        mask = os.urandom(4)
+        payload = struct.pack("!H", 1000)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        sock.sendall(bytes([0x88, 0x80 | len(payload)]) + mask + masked)
+
+        # 跳过心跳 ping，直到收到服务端回应的关闭帧，之后连接关闭
+        while True:
+            first, length = _recv_exact(sock, 2)
+            body = _recv_exact(sock, length)
+            if first & 0x0F == 0x8:
+                break
+        assert body == payload
+        assert sock.recv(1) == b""
+        sock.close()
+
+        deadline = time.monotonic() + 5
+        while sink.subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sink.subscribers == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        sink.close()
@@ -0,0 +1,58 @@
+"""锦标赛: 拒绝主持人模式；某局出错时取消其余对局"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+
+from undercover_game.fake_llm import FakeLLM
+from undercover_game.tournament import PlayerConfig, Tournament
+
+
+class BrokenLLM(FakeLLM):
+    async def astream(self, prompt: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        raise RuntimeError("服务不可用")
+        yield
+
+
+def test_moderator_votes_rejected() -> None:
+    configs = [PlayerConfig("a", llm=FakeLLM()), PlayerConfig("b", llm=FakeLLM())]
+    with pytest.raises(ValueError, match="moderator_votes"):
+        Tournament(configs, moderator_votes=True)
+
+
+def test_failed_game_cancels_running_games() -> None:
+    configs = [
+        PlayerConfig("bot", "heuristic"),
+        PlayerConfig("broken", llm=BrokenLLM(ttft=0.0)),
+        PlayerConfig("slow", llm=FakeLLM(ttft=10.0)),
+    ]
+    tournament = Tournament(configs, max_concurrent_games=3)
+
+    async def run() -> set[asyncio.Task]:
+        with pytest.raises(RuntimeError, match="服务不可用"):
+            await tournament.arun()
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    # 慢的对局要 10 秒才会有第一个 token，出错后应立即被取消，而不是等它下完
+    start = time.perf_counter()
+    assert asyncio.run(run()) == set()
+    assert time.perf_counter() - start < 5
+
+
+def test_budget_holds_with_several_undercover() -> None:
+    # 卧底多于 1 名时平民也会被淘汰，对局可能进行到 num_players - 2 轮
+    configs = [PlayerConfig("a", llm=FakeLLM()), PlayerConfig("b", llm=FakeLLM())]
+    tournament = Tournament(
+        configs, num_players=7, num_undercover=2, budget=200, max_concurrent_games=2
+    )
+    report = tournament.run()
+
+    assert report.games > 0
+    assert report.requests <= 200
+    for pairing in report.pairings:
+        assert pairing.requests <= pairing.games * tournament.max_requests(pairing, 0)
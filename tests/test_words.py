@@ -0,0 +1,81 @@
+"""词语对语料库的生成和读取，语料库和不重复抽样器传给工作进程"""
+
+from __future__ import annotations
+
+import pickle
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from undercover_game.words import WindowSampler, WordCorpus, build_corpus, read_tsv
+
+ROWS = [
+    ("苹果", "梨", "食物", 1),
+    ("篮球", "足球", "运动", 2),
+    ("咖啡", "奶茶", "食物", 2),
+    ("钢琴", "吉他", "乐器", 1),
+    ("饺子", "馄饨", "食物", 1),
+]
+
+
+@pytest.fixture
+def corpus(tmp_path: Path) -> Iterator[WordCorpus]:
+    path = tmp_path / "pairs.wpc"
+    build_corpus(path, ROWS)
+    corpus = WordCorpus(path)
+    yield corpus
+    corpus.close()
+
+
+def test_corpus_and_views_pickle(corpus: WordCorpus) -> None:
+    assert list(pickle.loads(pickle.dumps(corpus))) == list(corpus)
+
+    view = corpus.select(category="食物", difficulty=1)
+    assert list(pickle.loads(pickle.dumps(view))) == [("苹果", "梨"), ("饺子", "馄饨")]
+    view = corpus.select(difficulty=2)
+    assert list(pickle.loads(pickle.dumps(view))) == list(view)
+
+
+def test_shard_pickle_keeps_position(corpus: WordCorpus) -> None:
+    sampler = WindowSampler(corpus.select(category="食物"), seed=2).shard(1, 2)
+    sampler.draw()
+    copy = pickle.loads(pickle.dumps(sampler))
+
+    assert [copy.draw() for _ in range(3)] == [sampler.draw() for _ in range(3)]
+
+
+def test_unsharded_copy_refuses_to_draw(corpus: WordCorpus) -> None:
+    # 直接复制到几个工作进程的抽样器会抽到相同的序列，必须先 shard
+    sampler = WindowSampler(corpus, seed=2)
+    copy = pickle.loads(pickle.dumps(sampler))
+    with pytest.raises(RuntimeError, match="shard"):
+        copy.draw()
+    assert [copy.pair(k) for k in range(5)] == [sampler.draw() for _ in range(5)]
+
+
+def test_tsv_corpus_round_trip(tmp_path: Path) -> None:
+    tsv = tmp_path / "pairs.tsv"
+    tsv.write_text(
+        "苹果\t梨\t食物\t1\n"
+        "\n"
+        "只有一列\n"
+        "哈密瓜\t西瓜\t食物\t3\n"
+        "老虎\t狮子\n"
+        "篮球\t足球\t运动\t\n",
+        encoding="utf-8",
+    )
+    path = tmp_path / "pairs.wpc"
+    rows = list(read_tsv(tsv))
+    assert build_corpus(path, rows) == 4
+
+    corpus = WordCorpus(path)
+    try:
+        assert list(corpus) == [
+            (civilian, undercover) for civilian, undercover, *_ in rows
+        ]
+        assert list(corpus.select(category="未分类")) == [("老虎", "狮子")]
+        assert list(corpus.select(difficulty=3)) == [("哈密瓜", "西瓜")]
+        assert list(corpus.select(category="运动", difficulty=1)) == [("篮球", "足球")]
+    finally:
+        corpus.close()
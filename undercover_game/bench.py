@@ -0,0 +1,662 @@
+"""
+谁是卧底引擎基准测试
+
+全部使用离线的假 LLM，测量的是游戏引擎本身的开销。
+
+运行: uv run python -m undercover_game.bench long_game
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import zlib
+from typing import Any, Literal
+
+from .fake_llm import FakeLLM, PrefixCache, prompt_text
+from .game import (
+    GameState,
+    PlayerRecord,
+    UndercoverGame,
+    build_graph,
+    compiled_graph,
+)
+from .metrics import MetricsRegistry
+from .players import player_name
+from .prompts import HistoryPolicy
+from .sinks import NullSink
+
+
+class FirstChoiceLLM(FakeLLM):
+    """总是投给第一个可选玩家的假 LLM，让淘汰顺序固定"""
+
+    def reply(self, prompt: Any) -> str:
+        text = prompt_text(prompt)
+        if "可选玩家: " in text:
+            options = text.rsplit("可选玩家: ", 1)[1].split("\n", 1)[0]
+            return options.split(", ", 1)[0]
+        return "描述"
+
+
+class _EvasiveLLM(FakeLLM):
+    """自由文本投票时有时不给出玩家名的假 LLM；结构化输出由服务端约束，总是合法"""
+
+    def reply(self, prompt: Any) -> str:
+        text = prompt_text(prompt)
+        if "可选玩家: " in text and zlib.crc32(text.encode("utf-8")) % 5 == 0:
+            return "我觉得每个人都有可能，很难判断。"
+        return super().reply(prompt)
+
+
+class _LongGame(UndercoverGame):
+    """卧底固定在最后一个座位、并记录每轮耗时的对局"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.round_marks: list[tuple[int, float]] = []
+        # 只跑前几轮，None 表示跑完
+        self.max_rounds: int | None = None
+
+    def create_players(self) -> tuple[tuple[str, str], list[PlayerRecord]]:
+        last = self.num_players - self.num_undercover
+        return ("词", "词"), [
+            PlayerRecord(player_name(i), i >= last) for i in range(self.num_players)
+        ]
+
+    def _should_continue(self, state: GameState) -> Literal["continue", "end"]:
+        if self.max_rounds is not None and state["round_num"] >= self.max_rounds:
+            return "end"
+        return super()._should_continue(state)
+
+    def _describe_phase(self, state: GameState) -> dict:
+        alive = sum(1 for p in state["players"] if p.alive)
+        self.round_marks.append((alive, time.perf_counter()))
+        return super()._describe_phase(state)
+
+
+def bench_long_game(num_players: int = 26, repeat: int = 20) -> None:
+    """
+    长对局：卧底总在最后，每轮淘汰一名平民，直到剩 2 人。
+
+    输出每轮耗时和每次 LLM 调用分摊的引擎开销；每轮开销应保持平稳，
+    不随已进行轮数（日志和描述的长度）增长。
+    """
+    per_round: dict[int, list[float]] = {}
+    alive_by_round: dict[int, int] = {}
+    for _ in range(repeat):
+        game = _LongGame(num_players, 1, llm=FirstChoiceLLM(), sink=NullSink())
+        game.run()
+        marks = game.round_marks + [(0, time.perf_counter())]
+        for i, ((alive, start), (_, end)) in enumerate(zip(marks, marks[1:]), 1):
+            per_round.setdefault(i, []).append(end - start)
+            alive_by_round[i] = alive
+
+    rows = [
+        (round_num, alive_by_round[round_num], sorted(samples)[len(samples) // 2])
+        for round_num, samples in per_round.items()
+    ]
+    # 每轮耗时 ≈ 固定开销 + 存活人数 × 单人开销；用最小二乘拟合后看残差，
+    # 残差不随轮数上升即说明状态维护的开销与历史长度无关
+    n = len(rows)
+    mean_x = sum(alive for _, alive, _ in rows) / n
+    mean_y = sum(median for _, _, median in rows) / n
+    var_x = sum((alive - mean_x) ** 2 for _, alive, _ in rows)
+    slope = (
+        sum((alive - mean_x) * (median - mean_y) for _, alive, median in rows) / var_x
+        if var_x
+        else 0.0
+    )
+    fixed = mean_y - slope * mean_x
+
+    print(f"长对局: {num_players} 名玩家, 重复 {repeat} 次 (取中位数)")
+    print(f"拟合: 每轮 {fixed * 1000:.3f}ms + 每名存活玩家 {slope * 1000:.3f}ms")
+    print(f"{'轮':>4} {'存活':>4} {'每轮ms':>8} {'残差ms':>8}")
+    for round_num, alive, median in rows:
+        residual = median - (fixed + slope * alive)
+        print(
+            f"{round_num:>4} {alive:>4} {median * 1000:>8.2f} {residual * 1000:>+8.2f}"
+        )
+
+
+def bench_prompt_cache(num_players: int = 12) -> None:
+    """
+    提示词前缀缓存命中率：用模拟前缀缓存的假 LLM 跑一局长对局，
+    按轮统计提示词 token 数和命中缓存的 token 数。
+    """
+    llm = FirstChoiceLLM(prefix_cache=PrefixCache())
+    game = _LongGame(num_players, 1, llm=llm, sink=NullSink())
+    game.run()
+
+    by_round: dict[int, list[int]] = {}
+    for player in game.agents.values():
+        for _, round_num, prompt_tokens, cached_tokens in player.prompt_usage:
+            totals = by_round.setdefault(round_num, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += cached_tokens
+
+    print(f"前缀缓存: {num_players} 名玩家, 块大小 {llm.prefix_cache.block_size}")
+    print(f"{'轮':>4} {'调用':>4} {'提示词tok':>10} {'缓存tok':>8} {'命中率':>7}")
+    all_prompt = all_cached = 0
+    for round_num, (calls, prompt_tokens, cached_tokens) in sorted(by_round.items()):
+        all_prompt += prompt_tokens
+        all_cached += cached_tokens
+        print(
+            f"{round_num:>4} {calls:>4} {prompt_tokens:>10} {cached_tokens:>8} "
+            f"{cached_tokens / prompt_tokens:>7.1%}"
+        )
+    print(f"合计: {all_cached}/{all_prompt} = {all_cached / all_prompt:.1%}")
+
+
+def bench_setup(num_players: int = 5, repeat: int = 300) -> None:
+    """
+    每局的准备开销：构建并编译状态图 + create_players。
+
+    对比每局重新编译（原来的做法）和复用 compiled_graph() 的缓存。
+    """
+    llm = FirstChoiceLLM()
+    sink = NullSink()
+
+    def setup(compile_each_game: bool) -> float:
+        start = time.perf_counter()
+        game = UndercoverGame(num_players, 1, llm=llm, sink=sink)
+        if compile_each_game:
+            build_graph().compile()
+            build_graph(use_async=True).compile()
+        else:
+            compiled_graph()
+            compiled_graph(use_async=True)
+        game.create_players()
+        return time.perf_counter() - start
+
+    print(f"每局准备开销: {num_players} 名玩家, 重复 {repeat} 次")
+    print(f"{'方式':<10} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, compile_each_game in (("每局编译", True), ("复用缓存", False)):
+        # 预热: 导入、首次编译
+        for _ in range(10):
+            setup(compile_each_game)
+        samples = sorted(setup(compile_each_game) for _ in range(repeat))
+        p50 = samples[len(samples) // 2] * 1000
+        p95 = samples[int(len(samples) * 0.95)] * 1000
+        print(f"{label:<10} {p50:>8.3f} {p95:>8.3f}")
+
+
+def bench_checkpoint(num_players: int = 8, repeat: int = 30) -> None:
+    """
+    检查点写入开销：同样的对局分别不保存、保存到内存和 SQLite，
+    按 durability 对比每个节点分摊的额外耗时。
+    """
+    import tempfile
+    from pathlib import Path
+
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from .checkpoints import sqlite_checkpointer
+
+    llm = FakeLLM()
+    sink = NullSink()
+    tmp = tempfile.TemporaryDirectory()
+
+    def run_games(checkpointer: Any, durability: Any) -> tuple[float, int]:
+        nodes = 0
+        start = time.perf_counter()
+        for i in range(repeat):
+            game = UndercoverGame(num_players, 2, llm=llm, sink=sink, seed=i)
+            if checkpointer is None:
+                result = game.run()
+            else:
+                result = game.run(
+                    checkpointer=checkpointer,
+                    thread_id=f"{durability}-{i}",
+                    durability=durability,
+                )
+            # 每轮 describe / vote / eliminate，最后 check_winner
+            nodes += result["round_num"] * 3 + 1
+        return time.perf_counter() - start, nodes
+
+    sqlite_path = Path(tmp.name) / "bench.sqlite"
+    cases = [
+        ("不保存", None, None),
+        ("内存 sync", InMemorySaver(), "sync"),
+        ("SQLite sync", sqlite_checkpointer(sqlite_path), "sync"),
+        ("SQLite async", sqlite_checkpointer(sqlite_path), "async"),
+        ("SQLite exit", sqlite_checkpointer(sqlite_path), "exit"),
+    ]
+    run_games(None, None)  # 预热
+    baseline = None
+    print(f"检查点开销: {num_players} 名玩家, {repeat} 局")
+    print(f"{'方式':<14} {'每局ms':>8} {'每节点额外ms':>12}")
+    for label, checkpointer, durability in cases:
+        elapsed, nodes = run_games(checkpointer, durability)
+        if baseline is None:
+            baseline = elapsed
+        extra = (elapsed - baseline) / nodes * 1000
+        print(f"{label:<14} {elapsed / repeat * 1000:>8.2f} {extra:>12.3f}")
+    tmp.cleanup()
+
+
+def bench_moderator(num_players: int = 8, repeat: int = 5) -> None:
+    """
+    主持人投票模式：同样的对局分别逐个投票和由主持人一次投票，
+    对比投票阶段的请求数、耗时和提示词 token 数；chatter 模拟回复不合法时的退回率。
+    """
+    sink = NullSink()
+    cases = [
+        ("逐个投票", False, False),
+        ("主持人", True, False),
+        ("主持人+啰嗦", True, True),
+    ]
+    print(f"主持人投票: {num_players} 名玩家, {repeat} 局")
+    print(
+        f"{'方式':<10} {'请求':>5} {'投票耗时s':>9} {'提示词tok':>10} "
+        f"{'未缓存tok':>10} {'退回票':>6}"
+    )
+    for label, moderator_votes, chatter in cases:
+        calls = prompt_tokens = uncached = 0
+        elapsed = 0.0
+        fallbacks = 0.0
+        for i in range(repeat):
+            llm = FakeLLM(
+                ttft=0.01,
+                token_delay=0.001,
+                prefix_cache=PrefixCache(),
+                chatter=chatter,
+            )
+            game = UndercoverGame(
+                num_players,
+                2,
+                llm=llm,
+                sink=sink,
+                seed=i,
+                moderator_votes=moderator_votes,
+            )
+            game.run()
+            voters = list(game.agents.values())
+            if game.active_moderator is not None:
+                voters.append(game.active_moderator)
+            for player in voters:
+                for phase, _, total in player.timings:
+                    if phase.startswith("vote"):
+                        calls += 1
+                        elapsed += total
+                for phase, _, tokens, cached in player.prompt_usage:
+                    if phase.startswith("vote"):
+                        prompt_tokens += tokens
+                        uncached += tokens - cached
+            fallbacks += sum(
+                game.metrics.counters.get("vote_batch_fallbacks_total", {}).values()
+            )
+        print(
+            f"{label:<10} {calls / repeat:>5.1f} {elapsed / repeat:>9.3f} "
+            f"{prompt_tokens / repeat:>10.0f} {uncached / repeat:>10.0f} "
+            f"{fallbacks / repeat:>6.1f}"
+        )
+
+
+def bench_structured_votes(num_players: int = 8, repeat: int = 20) -> None:
+    """
+    结构化投票：同样的对局分别用自由文本和 JSON Schema 投票，
+    对比每票输出 token 数、解析失败和退回（默认投给第一个可选玩家）的次数。
+    """
+    sink = NullSink()
+    print(f"结构化投票: {num_players} 名玩家, {repeat} 局")
+    print(f"{'方式':<6} {'票数':>6} {'输出tok/票':>10} {'解析失败':>8} {'退回':>6}")
+    for label, structured_votes in (("文本", False), ("结构化", True)):
+        metrics = MetricsRegistry()
+        for i in range(repeat):
+            game = UndercoverGame(
+                num_players,
+                2,
+                llm=_EvasiveLLM(prefix_cache=PrefixCache()),
+                sink=sink,
+                seed=i,
+                metrics=metrics,
+                structured_votes=structured_votes,
+            )
+            game.run()
+        votes = tokens = 0.0
+        for labels, value in metrics.counters["llm_calls_total"].items():
+            votes += value if ("phase", "vote") in labels else 0
+        for labels, value in metrics.counters["llm_output_tokens_total"].items():
+            tokens += value if ("phase", "vote") in labels else 0
+        failures = sum(metrics.counters.get("vote_parse_failures_total", {}).values())
+        fallbacks = sum(metrics.counters.get("vote_fallbacks_total", {}).values())
+        print(
+            f"{label:<6} {votes:>6.0f} {tokens / votes:>10.1f} "
+            f"{failures:>8.0f} {fallbacks:>6.0f}"
+        )
+
+
+def bench_scale(
+    sizes: tuple[int, ...] = (26, 52, 104, 208, 416), rounds: int = 4
+) -> None:
+    """
+    大房间：玩家数逐级翻倍，每种人数只跑前几轮，统计每轮引擎耗时和每次调用分摊的耗时。
+
+    每次调用的耗时应基本不随人数增长；随人数线性增长说明某个阶段是 O(n²)。
+    """
+    print(f"大房间: 每种人数跑 {rounds} 轮 (取第 2 轮起的中位数)")
+    print(f"{'人数':>6} {'每轮ms':>9} {'每次调用us':>11}")
+    for num_players in sizes:
+        game = _LongGame(num_players, 1, llm=FirstChoiceLLM(), sink=NullSink())
+        game.max_rounds = rounds
+        game.run()
+        marks = [start for _, start in game.round_marks] + [time.perf_counter()]
+        per_round = sorted(end - start for start, end in zip(marks[1:], marks[2:]))
+        median = per_round[len(per_round) // 2]
+        # 每轮每个存活玩家描述和投票各一次
+        per_call = median / (2 * num_players)
+        print(f"{num_players:>6} {median * 1000:>9.1f} {per_call * 1e6:>11.0f}")
+
+
+def bench_corpus(
+    sizes: tuple[int, ...] = (10_000, 300_000), samples: int = 1000
+) -> None:
+    """
+    词库：生成不同大小的合成语料库，对比打开耗时、抽样耗时和打开后的内存增长。
+
+    打开和抽样的开销、Python 堆的增长都应与语料库大小无关；常驻内存中另有
+    被读到的映射页（文件页缓存，可回收），随机抽样时最多为抽样次数对应的页数。
+    """
+    import random
+    import tempfile
+    import tracemalloc
+    from pathlib import Path
+
+    from .words import WindowSampler, WordCorpus, build_corpus
+
+    def resident_kb() -> int:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * 4
+
+    tmp = tempfile.TemporaryDirectory()
+    rng = random.Random(0)
+    print(f"词库: 每种大小抽样 {samples} 次")
+    print(
+        f"{'词语对':>8} {'文件MB':>7} {'打开us':>7} {'抽样us':>7} "
+        f"{'筛选抽样us':>10} {'不重复us':>8} {'堆KB':>6} {'映射页KB':>8}"
+    )
+    for size in sizes:
+        path = Path(tmp.name) / f"{size}.wpc"
+        build_corpus(
+            path,
+            ((f"词{i}甲", f"词{i}乙", f"类别{i % 20}", 1 + i % 3) for i in range(size)),
+        )
+        before = resident_kb()
+        start = time.perf_counter()
+        corpus = WordCorpus(path)
+        len(corpus)
+        opened = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(samples):
+            rng.choice(corpus)
+        sample = (time.perf_counter() - start) / samples
+
+        view = corpus.select(category="类别3", difficulty=2)
+        start = time.perf_counter()
+        for _ in range(samples):
+            rng.choice(view)
+        filtered = (time.perf_counter() - start) / samples
+
+        sampler = WindowSampler(corpus, seed=1)
+        start = time.perf_counter()
+        drawn = {sampler.draw() for _ in range(samples)}
+        window = (time.perf_counter() - start) / samples
+        assert len(drawn) == samples
+
+        resident = resident_kb() - before
+        corpus.close()
+
+        # 另开一个实例单独统计 Python 堆（tracemalloc 会拖慢上面的计时）
+        tracemalloc.start()
+        corpus = WordCorpus(path)
+        for _ in range(samples):
+            rng.choice(corpus)
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(
+            f"{size:>8} {path.stat().st_size / 1e6:>7.1f} {opened * 1e6:>7.0f} "
+            f"{sample * 1e6:>7.2f} {filtered * 1e6:>10.2f} {window * 1e6:>8.2f} "
+            f"{heap / 1024:>6.0f} {resident:>8}"
+        )
+        corpus.close()
+    tmp.cleanup()
+
+
+def bench_history(num_players: int = 24, recent_rounds: int = 2) -> None:
+    """
+    有界历史：同一局长对局分别保留全部历史和使用 HistoryPolicy，
+    按轮统计每次调用的平均提示词 token 数和未命中缓存的 token 数。
+    """
+    max_prompt_tokens = 400 + 40 * num_players
+    policies = {
+        "全部历史": None,
+        "有界历史": HistoryPolicy(recent_rounds, max_prompt_tokens),
+    }
+    by_policy: dict[str, dict[int, list[int]]] = {}
+    for label, policy in policies.items():
+        llm = FirstChoiceLLM(prefix_cache=PrefixCache())
+        game = _LongGame(num_players, 1, llm=llm, sink=NullSink(), history=policy)
+        game.run()
+        by_round = by_policy[label] = {}
+        for player in game.agents.values():
+            for _, round_num, prompt_tokens, cached_tokens in player.prompt_usage:
+                totals = by_round.setdefault(round_num, [0, 0, 0])
+                totals[0] += 1
+                totals[1] += prompt_tokens
+                totals[2] += prompt_tokens - cached_tokens
+
+    print(
+        f"有界历史: {num_players} 名玩家, 保留最近 {recent_rounds} 轮, "
+        f"上限 {max_prompt_tokens} tok"
+    )
+    print(
+        f"{'轮':>4} " + " ".join(f"{label + '(提示/未缓存)':>22}" for label in policies)
+    )
+    for round_num in sorted(by_policy["全部历史"]):
+        cells = []
+        for label in policies:
+            calls, prompt_tokens, uncached = by_policy[label][round_num]
+            cells.append(f"{prompt_tokens / calls:>12.0f}/{uncached / calls:<9.0f}")
+        print(f"{round_num:>4} " + " ".join(cells))
+
+
+def bench_bots(num_players: int = 8, num_undercover: int = 2, games: int = 200) -> None:
+    """
+    启发式玩家：全部启发式、启发式与 LLM 玩家混合、全部 LLM 玩家（假 LLM）三种对局，
+    分别经过状态图（run）和直接调用各阶段（run_direct）运行，
+    输出每秒轮数、玩家调用占总耗时的比例和卧底胜率。
+    """
+    llm = FakeLLM()
+    sink = NullSink()
+    bots = ["heuristic"] * num_players
+    configs = {
+        "全部启发式": bots,
+        "混合(1 LLM)": bots[1:] + ["ai"],
+        "全部 LLM": ["ai"] * num_players,
+    }
+    print(f"启发式玩家: {num_players} 名玩家 ({num_undercover} 卧底), 每种 {games} 局")
+    print(
+        f"{'对局':<12} {'运行方式':<10} {'轮/秒':>8} {'ms/轮':>7} {'调用us':>8} "
+        f"{'调用占比':>8} {'卧底胜率':>8}"
+    )
+    for label, kinds in configs.items():
+        for method in ("run", "run_direct"):
+            # 预热: 导入 numpy、编译状态图
+            getattr(
+                UndercoverGame(
+                    num_players, num_undercover, llm=llm, sink=sink, kinds=kinds
+                ),
+                method,
+            )()
+            rounds = calls = undercover_wins = 0
+            call_seconds = 0.0
+            start = time.perf_counter()
+            for seed in range(games):
+                game = UndercoverGame(
+                    num_players,
+                    num_undercover,
+                    llm=llm,
+                    sink=sink,
+                    seed=seed,
+                    kinds=kinds,
+                )
+                state = getattr(game, method)()
+                rounds += state["round_num"]
+                undercover_wins += state["winner"] == "卧底"
+                for player in game.agents.values():
+                    calls += len(player.timings)
+                    call_seconds += sum(total for _, _, total in player.timings)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<12} {method:<10} {rounds / elapsed:>8.0f} "
+                f"{elapsed / rounds * 1000:>7.2f} {call_seconds / calls * 1e6:>8.1f} "
+                f"{call_seconds / elapsed:>8.1%} {undercover_wins / games:>8.1%}"
+            )
+
+
+def bench_results(
+    num_players: int = 6, games: int = 500, scale_to: int = 1_000_000
+) -> None:
+    """
+    结果库：先真实运行并写入 games 局（启发式玩家与假 LLM 混合），再在 SQLite 内
+    按倍数复制对局表、玩家表和延迟分桶到 scale_to 局，测量各个聚合查询的耗时。
+    """
+    import tempfile
+    from pathlib import Path
+
+    from .results import ResultStore
+
+    tmp = tempfile.TemporaryDirectory()
+    store = ResultStore(Path(tmp.name) / "results.sqlite")
+    llm = FakeLLM()
+    sink = NullSink()
+    kinds = ["heuristic", "ai"] * (num_players // 2) + ["ai"] * (num_players % 2)
+    start = time.perf_counter()
+    finished = []
+    for seed in range(games):
+        game = UndercoverGame(
+            num_players, 1, llm=llm, sink=sink, seed=seed, kinds=kinds
+        )
+        finished.append((game, game.run()))
+    baseline = time.perf_counter() - start
+    # 写入本身的开销: 单独计时 record（与 run 结束时调用的相同），包括批量提交
+    start = time.perf_counter()
+    for game, state in finished:
+        store.record(game, state)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    print(f"结果库: {num_players} 名玩家")
+    print(
+        f"写入 {games} 局: 每局 {elapsed / games * 1e6:.0f}us "
+        f"(对局本身 {baseline / games * 1000:.2f}ms)"
+    )
+
+    # 每次翻倍直到 scale_to 局: 编号整体平移，只复制聚合查询用到的表
+    conn = store._conn
+    count = games
+    while count < scale_to:
+        conn.execute(
+            "INSERT INTO games SELECT id + ?, finished, civilian_word, undercover_word, "
+            "num_players, num_undercover, rounds, winner, seconds FROM games",
+            (count,),
+        )
+        conn.execute(
+            "INSERT INTO players SELECT game_id + ?, seat, name, undercover, kind, "
+            "model, won, eliminated_round FROM players",
+            (count,),
+        )
+        conn.execute("UPDATE latency_buckets SET count = count * 2")
+        conn.commit()
+        count *= 2
+    size = Path(store.path).stat().st_size + Path(f"{store.path}-wal").stat().st_size
+
+    print(f"复制到 {len(store)} 局, 数据库 {size / 2**20:.0f}MiB")
+    print(f"{'查询':<22} {'ms':>8}")
+    queries = {
+        "win_rate_by_pair": store.win_rate_by_pair,
+        "win_rate_by_role": store.win_rate_by_role,
+        "win_rate_by_model": store.win_rate_by_model,
+        "latency_percentiles": store.latency_percentiles,
+    }
+    for label, query in queries.items():
+        start = time.perf_counter()
+        query()
+        print(f"{label:<22} {(time.perf_counter() - start) * 1000:>8.1f}")
+    store.close()
+    tmp.cleanup()
+
+
+def bench_spectator(num_players: int = 6, games: int = 100, clients: int = 100) -> None:
+    """
+    观战服务：同样的对局分别用 NullSink、没有观众的 BroadcastSink、clients 个
+    从不读取的观众运行，比较每局耗时；再单独测量观众全部卡住时一次 emit 的耗时。
+    """
+    from .spectator import BroadcastSink
+
+    llm = FakeLLM()
+
+    def play(sink: Any) -> float:
+        start = time.perf_counter()
+        for seed in range(games):
+            UndercoverGame(num_players, 1, llm=llm, sink=sink, seed=seed).run()
+        return (time.perf_counter() - start) / games
+
+    play(NullSink())  # 预热
+    print(f"观战服务: {num_players} 名玩家, 每种 {games} 局")
+    print(f"{'sink':<24} {'ms/局':>8} {'丢弃':>8} {'合并':>8} {'最大积压':>8}")
+    print(f"{'NullSink':<24} {play(NullSink()) * 1000:>8.2f}")
+    print(f"{'BroadcastSink(0 观众)':<24} {play(BroadcastSink()) * 1000:>8.2f}")
+    sink = BroadcastSink()
+    stalled = [sink.subscribe() for _ in range(clients)]
+    seconds = play(sink)
+    backlog = max(map(len, stalled))
+    # 卡住的观众最后取一次，丢弃和合并在取出时统计
+    for subscriber in stalled:
+        subscriber.get(0)
+    print(
+        f"{f'BroadcastSink({clients} 卡住)':<24} {seconds * 1000:>8.2f} "
+        f"{sum(s.dropped for s in stalled):>8} {sum(s.coalesced for s in stalled):>8} "
+        f"{backlog:>8}"
+    )
+
+    events = 10_000
+    for event, data in (
+        ("token", {"player": "玩家1", "phase": "describe", "text": "描述"}),
+        ("vote", {"voter": "玩家1", "target": "玩家2", "line": "玩家1 投票给 玩家2"}),
+    ):
+        start = time.perf_counter()
+        for _ in range(events):
+            sink.emit(event, **data)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{clients} 个观众全部卡住时 emit({event}): {elapsed / events * 1e6:.1f}us"
+        )
+
+
+BENCHMARKS = {
+    "bots": bench_bots,
+    "checkpoint": bench_checkpoint,
+    "corpus": bench_corpus,
+    "history": bench_history,
+    "long_game": bench_long_game,
+    "moderator": bench_moderator,
+    "prompt_cache": bench_prompt_cache,
+    "results": bench_results,
+    "scale": bench_scale,
+    "setup": bench_setup,
+    "spectator": bench_spectator,
+    "structured_votes": bench_structured_votes,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="谁是卧底引擎基准测试")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="基准名称")
+    args = parser.parse_args()
+    BENCHMARKS[args.name]()
+
+
+if __name__ == "__main__":
+    main()
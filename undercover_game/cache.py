@@ -0,0 +1,280 @@
+"""
+LLM 响应缓存
+
+把 (模型, 参数, 提示词) 相同的请求的流式回复保存在本地 SQLite 中，
+再次请求时按原来的 chunk 逐个回放，TTFT 统计和实时输出照常工作。
+适合回归测试和演示彩排：同样的种子和词语会产生同样的提示词。
+
+用法:
+    llm = CachedLLM(get_llm(), ResponseCache("llm_cache.sqlite"))
+    game = UndercoverGame(llm=llm)
+或设置环境变量 LLM_CACHE_PATH，get_llm() 会自动包上缓存。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import aclosing, closing
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import AIMessageChunk
+
+# 参与缓存键的模型参数
+_MODEL_PARAMS = ("temperature", "top_p", "max_tokens", "seed")
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的响应缓存，支持按条数、总字节数和存活时间淘汰。
+
+    Args:
+        path: 数据库文件路径
+        max_entries: 最多保留的条数，超出时淘汰最久未访问的
+        max_bytes: 回复内容的总字节数上限，超出时淘汰最久未访问的
+        max_age: 条目存活秒数，过期条目视为未命中并会被清理
+    """
+
+    # 每写入这么多条执行一次淘汰
+    EVICT_EVERY = 64
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        # 并发投票会在多个线程里访问同一个连接，由 _lock 串行化
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, params: dict[str, Any], prompt: Any) -> str:
+        """由模型、参数和提示词计算缓存键"""
+        if isinstance(prompt, str):
+            messages: Any = prompt
+        else:
+            messages = [[message.type, message.content] for message in prompt]
+        payload = json.dumps(
+            {"model": model, "params": params, "prompt": messages},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """读取缓存的回复 {"chunks": [...], "usage": ...}，未命中返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.max_age is not None and now - row[1] > self.max_age
+            ):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(
+        self, key: str, chunks: list[str], usage: dict | None, complete: bool
+    ) -> None:
+        """写入一条回复；complete 为 False 表示调用方提前结束了流"""
+        body = json.dumps({"chunks": chunks, "usage": usage}, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, len(body.encode("utf-8")), int(complete), now, now),
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def evict(self) -> None:
+        """立即按配置执行一次淘汰"""
+        with self._lock:
+            self._evict(time.time())
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        conn = self._conn
+        if self.max_age is not None:
+            conn.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.max_age,)
+            )
+        if self.max_entries is not None:
+            conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            # 按访问时间从新到旧累加大小，超过上限之后的全部删除
+            conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total
+                        FROM responses
+                    ) WHERE total > ?
+                )""",
+                (self.max_bytes,),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLLM:
+    """
+    给 LLM 包上响应缓存，接口与被包装的 LLM 的 stream / astream 相同。
+
+    未命中时边转发边记录 chunk；调用方提前关闭流（见 AIPlayer 的提前结束）时，
+    保存已收到的部分，同样的提示词和参数下回放结果与原调用一致。
+
+    Args:
+        llm: 被包装的 LLM
+        cache: 响应缓存
+        replay_delay: 回放时相邻 chunk 之间的等待秒数，默认 0 即全速回放
+    """
+
+    def __init__(
+        self, llm: Any, cache: ResponseCache, replay_delay: float = 0.0
+    ) -> None:
+        self.llm = llm
+        self.cache = cache
+        self.replay_delay = replay_delay
+
+    def __getattr__(self, name: str) -> Any:
+        # model_name 等属性透传给被包装的 LLM
+        return getattr(self.llm, name)
+
+    def _key(self, prompt: Any, kwargs: dict[str, Any]) -> str:
+        params = {
+            name: getattr(self.llm, name)
+            for name in _MODEL_PARAMS
+            if getattr(self.llm, name, None) is not None
+        }
+        params.update(kwargs)
+        model = str(getattr(self.llm, "model_name", None) or type(self.llm).__name__)
+        return self.cache.key(model, params, prompt)
+
+    @staticmethod
+    def _replay_chunks(cached: dict) -> list[AIMessageChunk]:
+        chunks = [AIMessageChunk(content=content) for content in cached["chunks"]]
+        if cached.get("usage") and chunks:
+            chunks[-1] = AIMessageChunk(
+                content=chunks[-1].content, usage_metadata=cached["usage"]
+            )
+        return chunks
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """同步流式输出，命中时回放缓存的 chunk"""
+        key = self._key(prompt, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            for i, chunk in enumerate(self._replay_chunks(cached)):
+                if i and self.replay_delay:
+                    time.sleep(self.replay_delay)
+                yield chunk
+            return
+
+        recorder = _Recorder()
+        try:
+            with closing(self.llm.stream(prompt, **kwargs)) as stream:
+                for chunk in stream:
+                    recorder.add(chunk)
+                    yield chunk
+            recorder.complete = True
+        except GeneratorExit:
+            recorder.closed = True
+            raise
+        finally:
+            recorder.save(self.cache, key)
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """异步流式输出，命中时回放缓存的 chunk"""
+        key = self._key(prompt, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            for i, chunk in enumerate(self._replay_chunks(cached)):
+                if i and self.replay_delay:
+                    await asyncio.sleep(self.replay_delay)
+                yield chunk
+            return
+
+        recorder = _Recorder()
+        try:
+            async with aclosing(self.llm.astream(prompt, **kwargs)) as stream:
+                async for chunk in stream:
+                    recorder.add(chunk)
+                    yield chunk
+            recorder.complete = True
+        except GeneratorExit:
+            recorder.closed = True
+            raise
+        finally:
+            recorder.save(self.cache, key)
+
+
+class _Recorder:
+    """未命中时记录转发的 chunk"""
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.usage: dict | None = None
+        self.complete = False
+        self.closed = False
+
+    def add(self, chunk: Any) -> None:
+        if chunk.content:
+            self.chunks.append(chunk.content)
+        if getattr(chunk, "usage_metadata", None):
+            self.usage = dict(chunk.usage_metadata)
+
+    def save(self, cache: ResponseCache, key: str) -> None:
+        # 上游出错时不缓存；正常结束或被调用方关闭时保存
+        if (self.complete or self.closed) and self.chunks:
+            cache.put(key, self.chunks, self.usage, self.complete)
@@ -0,0 +1,348 @@
+"""
+对局录制与回放
+
+录制一局游戏中的全部 LLM 请求和流式回复，以及所有随机选择（词语、卧底位置、
+平票），保存成 gzip 压缩的 JSON Lines 磁带文件。回放时不访问网络、不等待，
+全速重跑完全相同的一局，用于测量引擎本身的开销和复现线上问题。
+
+录制: uv run python -m undercover_game.cassette record game.cassette -p 5 -u 2
+回放: uv run python -m undercover_game.cassette replay game.cassette
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Iterator, Sequence
+from contextlib import aclosing, closing
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import AIMessageChunk
+
+from .cache import ResponseCache
+from .words import WindowSampler
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMismatch(LookupError):
+    """回放时遇到磁带里没有的请求或随机选择"""
+
+
+class Cassette:
+    """
+    一局游戏的录制内容。
+
+    Attributes:
+        meta: 对局参数，回放时用来构造同样的 UndercoverGame
+        requests: [{"key", "chunks", "usage"}]，按完成顺序排列
+        choices: 随机选择的结果（下标），按发生顺序排列
+    """
+
+    def __init__(self, meta: dict[str, Any] | None = None) -> None:
+        self.meta = meta or {}
+        self.requests: list[dict[str, Any]] = []
+        self.choices: list[Any] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def request_key(prompt: Any, kwargs: dict[str, Any]) -> str:
+        return ResponseCache.key("", kwargs, prompt)
+
+    def add_request(self, key: str, chunks: list[str], usage: dict | None) -> None:
+        with self._lock:
+            self.requests.append({"key": key, "chunks": chunks, "usage": usage})
+
+    def save(self, path: str | Path) -> None:
+        """写入 gzip 压缩的 JSON Lines: 第一行是头部，之后每行一条请求"""
+        header = {
+            "version": CASSETTE_VERSION,
+            "meta": self.meta,
+            "choices": self.choices,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for request in self.requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, path: str | Path) -> Cassette:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"不支持的磁带版本: {header.get('version')}")
+            cassette = cls(header["meta"])
+            cassette.choices = header["choices"]
+            cassette.requests = [json.loads(line) for line in f if line.strip()]
+        return cassette
+
+    def recording_llm(self, llm: Any) -> RecordingLLM:
+        return RecordingLLM(llm, self)
+
+    def replay_llm(self) -> ReplayLLM:
+        return ReplayLLM(self)
+
+    def recording_rng(self, rng: random.Random) -> RecordingRandom:
+        return RecordingRandom(rng, self)
+
+    def replay_rng(self) -> ReplayRandom:
+        return ReplayRandom(self)
+
+
+class RecordingLLM:
+    """转发请求给真实 LLM，并把每次的回复记录到磁带"""
+
+    def __init__(self, llm: Any, cassette: Cassette) -> None:
+        self.llm = llm
+        self.cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """同步流式输出，同时录制"""
+        chunks: list[str] = []
+        usage: dict | None = None
+        try:
+            with closing(self.llm.stream(prompt, **kwargs)) as stream:
+                for chunk in stream:
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                    if chunk.usage_metadata:
+                        usage = dict(chunk.usage_metadata)
+                    yield chunk
+        finally:
+            # 调用方提前关闭流时记录已收到的部分，回放时在同样的位置结束
+            self.cassette.add_request(
+                Cassette.request_key(prompt, kwargs), chunks, usage
+            )
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """异步流式输出，同时录制"""
+        chunks: list[str] = []
+        usage: dict | None = None
+        try:
+            async with aclosing(self.llm.astream(prompt, **kwargs)) as stream:
+                async for chunk in stream:
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                    if chunk.usage_metadata:
+                        usage = dict(chunk.usage_metadata)
+                    yield chunk
+        finally:
+            self.cassette.add_request(
+                Cassette.request_key(prompt, kwargs), chunks, usage
+            )
+
+
+class ReplayLLM:
+    """
+    按请求内容从磁带中取出回复，无等待地流式返回。
+
+    并发投票时请求完成顺序不固定，因此按请求键匹配；同一个键出现多次时按录制顺序依次返回。
+    """
+
+    def __init__(self, cassette: Cassette) -> None:
+        self.cassette = cassette
+        # 指标和缓存键沿用录制时的模型名
+        self.model_name = cassette.meta.get("model", "cassette")
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque[dict[str, Any]]] = {}
+        for request in cassette.requests:
+            self._queues.setdefault(request["key"], deque()).append(request)
+
+    def _take(self, prompt: Any, kwargs: dict[str, Any]) -> list[AIMessageChunk]:
+        key = Cassette.request_key(prompt, kwargs)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteMismatch(f"磁带中没有该请求: {key}")
+            request = queue.popleft()
+        chunks = [AIMessageChunk(content=content) for content in request["chunks"]]
+        if request.get("usage") and chunks:
+            chunks[-1] = AIMessageChunk(
+                content=chunks[-1].content, usage_metadata=request["usage"]
+            )
+        return chunks
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """同步回放"""
+        yield from self._take(prompt, kwargs)
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """异步回放"""
+        for chunk in self._take(prompt, kwargs):
+            yield chunk
+
+
+class RecordingRandom:
+    """
+    代理 UndercoverGame 用到的 choice / sample，记录选中的下标。
+
+    下标的分布与直接调用 rng.choice / rng.sample 完全相同。
+    """
+
+    def __init__(self, rng: random.Random, cassette: Cassette) -> None:
+        self.rng = rng
+        self.cassette = cassette
+
+    def choice(self, seq: Sequence[Any]) -> Any:
+        index = self.rng.randrange(len(seq))
+        self.cassette.choices.append(index)
+        return seq[index]
+
+    def sample(self, population: Sequence[Any], k: int) -> list[Any]:
+        indices = self.rng.sample(range(len(population)), k)
+        self.cassette.choices.append(indices)
+        return [population[i] for i in indices]
+
+
+class ReplayRandom:
+    """按录制顺序返回随机选择的结果"""
+
+    def __init__(self, cassette: Cassette) -> None:
+        self._choices = iter(cassette.choices)
+
+    def _next(self) -> Any:
+        try:
+            return next(self._choices)
+        except StopIteration:
+            raise CassetteMismatch("磁带中的随机选择已用完") from None
+
+    def choice(self, seq: Sequence[Any]) -> Any:
+        return seq[self._next()]
+
+    def sample(self, population: Sequence[Any], k: int) -> list[Any]:
+        indices = self._next()
+        if len(indices) != k:
+            raise CassetteMismatch(
+                f"录制的 sample 数量 {len(indices)} 与请求的 {k} 不一致"
+            )
+        return [population[i] for i in indices]
+
+
+def record_game(
+    path: str | Path, llm: Any = None, seed: int | None = None, **game_kwargs: Any
+):
+    """
+    运行一局游戏并录制到 path。
+
+    Args:
+        path: 磁带文件路径
+        llm: 真实 LLM，默认 get_llm()
+        seed: 随机种子
+        **game_kwargs: 传给 UndercoverGame 的其他参数（num_players、sink 等）；
+            history 只能使用默认的 summarize，其参数随磁带保存；words 为
+            WindowSampler 时抽到的词语对随磁带保存，其他自定义的词语对序列
+            在回放时需要再次传入
+
+    Returns:
+        最终游戏状态
+    """
+    from .game import UndercoverGame
+    from .players import _model_name, get_llm
+    from .prompts import clip_summary
+
+    history = game_kwargs.get("history")
+    if history is not None and history.summarize is not clip_summary:
+        # 回放时无法还原任意函数，摘要不同会导致提示词和请求键对不上
+        raise ValueError("录制对局只支持默认的 clip_summary 摘要")
+
+    llm = llm if llm is not None else get_llm()
+    meta = {
+        key: game_kwargs[key]
+        for key in (
+            "num_players",
+            "num_undercover",
+            "concurrent_votes",
+            "moderator_votes",
+            "structured_votes",
+        )
+        if key in game_kwargs
+    }
+    if game_kwargs.get("kinds") is not None:
+        meta["kinds"] = list(game_kwargs["kinds"])
+    if history is not None:
+        meta["history"] = {
+            "recent_rounds": history.recent_rounds,
+            "max_prompt_tokens": history.max_prompt_tokens,
+        }
+    meta["model"] = _model_name(llm)
+    cassette = Cassette(meta)
+    game = UndercoverGame(
+        llm=cassette.recording_llm(llm),
+        rng=cassette.recording_rng(random.Random(seed)),
+        **game_kwargs,
+    )
+    result = game.run()
+    if isinstance(game_kwargs.get("words"), WindowSampler):
+        # 抽样器的计数器不经过 rng，choices 中没有这次选择，直接保存抽到的词语对
+        cassette.meta["words"] = list(result["words"])
+    cassette.save(path)
+    return result
+
+
+def replay_game(path: str | Path, **game_kwargs: Any):
+    """
+    离线回放磁带中的一局游戏。
+
+    Args:
+        path: 磁带文件路径
+        **game_kwargs: 覆盖录制时的对局参数，如 sink、concurrent_votes
+
+    Returns:
+        最终游戏状态
+    """
+    from .game import UndercoverGame
+    from .prompts import HistoryPolicy
+
+    cassette = Cassette.load(path)
+    meta = {key: value for key, value in cassette.meta.items() if key != "model"}
+    if "history" in meta:
+        meta["history"] = HistoryPolicy(**meta["history"])
+    if "words" in meta:
+        # 只有一对的抽样器: 同样不消耗随机选择，总是抽到录制时的词语对
+        meta["words"] = WindowSampler([tuple(meta["words"])])
+    game = UndercoverGame(
+        llm=cassette.replay_llm(),
+        rng=cassette.replay_rng(),
+        **{**meta, **game_kwargs},
+    )
+    return game.run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="录制 / 回放谁是卧底对局")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("path", help="磁带文件路径")
+    parser.add_argument("-p", "--players", type=int, default=5, help="玩家数 (录制)")
+    parser.add_argument("-u", "--undercover", type=int, default=2, help="卧底数 (录制)")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子 (录制)")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        result = record_game(
+            args.path,
+            seed=args.seed,
+            num_players=args.players,
+            num_undercover=args.undercover,
+        )
+    else:
+        result = replay_game(args.path)
+    print(f"\n获胜方: {result['winner']}")
+
+
+if __name__ == "__main__":
+    main()
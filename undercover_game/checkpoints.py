@@ -0,0 +1,58 @@
+"""
+对局检查点
+
+基于 SQLite 的 LangGraph 检查点存储，配合 UndercoverGame.run(checkpointer=..., thread_id=...)
+让中断的对局从最后完成的节点继续。依赖 langgraph-checkpoint-sqlite
+（异步版本另需 aiosqlite），均已在项目依赖中声明。
+
+用法:
+    game = UndercoverGame(5, 2, seed=1)
+    game.run(checkpointer=sqlite_checkpointer("games.sqlite"), thread_id="game-1")
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# 检查点里出现的自定义类型，反序列化时需要显式允许
+_ALLOWED_TYPES = [
+    ("undercover_game.game", "PlayerRecord"),
+    ("undercover_game.game", "GameLog"),
+]
+
+
+def serializer() -> JsonPlusSerializer:
+    """允许还原 PlayerRecord 和 GameLog 的序列化器"""
+    return JsonPlusSerializer(allowed_msgpack_modules=_ALLOWED_TYPES)
+
+
+def sqlite_checkpointer(path: str | Path) -> Any:
+    """
+    同步的 SQLite 检查点存储，供 run() 使用。
+
+    连接允许跨线程使用（并发投票时节点在线程池中运行）。
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    return SqliteSaver(conn, serde=serializer())
+
+
+@asynccontextmanager
+async def async_sqlite_checkpointer(path: str | Path) -> AsyncIterator[Any]:
+    """
+    异步的 SQLite 检查点存储，供 arun() 使用；退出时关闭连接:
+        async with async_sqlite_checkpointer("games.sqlite") as checkpointer:
+            await game.arun(checkpointer=checkpointer, thread_id="game-1")
+    """
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    async with aiosqlite.connect(str(path)) as conn:
+        yield AsyncSqliteSaver(conn, serde=serializer())
@@ -0,0 +1,204 @@
+"""
+离线假 LLM
+
+不访问网络，按规则生成回复，接口与 ChatOpenAI 的 stream / astream 一致，
+用于批量模拟和基准测试游戏引擎本身的开销。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import zlib
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.messages import AIMessageChunk
+
+# 描述阶段的候选回复
+DESCRIPTIONS = [
+    "这是日常生活中很常见的东西。",
+    "很多人每天都会接触到它。",
+    "它有好几种不同的颜色。",
+    "小朋友一般都很喜欢它。",
+    "它的形状比较圆。",
+    "在超市里可以买到。",
+    "有时候会让人想起夏天。",
+    "用久了会有感情。",
+]
+
+# chatter 模式下附加在回复后的多余内容
+CHATTER = "我是根据前面几轮大家的发言仔细分析之后才做出这个判断的，希望大家也认真考虑。"
+
+_NAME_PATTERN = re.compile(r"玩家[A-Z0-9]+")
+
+
+def prompt_text(prompt: Any) -> str:
+    """把字符串或消息列表转换成纯文本，消息之间用换行分隔"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(f"{message.type}: {message.content}" for message in prompt)
+
+
+def schema_instance(schema: dict, rng: random.Random) -> Any:
+    """生成满足简单 JSON Schema（object / enum / string / integer / boolean）的值"""
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: schema_instance(sub, rng)
+            for name, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [schema_instance(schema.get("items", {}), rng)]
+    if kind == "integer":
+        return rng.randint(0, 9)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return rng.choice(DESCRIPTIONS)
+
+
+class PrefixCache:
+    """
+    模拟服务端的前缀缓存（KV cache）。
+
+    提示词按 block_size 个 token 分块，每块以"前缀哈希链"为键登记；
+    新提示词从头逐块查找，连续命中的块数 × block_size 即为缓存 token 数。
+    离线时按 1 个字符 ≈ 1 个 token 近似。
+    """
+
+    def __init__(self, block_size: int = 16) -> None:
+        self.block_size = block_size
+        self._blocks: set[bytes] = set()
+
+    def lookup(self, text: str) -> int:
+        """返回命中的前缀 token 数，并登记本次提示词的所有完整块"""
+        digest = hashlib.blake2b(digest_size=16)
+        cached = 0
+        hit = True
+        for start in range(0, len(text) - self.block_size + 1, self.block_size):
+            digest.update(text[start : start + self.block_size].encode("utf-8"))
+            key = digest.copy().digest()
+            if hit and key in self._blocks:
+                cached += self.block_size
+            else:
+                hit = False
+                self._blocks.add(key)
+        return cached
+
+
+class FakeLLM:
+    """
+    基于规则的假 LLM。
+
+    回复由提示词的 CRC32 决定，同样的提示词总是得到同样的回复，
+    跨进程结果可复现。
+    """
+
+    model_name = "fake"
+
+    def __init__(
+        self,
+        ttft: float = 0.0,
+        token_delay: float = 0.0,
+        chunk_size: int = 2,
+        prefix_cache: PrefixCache | None = None,
+        chatter: bool = False,
+    ) -> None:
+        """
+        Args:
+            ttft: 首 token 前的等待秒数
+            token_delay: 相邻两个 chunk 之间的等待秒数
+            chunk_size: 每个 chunk 的字符数
+            prefix_cache: 模拟服务端前缀缓存；提供时最后一个 chunk 带上 usage
+            chatter: 回复后面附带多余的解释，模拟不听话的模型
+        """
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+        self.prefix_cache = prefix_cache
+        self.chatter = chatter
+
+    def reply(self, prompt: Any) -> str:
+        """根据提示词生成完整回复"""
+        text = prompt_text(prompt)
+        rng = random.Random(zlib.crc32(text.encode("utf-8")))
+
+        if "可选玩家" in text:
+            # 投票: 从可选玩家中挑一个
+            options = text.rsplit("可选玩家", 1)[1].split("\n", 1)[0]
+            candidates = _NAME_PATTERN.findall(options)
+            if candidates:
+                vote = rng.choice(candidates)
+                return f"{vote}。{CHATTER}" if self.chatter else vote
+        description = rng.choice(DESCRIPTIONS)
+        return f"{description}{CHATTER}" if self.chatter else description
+
+    def structured_reply(self, prompt: Any, response_format: dict) -> str:
+        """按 response_format 的 JSON Schema 生成 JSON 回复"""
+        text = prompt_text(prompt)
+        rng = random.Random(zlib.crc32(text.encode("utf-8")))
+        schema = (response_format.get("json_schema") or {}).get("schema") or {}
+        reply = json.dumps(schema_instance(schema, rng), ensure_ascii=False)
+        return f"{reply}{CHATTER}" if self.chatter else reply
+
+    def _chunks(self, prompt: Any, **kwargs: Any) -> list[AIMessageChunk]:
+        """
+        生成回复的 chunk 列表，模拟服务端的 stop / max_tokens（1 个 chunk 算 1 个 token）
+        和 JSON Schema 结构化输出（response_format）。
+
+        提供 prefix_cache 时 usage 附在最后一个内容 chunk 上，而不是像 OpenAI 那样
+        单独发一个空 chunk，这样客户端在最后一个 token 处提前结束也能拿到 usage。
+        """
+        response_format = kwargs.get("response_format")
+        if response_format and response_format.get("type") == "json_schema":
+            reply = self.structured_reply(prompt, response_format)
+        else:
+            reply = self.reply(prompt)
+        for stop in kwargs.get("stop") or ():
+            reply = reply.split(stop, 1)[0]
+        size = self.chunk_size
+        pieces = [reply[i : i + size] for i in range(0, len(reply), size)]
+        max_tokens = kwargs.get("max_tokens")
+        if max_tokens:
+            pieces = pieces[:max_tokens]
+        chunks = [AIMessageChunk(content=piece) for piece in pieces]
+
+        if self.prefix_cache is not None and chunks:
+            text = prompt_text(prompt)
+            output_tokens = len(chunks)
+            chunks[-1] = AIMessageChunk(
+                content=chunks[-1].content,
+                usage_metadata={
+                    "input_tokens": len(text),
+                    "output_tokens": output_tokens,
+                    "total_tokens": len(text) + output_tokens,
+                    "input_token_details": {
+                        "cache_read": self.prefix_cache.lookup(text)
+                    },
+                },
+            )
+        return chunks
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """同步流式输出"""
+        for i, chunk in enumerate(self._chunks(prompt, **kwargs)):
+            delay = self.ttft if i == 0 else self.token_delay
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """异步流式输出"""
+        for i, chunk in enumerate(self._chunks(prompt, **kwargs)):
+            delay = self.ttft if i == 0 else self.token_delay
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
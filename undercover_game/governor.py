@@ -0,0 +1,400 @@
+"""
+LLM 请求限流
+
+RateGovernor 是进程内共享的调度器：按每分钟请求数 / token 数做令牌桶限流，
+用信号量限制同时进行的请求数，遇到 429 时全局退避并重试，5xx、超时和连接错误
+只对出错的请求退避重试。同步和异步调用
+共用同一套额度，排队长度和等待时间记录到 MetricsRegistry。
+
+用法:
+    governor = RateGovernor(rpm=60, tpm=100_000, max_concurrency=4)
+    llm = GovernedLLM(get_llm(), governor)
+或设置环境变量 LLM_MAX_RPM / LLM_MAX_TPM / LLM_MAX_CONCURRENCY，
+get_llm() 会自动包上全局共享的 RateGovernor，指标写入进程级的 LLM_METRICS。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import aclosing, asynccontextmanager, closing, contextmanager
+from typing import Any
+
+import openai
+from langchain_core.messages import AIMessageChunk
+
+from .metrics import MetricsRegistry
+
+# 未指定 max_tokens 时按这么多输出 token 预留额度
+DEFAULT_OUTPUT_TOKENS = 256
+
+
+class TokenBucket:
+    """
+    预约式令牌桶：额度可以透支，reserve 返回调用方需要等待的秒数。
+
+    不在锁内睡眠，因此同步和异步调用方可以共用同一个桶。
+
+    Args:
+        per_minute: 每分钟补充的额度
+        capacity: 桶容量（允许的突发量），默认等于 per_minute
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None) -> None:
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """扣除 amount，返回额度补足前需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(
+                self.capacity, self._level + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._level -= amount
+            return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """退回多预留的额度（amount 为负时补扣）"""
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+
+class _Slots:
+    """
+    先进先出的并发槽位，同步线程和协程可以混用。
+
+    释放槽位时直接交给队首的等待者，避免新来的调用插队。
+    """
+
+    def __init__(self, limit: int | None) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: deque[Any] = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        if self.limit is None or (self.in_use < self.limit and not self._waiters):
+            self.in_use += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._try_acquire():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                # 取消前槽位已经交过来了，转交给下一个
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+        # in_use 不变: 槽位直接转交
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            # 等待者已取消但还没来得及移出队列
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class RateGovernor:
+    """
+    进程内共享的请求调度器。
+
+    Args:
+        rpm: 每分钟最多发起的请求数，None 表示不限
+        tpm: 每分钟最多消耗的 token 数（输入 + 输出，发起前按估算值预留，
+            结束后按实际 usage 多退少补），None 表示不限
+        max_concurrency: 同时进行的请求数上限，None 表示不限
+        max_retries: 429、5xx、超时和连接错误的最大重试次数；已经收到内容后
+            出错不重试
+        backoff_base: 退避的初始秒数；连续 429 时翻倍、成功后减半，其他错误
+            按本次请求的重试次数翻倍
+        backoff_max: 退避秒数上限
+        metrics: 记录排队和等待时间的注册表，默认新建
+    """
+
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int | None = None,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._slots = _Slots(max_concurrency)
+        self._lock = threading.Lock()
+        self._backoff = backoff_base
+        self._paused_until = 0.0
+        self._queued = 0
+
+    @classmethod
+    def from_env(cls, metrics: MetricsRegistry | None = None) -> RateGovernor | None:
+        """按 LLM_MAX_RPM / LLM_MAX_TPM / LLM_MAX_CONCURRENCY 创建，都未设置时返回 None"""
+        rpm = os.getenv("LLM_MAX_RPM")
+        tpm = os.getenv("LLM_MAX_TPM")
+        concurrency = os.getenv("LLM_MAX_CONCURRENCY")
+        if not (rpm or tpm or concurrency):
+            return None
+        return cls(
+            rpm=float(rpm) if rpm else None,
+            tpm=float(tpm) if tpm else None,
+            max_concurrency=int(concurrency) if concurrency else None,
+            metrics=metrics,
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """等待槽位或额度、尚未发出的请求数"""
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._slots.in_use
+
+    def estimate_tokens(self, prompt: Any, kwargs: dict[str, Any]) -> int:
+        """按 1 个字符 ≈ 1 个 token 估算输入，加上 max_tokens"""
+        if isinstance(prompt, str):
+            chars = len(prompt)
+        else:
+            chars = sum(len(str(message.content)) for message in prompt)
+        return chars + (kwargs.get("max_tokens") or DEFAULT_OUTPUT_TOKENS)
+
+    def _reserve(self, tokens: int) -> float:
+        """预留一次请求的额度，返回发出前还需等待的秒数"""
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def _settle(self, estimate: int, usage: dict | None, received: bool) -> None:
+        """请求结束后按实际用量修正 token 额度"""
+        if self.tokens is None:
+            return
+        if usage:
+            self.tokens.refund(estimate - usage.get("total_tokens", estimate))
+        elif not received:
+            # 没有生成任何内容（如 429），不计输出
+            self.tokens.refund(estimate)
+
+    def _queue(self, delta: int) -> None:
+        with self._lock:
+            self._queued += delta
+            queued = self._queued
+        self.metrics.set_gauge("llm_governor_queue_depth", queued)
+
+    def _started(self, waited: float) -> None:
+        self._queue(-1)
+        self.metrics.observe("llm_governor_wait_seconds", waited)
+        self.metrics.set_gauge("llm_governor_in_flight", self._slots.in_use)
+
+    def _succeeded(self) -> None:
+        with self._lock:
+            self._backoff = max(self.backoff_base, self._backoff / 2)
+
+    def _throttled(self, exc: BaseException) -> float | None:
+        """429 时暂停所有新请求，返回退避秒数；其他错误返回 None"""
+        if getattr(exc, "status_code", None) != 429:
+            return None
+        self.metrics.inc("llm_governor_throttled_total")
+        delay = _retry_after(exc)
+        with self._lock:
+            if delay is None:
+                # 加抖动，避免所有请求在同一时刻重试
+                delay = self._backoff * random.uniform(0.5, 1.0)
+            self._backoff = min(self.backoff_max, self._backoff * 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> float | None:
+        """可以重试时返回退避秒数，不可重试的错误返回 None"""
+        delay = self._throttled(exc)
+        if delay is not None or not _transient(exc):
+            return delay
+        # 5xx / 超时 / 连接错误只说明这一个请求失败，不暂停其他请求
+        self.metrics.inc("llm_governor_transient_errors_total")
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    @contextmanager
+    def _slot(self) -> Iterator[None]:
+        self._queue(1)
+        self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self.metrics.set_gauge("llm_governor_in_flight", self._slots.in_use)
+
+    @asynccontextmanager
+    async def _aslot(self) -> AsyncIterator[None]:
+        self._queue(1)
+        try:
+            await self._slots.aacquire()
+        except BaseException:
+            self._queue(-1)
+            raise
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self.metrics.set_gauge("llm_governor_in_flight", self._slots.in_use)
+
+    def stream(self, llm: Any, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """在额度内调用 llm.stream，429 / 5xx / 超时 / 连接错误且尚未收到内容时退避重试"""
+        estimate = self.estimate_tokens(prompt, kwargs)
+        start = time.monotonic()
+        with self._slot():
+            time.sleep(self._reserve(estimate))
+            self._started(time.monotonic() - start)
+            attempt = 0
+            while True:
+                received = False
+                usage = None
+                try:
+                    with closing(llm.stream(prompt, **kwargs)) as stream:
+                        for chunk in stream:
+                            received = received or bool(chunk.content)
+                            if chunk.usage_metadata:
+                                usage = chunk.usage_metadata
+                            yield chunk
+                    self._succeeded()
+                    return
+                except Exception as exc:
+                    delay = self._retry_delay(exc, attempt)
+                    if delay is None or received or attempt >= self.max_retries:
+                        raise
+                finally:
+                    self._settle(estimate, usage, received)
+                attempt += 1
+                self.metrics.inc("llm_governor_retries_total")
+                time.sleep(max(delay, self._reserve(estimate)))
+
+    async def astream(
+        self, llm: Any, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """stream 的异步版本"""
+        estimate = self.estimate_tokens(prompt, kwargs)
+        start = time.monotonic()
+        async with self._aslot():
+            try:
+                await asyncio.sleep(self._reserve(estimate))
+            except BaseException:
+                self._queue(-1)
+                raise
+            self._started(time.monotonic() - start)
+            attempt = 0
+            while True:
+                received = False
+                usage = None
+                try:
+                    async with aclosing(llm.astream(prompt, **kwargs)) as stream:
+                        async for chunk in stream:
+                            received = received or bool(chunk.content)
+                            if chunk.usage_metadata:
+                                usage = chunk.usage_metadata
+                            yield chunk
+                    self._succeeded()
+                    return
+                except Exception as exc:
+                    delay = self._retry_delay(exc, attempt)
+                    if delay is None or received or attempt >= self.max_retries:
+                        raise
+                finally:
+                    self._settle(estimate, usage, received)
+                attempt += 1
+                self.metrics.inc("llm_governor_retries_total")
+                await asyncio.sleep(max(delay, self._reserve(estimate)))
+
+
+def _transient(exc: BaseException) -> bool:
+    """5xx、超时和连接错误，重试可能成功"""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(exc, (TimeoutError, ConnectionError, openai.APIConnectionError))
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    """从 429 响应的 Retry-After 头读取等待秒数"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class GovernedLLM:
+    """
+    让 LLM 的 stream / astream 经过 RateGovernor 调度。
+
+    Args:
+        llm: 被包装的 LLM；包装 ChatOpenAI 时建议设 max_retries=0，由调度器负责重试
+        governor: 共享的调度器
+    """
+
+    def __init__(self, llm: Any, governor: RateGovernor) -> None:
+        self.llm = llm
+        self.governor = governor
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        return self.governor.stream(self.llm, prompt, **kwargs)
+
+    def astream(self, prompt: Any, **kwargs: Any) -> AsyncIterator[AIMessageChunk]:
+        return self.governor.astream(self.llm, prompt, **kwargs)
@@ -0,0 +1,266 @@
+"""
+对冲请求
+
+首 token 迟迟不来时再发一个相同的请求，哪个先开始输出就用哪个，另一个关闭。
+等待期限取最近 TTFT 的高分位数，额外请求数受预算限制（默认不超过 10%）。
+
+用法:
+    metrics = MetricsRegistry()
+    llm = HedgedLLM(get_llm(), HedgePolicy(quantile=0.9, budget=0.1), metrics=metrics)
+    game = UndercoverGame(llm=llm, metrics=metrics)
+对冲次数（llm_hedges_total）和胜出次数（llm_hedge_wins_total）与调用耗时一起
+导出；用 get_llm() 的环境变量 LLM_HEDGE_QUANTILE 时写入进程级的 LLM_METRICS。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import aclosing, closing
+from typing import Any
+
+from langchain_core.messages import AIMessageChunk
+
+from .metrics import MetricsRegistry
+
+
+class HedgePolicy:
+    """
+    决定何时发起对冲请求。
+
+    Args:
+        quantile: 等待期限取最近 TTFT 的这个分位数
+        window: 参与计算的最近 TTFT 样本数
+        min_samples: 样本不足时使用 initial_delay
+        initial_delay: 冷启动时的等待期限（秒）
+        min_delay: 等待期限下限，避免 TTFT 很稳定时过早对冲
+        budget: 对冲请求占全部请求的比例上限
+        burst: 预算最多累积的对冲次数
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.9,
+        window: int = 200,
+        min_samples: int = 20,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.05,
+        budget: float = 0.1,
+        burst: float = 5.0,
+    ) -> None:
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.burst = burst
+        self._samples: deque[float] = deque(maxlen=window)
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+    def deadline(self) -> float:
+        """本次请求等待首 token 的期限（秒）；每次请求调用一次，同时累积预算"""
+        with self._lock:
+            self._credits = min(self.burst, self._credits + self.budget)
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            samples = sorted(self._samples)
+        index = max(0, math.ceil(self.quantile * len(samples)) - 1)
+        return max(self.min_delay, samples[index])
+
+    def try_hedge(self) -> bool:
+        """预算足够时扣除一次并返回 True"""
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+    def observe(self, ttft: float) -> None:
+        """记录胜出请求自身的 TTFT"""
+        with self._lock:
+            self._samples.append(ttft)
+
+
+class _Race:
+    """
+    主请求和对冲请求的竞速状态，同步和异步版本共用。
+
+    各请求把 (序号, 类型, 内容) 放进队列，类型为 "chunk" / "done" / "error"。
+    第一个产出非空内容（或正常结束）的请求胜出；在此之前收到的空 chunk 先按请求缓存。
+    """
+
+    def __init__(self, hedged: HedgedLLM) -> None:
+        self.hedged = hedged
+        self.deadline = hedged.policy.deadline()
+        self.started: list[float] = [time.monotonic()]
+        self.pending: list[list[AIMessageChunk]] = [[]]
+        self.failed: set[int] = set()
+        self.winner: int | None = None
+        self.can_hedge = True
+        self.finished = False
+        hedged.metrics.inc("llm_hedge_calls_total")
+
+    def timeout(self) -> float | None:
+        """距离对冲期限的秒数；不再对冲时返回 None"""
+        if not self.can_hedge:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - self.started[0]))
+
+    def expire(self) -> bool:
+        """期限已到，返回是否发起对冲请求"""
+        self.can_hedge = False
+        if not self.hedged.policy.try_hedge():
+            self.hedged.metrics.inc("llm_hedge_budget_exhausted_total")
+            return False
+        self.hedged.metrics.inc("llm_hedges_total")
+        self.started.append(time.monotonic())
+        self.pending.append([])
+        return True
+
+    def on_item(self, index: int, kind: str, item: Any) -> list[AIMessageChunk]:
+        """处理一条队列消息，返回可以交给调用方的 chunk"""
+        if self.winner is not None:
+            if index != self.winner:
+                return []
+            if kind == "error":
+                raise item
+            if kind == "done":
+                self.finished = True
+                return []
+            return [item]
+
+        if kind == "error":
+            # 还有请求在进行时等待它；全部失败（包括期限前主请求就失败）时抛出
+            self.failed.add(index)
+            if len(self.failed) == len(self.started):
+                raise item
+            return []
+        if kind == "chunk" and not item.content:
+            self.pending[index].append(item)
+            return []
+
+        self.winner = index
+        self.can_hedge = False
+        self.hedged.policy.observe(time.monotonic() - self.started[index])
+        if index > 0:
+            self.hedged.metrics.inc("llm_hedge_wins_total")
+        chunks = self.pending[index]
+        if kind == "chunk":
+            chunks.append(item)
+        else:
+            self.finished = True
+        return chunks
+
+
+class HedgedLLM:
+    """
+    给 LLM 加上对冲请求，接口与被包装的 LLM 的 stream / astream 相同。
+
+    同步版本在后台线程里读取两个流；被淘汰的同步流在收到下一个 chunk 时关闭，
+    异步版本直接取消对应的任务。
+
+    Args:
+        llm: 被包装的 LLM
+        policy: 对冲策略，默认 HedgePolicy()
+        metrics: 记录对冲次数和胜出次数的注册表，默认新建；传入对局的注册表
+            才会出现在对局导出的指标里
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        policy: HedgePolicy | None = None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self.llm = llm
+        self.policy = policy if policy is not None else HedgePolicy()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        """同步流式输出"""
+        race = _Race(self)
+        events: queue.Queue = queue.Queue()
+        cancelled = [threading.Event()]
+
+        def run(index: int) -> None:
+            try:
+                with closing(self.llm.stream(prompt, **kwargs)) as stream:
+                    for chunk in stream:
+                        if cancelled[index].is_set():
+                            return
+                        events.put((index, "chunk", chunk))
+                events.put((index, "done", None))
+            except Exception as exc:
+                events.put((index, "error", exc))
+
+        def start(index: int) -> None:
+            threading.Thread(target=run, args=(index,), daemon=True).start()
+
+        start(0)
+        try:
+            while not race.finished:
+                try:
+                    index, kind, item = events.get(timeout=race.timeout())
+                except queue.Empty:
+                    if race.expire():
+                        cancelled.append(threading.Event())
+                        start(len(cancelled) - 1)
+                    continue
+                yield from race.on_item(index, kind, item)
+                if race.winner is not None:
+                    for i, event in enumerate(cancelled):
+                        if i != race.winner:
+                            event.set()
+        finally:
+            for event in cancelled:
+                event.set()
+
+    async def astream(
+        self, prompt: Any, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """异步流式输出"""
+        race = _Race(self)
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: list[asyncio.Task] = []
+
+        async def run(index: int) -> None:
+            try:
+                async with aclosing(self.llm.astream(prompt, **kwargs)) as stream:
+                    async for chunk in stream:
+                        events.put_nowait((index, "chunk", chunk))
+                events.put_nowait((index, "done", None))
+            except Exception as exc:
+                events.put_nowait((index, "error", exc))
+
+        def start(index: int) -> None:
+            tasks.append(asyncio.create_task(run(index)))
+
+        start(0)
+        try:
+            while not race.finished:
+                try:
+                    index, kind, item = await asyncio.wait_for(
+                        events.get(), race.timeout()
+                    )
+                except TimeoutError:
+                    if race.expire():
+                        start(len(tasks))
+                    continue
+                for chunk in race.on_item(index, kind, item):
+                    yield chunk
+                if race.winner is not None:
+                    for i, task in enumerate(tasks):
+                        if i != race.winner:
+                            task.cancel()
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,375 @@
+"""
+不调用 LLM 的启发式玩家
+
+描述从本地的词语属性表中挑一条，投票时把各玩家的描述编码成字符 n-gram 向量，
+投给与自己的词语最不像的玩家。每次调用只需几十微秒，用于压测引擎和离线校准难度:
+    game = UndercoverGame(5, 1, kinds=["heuristic"] * 4 + ["ai"])
+大批量模拟时用 game.run_direct() 代替 run()，省掉状态图每个节点的调度开销。
+
+需要 numpy（项目依赖中已声明）。
+
+属性表 ATTRIBUTES 只覆盖内置 WORD_PAIRS 中的词。WordCorpus 语料库中的其他词
+没有特征，描述退化为按词语哈希固定选取的通用描述，平民之间不再共享特征，
+投票接近随机；用语料库对局时可以先向 ATTRIBUTES 补充这些词的特征。
+"""
+
+from __future__ import annotations
+
+import time
+import zlib
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from .fake_llm import DESCRIPTIONS
+from .metrics import MetricsRegistry
+from .players import PLAYER_KINDS
+from .sinks import ConsoleSink, EventSink
+
+# 词语 -> 可以用来描述它的特征（不包含词语本身）；相近的两个词有一部分特征相同
+ATTRIBUTES: dict[str, list[str]] = {
+    "苹果": [
+        "红色的水果",
+        "咬起来脆脆的",
+        "一天一个身体好",
+        "可以榨汁",
+        "有家科技公司用它当标志",
+    ],
+    "梨": ["是一种水果", "水分很多", "外皮是黄色的", "形状上小下大", "秋天吃可以润肺"],
+    "篮球": ["需要运球", "要投进篮筐", "一队五个人上场", "球是橙色的", "场地是木地板"],
+    "足球": [
+        "主要用脚踢",
+        "一队十一个人上场",
+        "有守门员",
+        "最有名的比赛是世界杯",
+        "在草地上比赛",
+    ],
+    "咖啡": ["可以提神", "味道有点苦", "很多人早上喝", "可以加奶和糖", "豆子要先烘焙"],
+    "奶茶": ["味道很甜", "可以加珍珠", "年轻人很爱喝", "有时会加冰", "有浓浓的奶香味"],
+    "手机": [
+        "每天随身带着",
+        "可以打电话",
+        "屏幕不算大",
+        "每天都要充电",
+        "能放进口袋里",
+    ],
+    "平板": [
+        "屏幕比较大",
+        "适合看视频",
+        "适合窝在沙发上用",
+        "可以配一支笔",
+        "比电脑轻便",
+    ],
+    "地铁": ["在地下跑", "不会堵车", "要刷卡进站", "早晚高峰很挤", "有固定的线路"],
+    "公交": [
+        "在马路上开",
+        "沿途有很多站",
+        "可以投币或刷卡",
+        "高峰时会堵车",
+        "有固定的线路",
+    ],
+    "沙发": ["放在客厅里", "坐着很舒服", "可以几个人一起坐", "有靠背", "看电视时常用"],
+    "床": ["睡觉时用", "放在卧室里", "要铺上床单", "早上很难离开它", "可以躺着"],
+    "眼镜": ["戴在鼻梁上", "近视的人需要", "镜片是透明的", "看书时戴", "要经常擦镜片"],
+    "墨镜": ["戴在鼻梁上", "可以挡太阳", "镜片颜色很深", "夏天常戴", "戴上看起来很酷"],
+    "饺子": [
+        "过年一定要吃",
+        "边上有褶子",
+        "常常蘸醋吃",
+        "皮里包着馅",
+        "可以煎也可以煮",
+    ],
+    "馄饨": ["皮很薄", "连汤一起吃", "皮里包着馅", "早餐常吃", "在汤里像云朵一样飘着"],
+    "西瓜": ["夏天吃最解暑", "里面是红的", "有黑色的籽", "又大又重", "外皮有条纹"],
+    "哈密瓜": [
+        "味道很甜",
+        "果肉是橙色的",
+        "新疆的最有名",
+        "外皮有网纹",
+        "夏天吃最解暑",
+    ],
+    "老虎": [
+        "被称为森林之王",
+        "身上有条纹",
+        "是吃肉的",
+        "是大型猫科动物",
+        "额头上像写着王字",
+    ],
+    "狮子": ["被称为草原之王", "雄性有鬃毛", "是吃肉的", "是大型猫科动物", "喜欢群居"],
+    "医生": ["穿白大褂", "在医院工作", "会开药方", "给病人看病", "要做手术"],
+    "护士": ["穿白大褂", "在医院工作", "会打针", "照顾病人", "经常要值夜班"],
+    "警察": [
+        "穿着制服",
+        "专门抓坏人",
+        "开着有警灯的车",
+        "保护大家的安全",
+        "遇到困难可以找",
+    ],
+    "保安": ["穿着制服", "守在大门口", "晚上要巡逻", "检查进出的人", "在小区里工作"],
+    "钢琴": [
+        "有黑白两种键",
+        "又大又重",
+        "用手指弹",
+        "放在家里或音乐厅",
+        "一共有八十八个键",
+    ],
+    "吉他": [
+        "有六根弦",
+        "可以背着到处走",
+        "用手指拨弦",
+        "边弹边唱很方便",
+        "琴身是木头做的",
+    ],
+    "筷子": [
+        "两根一起用",
+        "中国人吃饭离不开",
+        "用来夹菜",
+        "细细长长的",
+        "木头或竹子做的",
+    ],
+    "叉子": [
+        "吃西餐时用",
+        "有几个尖齿",
+        "一般是金属做的",
+        "和刀一起用",
+        "可以叉起食物",
+    ],
+    "月亮": ["晚上才出现", "有圆有缺", "中秋节要赏", "光很柔和", "传说嫦娥住在那里"],
+    "太阳": ["白天才出现", "非常热", "东升西落", "不能直视", "给万物带来光"],
+}
+
+# 字符 n-gram 向量的维数（哈希分桶）
+NGRAM_BUCKETS = 512
+
+
+def ngram_vectors(texts: list[str]) -> np.ndarray:
+    """
+    把每段文本编码成字符一元和二元组的计数向量（哈希到 NGRAM_BUCKETS 维），每行单位长度。
+
+    所有文本拼在一起一次计算，没有逐文本的 Python 循环。
+    """
+    joined = "\0".join(texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    # 第几段文本: 每个分隔符之后加 1
+    segments = np.cumsum(codes == 0)
+    chars = codes != 0
+    # 一元组，以及不跨越分隔符的二元组
+    pairs = chars[:-1] & chars[1:]
+    grams = np.concatenate(
+        [codes[chars], codes[:-1][pairs] * 1_000_003 + codes[1:][pairs]]
+    )
+    rows = np.concatenate([segments[chars], segments[:-1][pairs]])
+    counts = np.bincount(
+        rows * NGRAM_BUCKETS + grams % NGRAM_BUCKETS,
+        minlength=len(texts) * NGRAM_BUCKETS,
+    ).reshape(len(texts), NGRAM_BUCKETS)
+    norms = np.linalg.norm(counts, axis=1, keepdims=True)
+    return counts / np.where(norms == 0, 1, norms)
+
+
+# 文本 -> 单位向量。同一轮投票时每个投票者比较的是同一组候选人描述，
+# 只有第一个投票者需要计算；超过上限时整体清空
+_VECTORS: dict[str, np.ndarray] = {}
+_VECTORS_MAX = 4096
+
+
+def text_vectors(texts: list[str]) -> np.ndarray:
+    """ngram_vectors 的缓存版本，未缓存的文本合在一起计算一次"""
+    found = {text: _VECTORS.get(text) for text in texts}
+    missing = [text for text, vector in found.items() if vector is None]
+    if missing:
+        if len(_VECTORS) + len(missing) > _VECTORS_MAX:
+            _VECTORS.clear()
+        computed = dict(zip(missing, ngram_vectors(missing)))
+        _VECTORS.update(computed)
+        found.update(computed)
+    return np.stack([found[text] for text in texts])
+
+
+def text_vector(text: str) -> np.ndarray:
+    """单段文本的向量，命中缓存时不经过 text_vectors 的组装"""
+    vector = _VECTORS.get(text)
+    return vector if vector is not None else text_vectors([text])[0]
+
+
+# 最近一次投票的 (候选人描述, 向量矩阵)。同一轮的投票者面对同一组候选人，
+# 只有第一个投票者需要组装矩阵；整体替换，并发投票时读到的总是一致的一对
+_CANDIDATES: tuple[tuple[str, ...], np.ndarray] = ((), np.zeros((0, NGRAM_BUCKETS)))
+
+
+def candidate_vectors(texts: tuple[str, ...]) -> np.ndarray:
+    """一组候选人描述的向量矩阵，与上一次相同时直接复用"""
+    global _CANDIDATES
+    cached_texts, matrix = _CANDIDATES
+    if texts != cached_texts:
+        matrix = text_vectors(list(texts))
+        _CANDIDATES = (texts, matrix)
+    return matrix
+
+
+def word_attributes(word: str) -> list[str]:
+    """
+    词语的特征；属性表中没有的词（如语料库中的词），按词语哈希从通用描述中
+    取固定的几条，同一个词在各局、各进程中相同
+    """
+    attributes = ATTRIBUTES.get(word)
+    if attributes:
+        return attributes
+    start = zlib.crc32(word.encode("utf-8"))
+    return [
+        DESCRIPTIONS[(start + i) % len(DESCRIPTIONS)].rstrip("。") for i in range(3)
+    ]
+
+
+def _pick(scores: np.ndarray, best: Callable, draw: int) -> int:
+    """scores 中取 best（min 或 max）的下标，并列时按 draw 选一个"""
+    # 候选只有几个，转成列表逐个比较比 numpy 的逐次调用快
+    values = scores.tolist()
+    target = best(values)
+    ties = [i for i, value in enumerate(values) if abs(value - target) < 1e-9]
+    return ties[draw % len(ties)]
+
+
+class HeuristicPlayer:
+    """
+    启发式玩家，接口与 AIPlayer 相同（describe / vote 及其异步版本）。
+
+    描述: 从自己词语的特征中挑一条没说过的；有一定概率改用通用的模糊描述，
+    卧底的概率更高。投票: 以自己的词语特征和自己说过的话为参照，
+    投给描述的 n-gram 向量与参照余弦相似度最低的玩家。
+
+    随机选择由 (玩家名, 词语, 阶段, 轮数) 的哈希决定，同样的对局结果可复现，从检查点恢复也一样。
+    """
+
+    # 用通用描述代替特征的概率。卧底的描述本来就和平民不同，说得越模糊越容易
+    # 混进通用描述里；平民的这个值越高，卧底越难被找出来（python -m undercover_game.bench bots
+    # 输出的胜率可用来校准）
+    CIVILIAN_VAGUENESS = 0.3
+    UNDERCOVER_VAGUENESS = 0.1
+    MODEL_NAME = "heuristic"
+
+    def __init__(
+        self,
+        name: str,
+        word: str,
+        is_undercover: bool,
+        llm: Any = None,
+        sink: EventSink | None = None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        """
+        Args:
+            name: 玩家名
+            word: 分配到的词语
+            is_undercover: 是否为卧底
+            llm: 不使用，只为与 AIPlayer 的构造参数一致
+            sink: 事件输出，默认打印到终端
+            metrics: 指标注册表，只记录调用次数 heuristic_calls_total，默认不记录
+        """
+        self.name = name
+        self.word = word
+        self.is_undercover = is_undercover
+        self.descriptions: list[str] = []
+        self.sink = sink if sink is not None else ConsoleSink()
+        self.metrics = metrics
+        self.timings: list[tuple[str, float, float]] = []
+        self.prompt_usage: list[tuple[str, int, int, int]] = []
+        self.attributes = word_attributes(word)
+        self.vagueness = (
+            self.UNDERCOVER_VAGUENESS if is_undercover else self.CIVILIAN_VAGUENESS
+        )
+
+    def describe(self, round_num: int, all_descriptions: dict[str, list[str]]) -> str:
+        """从特征表中挑一条描述；卧底挑与别人说过的最像的，平民随机挑"""
+        start = time.time()
+        draw = self._draw("describe", round_num)
+        unused = [
+            attribute
+            for attribute in self.attributes
+            if f"{attribute}。" not in self.descriptions
+        ]
+        if not unused or (draw & 0xFFFF) < self.vagueness * 0x10000:
+            description = DESCRIPTIONS[(draw >> 16) % len(DESCRIPTIONS)]
+        else:
+            others = "".join(
+                "".join(descs)
+                for name, descs in all_descriptions.items()
+                if name != self.name
+            )
+            if self.is_undercover and others:
+                # 特征的向量可以缓存，别人的描述每次都不同
+                similarity = text_vectors(unused) @ ngram_vectors([others])[0]
+                attribute = unused[_pick(similarity, max, draw >> 16)]
+            else:
+                attribute = unused[(draw >> 16) % len(unused)]
+            description = f"{attribute}。"
+        self.descriptions.append(description)
+        self._emit("describe", description, round_num, start)
+        return description
+
+    async def adescribe(
+        self, round_num: int, all_descriptions: dict[str, list[str]]
+    ) -> str:
+        return self.describe(round_num, all_descriptions)
+
+    def vote(
+        self,
+        alive_players: list[str],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
+    ) -> str:
+        """投给描述与自己的词语最不像的玩家"""
+        start = time.time()
+        reference = "".join(self.attributes) + "".join(self.descriptions)
+        candidates = tuple(
+            "".join(all_descriptions.get(name, ())) for name in alive_players
+        )
+        similarity = candidate_vectors(candidates) @ text_vector(reference)
+        draw = self._draw("vote", len(self.descriptions))
+        vote = alive_players[_pick(similarity, min, draw)] if alive_players else ""
+        self._emit("vote", vote, len(self.descriptions), start, live)
+        return vote
+
+    async def avote(
+        self,
+        alive_players: list[str],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
+    ) -> str:
+        return self.vote(alive_players, all_descriptions, live)
+
+    def _draw(self, phase: str, round_num: int) -> int:
+        """本次调用的 32 位随机数，只由 (玩家名, 词语, 阶段, 轮数) 决定"""
+        return zlib.crc32(f"{self.name}/{self.word}/{phase}/{round_num}".encode())
+
+    def _emit(
+        self, phase: str, text: str, round_num: int, start: float, live: bool = True
+    ) -> None:
+        """与 AIPlayer 一样输出调用事件并记录耗时，终端和日志的格式保持一致"""
+        total = time.time() - start
+        self.timings.append((phase, 0.0, total))
+        if self.metrics is not None:
+            # 不是 LLM 调用，不计入 llm_* 指标，只计数
+            self.metrics.inc("heuristic_calls_total", phase=phase)
+        self.sink.emit("call_start", player=self.name, phase=phase, live=live)
+        self.sink.emit("token", player=self.name, phase=phase, live=live, text=text)
+        self.sink.emit(
+            "call_end",
+            player=self.name,
+            phase=phase,
+            live=live,
+            text=text,
+            ttft=0.0,
+            gen=total,
+            total=total,
+            saved_tokens=None,
+            saved_ms=None,
+        )
+
+    def __repr__(self) -> str:
+        role = "卧底" if self.is_undercover else "平民"
+        return f"HeuristicPlayer({self.name}, {role})"
+
+
+PLAYER_KINDS["heuristic"] = HeuristicPlayer
@@ -0,0 +1,279 @@
+"""
+LLM 调用指标
+
+MetricsRegistry 按标签记录每次 LLM 调用的耗时与吞吐，直方图采用 HDR 风格的
+对数-线性分桶（相对误差约 1%），可合并、内存占用与样本数无关。
+结束时可导出 JSON 汇总或 Prometheus 文本格式。
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Any
+
+# 标签: 排好序的 (名称, 值) 元组，作为字典键
+Labels = tuple[tuple[str, str], ...]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 0 和负值单独放在一个桶里
+_ZERO_BUCKET = -(2**62)
+
+
+class Histogram:
+    """
+    HDR 风格直方图。
+
+    值按二进制指数分段，每段再线性细分为 sub_buckets 个桶，
+    因此任意量级的值都保持相同的相对精度。
+    """
+
+    def __init__(self, sub_buckets: int = 64) -> None:
+        self.sub_buckets = sub_buckets
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        if value <= 0:
+            return _ZERO_BUCKET
+        mantissa, exponent = math.frexp(value)  # mantissa ∈ [0.5, 1)
+        return exponent * self.sub_buckets + int(
+            (mantissa - 0.5) * 2 * self.sub_buckets
+        )
+
+    def _value(self, index: int) -> float:
+        """桶的中点"""
+        if index == _ZERO_BUCKET:
+            return 0.0
+        exponent, sub = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.sub_buckets), exponent)
+
+    def record(self, value: float) -> None:
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: Histogram) -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """第 q 分位数（0 < q <= 1）"""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+        }
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表：计数器、瞬时值和直方图，按 (指标名, 标签) 区分序列"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        with self._lock:
+            state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other: MetricsRegistry) -> None:
+        """
+        并入另一个注册表（如工作进程返回的）：计数器相加、直方图合并，
+        瞬时值以 other 的为准
+        """
+        state = other.__getstate__()
+        with self._lock:
+            for name, series in state["counters"].items():
+                target = self.counters.setdefault(name, {})
+                for labels, value in series.items():
+                    target[labels] = target.get(labels, 0) + value
+            for name, series in state["gauges"].items():
+                self.gauges.setdefault(name, {}).update(series)
+            for name, series in state["histograms"].items():
+                target_series = self.histograms.setdefault(name, {})
+                for labels, histogram in series.items():
+                    target = target_series.get(labels)
+                    if target is None:
+                        target = target_series[labels] = Histogram(
+                            histogram.sub_buckets
+                        )
+                    target.merge(histogram)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器加 value"""
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """设置瞬时值，如排队中的请求数"""
+        key = _labels(labels)
+        with self._lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """向直方图记录一个值"""
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.record(value)
+
+    def record_call(
+        self,
+        *,
+        phase: str,
+        player: str,
+        round_num: int,
+        model: str,
+        ttft: float,
+        gen: float,
+        total: float,
+        tokens: int,
+        chars: int,
+    ) -> None:
+        """记录一次 LLM 调用"""
+        labels = {"phase": phase, "player": player, "round": round_num, "model": model}
+        self.inc("llm_calls_total", **labels)
+        self.inc("llm_output_tokens_total", tokens, **labels)
+        self.inc("llm_output_chars_total", chars, **labels)
+        self.observe("llm_ttft_seconds", ttft, **labels)
+        self.observe("llm_generation_seconds", gen, **labels)
+        self.observe("llm_total_seconds", total, **labels)
+        if gen > 0:
+            self.observe("llm_tokens_per_second", tokens / gen, **labels)
+            self.observe("llm_chars_per_second", chars / gen, **labels)
+
+    def merged(self, name: str, group_by: tuple[str, ...]) -> dict[Labels, Histogram]:
+        """把直方图按 group_by 里的标签合并，例如只按 phase 汇总"""
+        result: dict[Labels, Histogram] = {}
+        with self._lock:
+            for labels, histogram in self.histograms.get(name, {}).items():
+                key = tuple(item for item in labels if item[0] in group_by)
+                target = result.get(key)
+                if target is None:
+                    target = result[key] = Histogram(histogram.sub_buckets)
+                target.merge(histogram)
+        return result
+
+    def summary(self, group_by: tuple[str, ...] = ("phase", "model")) -> dict:
+        """
+        JSON 可序列化的汇总：直方图按 group_by 合并后给出分位数，计数器按同样方式求和，
+        瞬时值原样输出
+        """
+        histograms = {
+            name: [
+                {"labels": dict(labels), **histogram.snapshot()}
+                for labels, histogram in self.merged(name, group_by).items()
+            ]
+            for name in list(self.histograms)
+        }
+        counters: dict[str, list[dict]] = {}
+        with self._lock:
+            for name, series in self.counters.items():
+                totals: dict[Labels, float] = {}
+                for labels, value in series.items():
+                    key = tuple(item for item in labels if item[0] in group_by)
+                    totals[key] = totals.get(key, 0) + value
+                counters[name] = [
+                    {"labels": dict(labels), "value": value}
+                    for labels, value in totals.items()
+                ]
+            gauges = {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for labels, value in series.items()
+                ]
+                for name, series in self.gauges.items()
+            }
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式；直方图以 summary 类型输出分位数"""
+        lines: list[str] = []
+        with self._lock:
+            for name, series in self.counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value!r}")
+            for name, series in self.gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value!r}")
+            for name, series in self.histograms.items():
+                lines.append(f"# TYPE {name} summary")
+                for labels, histogram in series.items():
+                    for q in QUANTILES:
+                        quantile_labels = labels + (("quantile", str(q)),)
+                        lines.append(
+                            f"{name}{_format_labels(quantile_labels)} "
+                            f"{histogram.quantile(q)!r}"
+                        )
+                    lines.append(
+                        f"{name}_sum{_format_labels(labels)} {histogram.sum!r}"
+                    )
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str | Path) -> None:
+        """按扩展名写出: .json 为 JSON 汇总，其余为 Prometheus 文本格式"""
+        path = Path(path)
+        if path.suffix == ".json":
+            text = json.dumps(self.summary(), ensure_ascii=False, indent=2)
+        else:
+            text = self.to_prometheus()
+        path.write_text(text, encoding="utf-8")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
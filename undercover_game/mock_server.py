@@ -0,0 +1,393 @@
+"""
+本地 OpenAI 兼容模拟服务
+
+实现 /v1/chat/completions（流式 SSE 与非流式）和 /v1/models，回复由规则生成，
+延迟按可配置的分布注入。把 OPENAI_API_BASE 指向它，undercover_game、langgraph、
+langchain 和 dspy 的示例脚本都能离线运行，并作为可复现的压测目标。
+
+启动:
+    uv run python -m undercover_game.mock_server --port 8000 --ttft 0.3 --tps 40
+    export OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock
+
+回复规则（依次尝试）:
+1. 配置文件里的 rules: 正则匹配最后一条用户消息，返回固定回复
+2. DSPy 的字段标记 [[ ## 字段 ## ]]: 按要求的输出字段逐个填充
+3. 谁是卧底的投票/描述提示词: 与 FakeLLM 相同，只投可选玩家
+请求带 JSON Schema 的 response_format 时，回复为符合该结构的 JSON。
+
+usage 的 prompt_tokens_details.cached_tokens 由与 FakeLLM 相同的 PrefixCache 模拟，
+可以用来检查提示词布局的前缀缓存命中率。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from .fake_llm import FakeLLM, PrefixCache
+
+# DSPy ChatAdapter 要求的输出字段，如 "[[ ## answer ## ]]"
+_DSPY_FIELD = re.compile(r"\[\[ ## (\w+) ## \]\]")
+
+
+@dataclass
+class LatencyProfile:
+    """
+    延迟和故障注入配置，可从 JSON 文件加载（键与字段同名）。
+
+    Attributes:
+        ttft: 首 token 延迟的中位数（秒）
+        ttft_sigma: 首 token 延迟的对数正态分布 sigma，0 表示固定值
+        tokens_per_second: 生成速度，0 表示不限速
+        chars_per_token: 每个 token（SSE chunk）的字符数
+        error_rate: 返回错误的概率
+        error_status: 注入错误时的 HTTP 状态码，如 429 或 500
+        timeout_rate: 首 token 前挂起 timeout_seconds 后断开的概率
+        timeout_seconds: 模拟超时的挂起时长
+        seed: 随机种子，相同的种子和请求顺序得到相同的延迟序列
+        rules: [{"match": 正则, "reply": 回复}]，优先于内置规则
+        cache_block_size: 模拟前缀缓存的块大小（token 数），usage 的
+            prompt_tokens_details.cached_tokens 为连续命中的前缀长度；0 表示关闭
+    """
+
+    ttft: float = 0.0
+    ttft_sigma: float = 0.0
+    tokens_per_second: float = 0.0
+    chars_per_token: int = 2
+    error_rate: float = 0.0
+    error_status: int = 500
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 60.0
+    seed: int | None = None
+    rules: list[dict[str, str]] = field(default_factory=list)
+    cache_block_size: int = 16
+
+    @classmethod
+    def load(cls, path: str) -> LatencyProfile:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"未知的配置项: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+
+class MockBackend:
+    """生成回复和延迟；多个请求线程共享，随机数由锁保护"""
+
+    def __init__(self, profile: LatencyProfile) -> None:
+        self.profile = profile
+        self.rules = [
+            (re.compile(rule["match"]), rule["reply"]) for rule in profile.rules
+        ]
+        self.fake = FakeLLM()
+        self.prefix_cache = (
+            PrefixCache(profile.cache_block_size) if profile.cache_block_size else None
+        )
+        self._rng = random.Random(profile.seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> tuple[str | None, float]:
+        """返回 (故障类型, 首 token 延迟)，故障类型为 None / "error" / "timeout" """
+        profile = self.profile
+        with self._lock:
+            roll = self._rng.random()
+            ttft = profile.ttft
+            if profile.ttft_sigma and ttft > 0:
+                ttft *= self._rng.lognormvariate(0.0, profile.ttft_sigma)
+        if roll < profile.error_rate:
+            return "error", ttft
+        if roll < profile.error_rate + profile.timeout_rate:
+            return "timeout", ttft
+        return None, ttft
+
+    def reply(
+        self, messages: list[dict[str, Any]], response_format: dict | None = None
+    ) -> str:
+        """按规则生成完整回复；指定 JSON Schema 时生成符合该结构的 JSON"""
+        text = "\n".join(
+            f"{message.get('role', '')}: {_content_text(message.get('content'))}"
+            for message in messages
+        )
+        if response_format and response_format.get("type") == "json_schema":
+            return self.fake.structured_reply(text, response_format)
+        last = _content_text(messages[-1].get("content")) if messages else ""
+        for pattern, reply in self.rules:
+            if pattern.search(last):
+                return reply
+        if "[[ ## completed ## ]]" in last:
+            # 输出字段列在最后一条消息的末尾，跳过前面作为输入的字段
+            tail = last.rsplit("Respond with the corresponding output fields", 1)[-1]
+            names = [
+                name
+                for name in dict.fromkeys(_DSPY_FIELD.findall(tail))
+                if name != "completed"
+            ]
+            body = "".join(
+                f"[[ ## {name} ## ]]\n{self.fake.reply(text)}\n\n" for name in names
+            )
+            return f"{body}[[ ## completed ## ]]"
+        return self.fake.reply(text)
+
+    def cached_tokens(self, prompt: str) -> int:
+        """提示词命中前缀缓存的 token 数（1 个字符算 1 个 token）"""
+        if self.prefix_cache is None:
+            return 0
+        with self._lock:
+            return self.prefix_cache.lookup(prompt)
+
+    def pieces(self, reply: str, request: dict[str, Any]) -> list[str]:
+        """按 stop 和 max_tokens 截断后切成 token"""
+        stop = request.get("stop") or ()
+        for s in [stop] if isinstance(stop, str) else stop:
+            reply = reply.split(s, 1)[0]
+        size = max(1, self.profile.chars_per_token)
+        pieces = [reply[i : i + size] for i in range(0, len(reply), size)]
+        max_tokens = request.get("max_tokens") or request.get("max_completion_tokens")
+        if max_tokens:
+            pieces = pieces[:max_tokens]
+        return pieces
+
+
+def _content_text(content: Any) -> str:
+    """消息内容可能是字符串或 [{"type": "text", "text": ...}] 列表"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content or ""
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """处理单个 HTTP 请求；backend 由 make_server() 挂在 server 上"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": []})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        backend: MockBackend = self.server.backend
+        fault, ttft = backend.sample()
+        if fault == "timeout":
+            time.sleep(backend.profile.timeout_seconds)
+            self.close_connection = True
+            return
+        if fault == "error":
+            time.sleep(ttft)
+            status = backend.profile.error_status
+            self._send_json(
+                status,
+                {
+                    "error": {
+                        "message": "injected error",
+                        "type": "mock",
+                        "code": status,
+                    }
+                },
+                headers={"Retry-After": "1"} if status == 429 else None,
+            )
+            return
+
+        messages = request.get("messages") or []
+        reply = backend.reply(messages, request.get("response_format"))
+        pieces = backend.pieces(reply, request)
+        prompt = "".join(_content_text(message.get("content")) for message in messages)
+        prompt_tokens = len(prompt)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_tokens + len(pieces),
+            "prompt_tokens_details": {"cached_tokens": backend.cached_tokens(prompt)},
+        }
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+        }
+        if request.get("stream"):
+            self._stream(base, pieces, usage, ttft, request)
+        else:
+            time.sleep(ttft + self._generation_time(len(pieces)))
+            self._send_json(
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": "".join(pieces),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+
+    def _generation_time(self, tokens: int) -> float:
+        tps = self.server.backend.profile.tokens_per_second
+        return max(0, tokens - 1) / tps if tps else 0.0
+
+    def _stream(
+        self,
+        base: dict[str, Any],
+        pieces: list[str],
+        usage: dict[str, int],
+        ttft: float,
+        request: dict[str, Any],
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        tps = self.server.backend.profile.tokens_per_second
+        include_usage = (request.get("stream_options") or {}).get("include_usage")
+
+        def chunk(delta: dict, finish: str | None = None, **extra: Any) -> None:
+            payload = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                **extra,
+            }
+            self._write_event(json.dumps(payload, ensure_ascii=False))
+
+        try:
+            time.sleep(ttft)
+            chunk({"role": "assistant", "content": ""})
+            for i, piece in enumerate(pieces):
+                if i and tps:
+                    time.sleep(1 / tps)
+                chunk({"content": piece})
+            chunk({}, "stop")
+            if include_usage:
+                self._write_event(
+                    json.dumps(
+                        {
+                            **base,
+                            "object": "chat.completion.chunk",
+                            "choices": [],
+                            "usage": usage,
+                        }
+                    )
+                )
+            self._write_event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束（如 AIPlayer 拿到完整投票后关闭流）
+            pass
+
+    def _write_event(self, data: str) -> None:
+        self.wfile.write(f"data: {data}\n\n".encode())
+        self.wfile.flush()
+
+    def _send_json(
+        self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None
+    ) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(
+    profile: LatencyProfile | None = None,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """
+    创建模拟服务（尚未开始监听请求）。
+
+    port 为 0 时由系统分配端口，可从 server.server_address 读取。
+    在后台运行: threading.Thread(target=server.serve_forever, daemon=True).start()
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.backend = MockBackend(profile or LatencyProfile())
+    server.verbose = verbose
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--profile", help="JSON 配置文件，命令行参数会覆盖其中的值")
+    parser.add_argument("--ttft", type=float, help="首 token 延迟中位数（秒）")
+    parser.add_argument(
+        "--ttft-sigma", type=float, help="首 token 延迟的对数正态 sigma"
+    )
+    parser.add_argument("--tps", type=float, help="每秒生成 token 数")
+    parser.add_argument("--error-rate", type=float, help="注入错误的概率")
+    parser.add_argument("--error-status", type=int, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--timeout-rate", type=float, help="注入超时的概率")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument(
+        "--cache-block", type=int, help="前缀缓存块大小（token 数），0 表示关闭"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印请求日志")
+    args = parser.parse_args()
+
+    profile = LatencyProfile.load(args.profile) if args.profile else LatencyProfile()
+    overrides = {
+        "ttft": args.ttft,
+        "ttft_sigma": args.ttft_sigma,
+        "tokens_per_second": args.tps,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "timeout_rate": args.timeout_rate,
+        "seed": args.seed,
+        "cache_block_size": args.cache_block,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(profile, name, value)
+
+    server = make_server(profile, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"模拟服务已启动: http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
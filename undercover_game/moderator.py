@@ -0,0 +1,150 @@
+"""
+主持人投票模式
+
+一次结构化输出请求代替所有存活玩家投票：请求中列出每位玩家的词语和可选对象，
+回复为 {投票者: 被投票者} 的 JSON，N 次调用变成 1 次。解析严格按 JSON Schema
+校验，缺失或不合法的票由游戏退回逐个玩家投票。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from .metrics import MetricsRegistry
+from .players import AIPlayer
+from .prompts import (
+    ballots_schema,
+    build_messages,
+    json_schema_format,
+    moderator_segment,
+    moderator_task,
+)
+from .sinks import EventSink
+
+
+def parse_ballots(
+    response: str, ballots: dict[str, list[str]]
+) -> dict[str, str] | None:
+    """
+    严格解析主持人的回复。
+
+    回复必须整体是一个 JSON 对象，否则返回 None；只保留投票者合法、
+    取值在其可选玩家内的票。
+    """
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {
+        voter: data[voter]
+        for voter, options in ballots.items()
+        if isinstance(data.get(voter), str) and data[voter] in options
+    }
+
+
+class Moderator(AIPlayer):
+    """
+    主持人：复用 AIPlayer 的流式调用、计时和事件输出，但一次代替所有人投票。
+
+    Args:
+        roster: 全部玩家的 (玩家名, 词语)，按座位顺序
+        llm / sink / metrics: 同 AIPlayer
+    """
+
+    NAME = "主持人"
+    # 每张票大约需要的 token 数（键、值和标点）
+    TOKENS_PER_BALLOT = 16
+
+    def __init__(
+        self,
+        roster: list[tuple[str, str]],
+        llm: Any = None,
+        sink: EventSink | None = None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        super().__init__(self.NAME, "", False, llm=llm, sink=sink, metrics=metrics)
+        self._segment = moderator_segment(roster)
+        self._round = 0
+
+    def call_round(self, phase: str) -> int:
+        return self._round
+
+    def _ballots_request(
+        self,
+        round_num: int,
+        ballots: dict[str, list[str]],
+        all_descriptions: dict[str, list[str]],
+    ) -> tuple[list, dict[str, Any]]:
+        self._round = round_num
+        prompt = build_messages(
+            self._segment,
+            self.transcript.sync(all_descriptions),
+            moderator_task(ballots),
+            self.transcript.max_prompt_tokens,
+        )
+        kwargs = {
+            "max_tokens": self.TOKENS_PER_BALLOT * len(ballots) + 8,
+            "response_format": json_schema_format("votes", ballots_schema(ballots)),
+        }
+        return prompt, kwargs
+
+    def vote_all(
+        self,
+        round_num: int,
+        ballots: dict[str, list[str]],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
+    ) -> dict[str, str]:
+        """
+        一次请求得到所有投票者的票。
+
+        Args:
+            round_num: 当前轮数
+            ballots: 投票者 -> 可选玩家
+            all_descriptions: 所有玩家的描述
+            live: 是否逐 token 实时输出
+
+        Returns:
+            解析成功的票；回复不合法时为空字典
+        """
+        prompt, kwargs = self._ballots_request(round_num, ballots, all_descriptions)
+        response = self._stream(prompt, "vote_batch", live=live, **kwargs)
+        return self._count(response, ballots)
+
+    async def avote_all(
+        self,
+        round_num: int,
+        ballots: dict[str, list[str]],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
+    ) -> dict[str, str]:
+        """vote_all 的异步版本"""
+        prompt, kwargs = self._ballots_request(round_num, ballots, all_descriptions)
+        response = await self._astream(prompt, "vote_batch", live=live, **kwargs)
+        return self._count(response, ballots)
+
+    def _count(self, response: str, ballots: dict[str, list[str]]) -> dict[str, str]:
+        """解析回复并记录成功、缺票和省下的调用数"""
+        votes = parse_ballots(response, ballots)
+        if votes is None:
+            votes = {}
+            outcome = "malformed"
+        else:
+            outcome = "ok" if len(votes) == len(ballots) else "partial"
+        fallbacks = len(ballots) - len(votes)
+        if self.metrics is not None:
+            self.metrics.inc("vote_batch_total", outcome=outcome)
+            self.metrics.inc("vote_batch_fallbacks_total", fallbacks)
+            # 与逐个投票相比少发的请求数（退回逐个投票的票照样要单独请求）
+            self.metrics.inc("vote_calls_saved_total", max(0, len(votes) - 1))
+        self.sink.emit(
+            "vote_batch",
+            round=self._round,
+            outcome=outcome,
+            voters=len(ballots),
+            fallbacks=fallbacks,
+        )
+        return votes
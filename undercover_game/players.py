@@ -6,19 +6,67 @@ AI 玩家模块
 
 from __future__ import annotations
 
+import json
 import os
 import re
 import time
+from collections.abc import Callable
+from contextlib import aclosing, closing
+from typing import Any
 
+from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI
 
+from .cache import CachedLLM, ResponseCache
+from .governor import GovernedLLM, RateGovernor
+from .hedging import HedgedLLM, HedgePolicy
+from .metrics import MetricsRegistry
+from .prompts import (
+    Transcript,
+    build_messages,
+    describe_task,
+    json_schema_format,
+    player_segment,
+    structured_vote_task,
+    vote_schema,
+    vote_task,
+)
+from .sinks import ConsoleSink, EventSink
 
 # 全局共享的 LLM 实例
 _global_llm = None
 
+# 共享实例的限流器（排队、退避）和对冲请求（对冲次数、胜出次数）的指标:
+# 多局共用同一个实例，指标按进程统计，不写入任何一局的注册表；
+# 需要时用 LLM_METRICS.dump() 单独导出
+LLM_METRICS = MetricsRegistry()
 
-def get_llm() -> ChatOpenAI:
-    """获取 LLM 实例 (单例模式)"""
+# 描述的句末标点
+_SENTENCE_END = re.compile(r"[。！？!?\n]")
+
+# 玩家名: "玩家" 加上字母序号，见 player_name
+_PLAYER_NAME = re.compile(r"玩家[A-Z0-9]+")
+
+
+def player_name(index: int) -> str:
+    """第 index 个座位（从 0 开始）的玩家名: 玩家A..玩家Z, 玩家AA..玩家AZ, 玩家BA.."""
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return f"玩家{letters}"
+
+
+def get_llm() -> ChatOpenAI | GovernedLLM | HedgedLLM | CachedLLM:
+    """
+    获取 LLM 实例 (单例模式)
+
+    设置了 LLM_MAX_RPM / LLM_MAX_TPM / LLM_MAX_CONCURRENCY 时，所有请求经过
+    进程内共享的 RateGovernor；设置了 LLM_HEDGE_QUANTILE 时，首 token 超过该分位数
+    的 TTFT 仍未到达就发起对冲请求；设置了 LLM_CACHE_PATH 时，再包上本地响应缓存。
+    限流器和对冲请求的指标写入进程级的 LLM_METRICS。
+    """
     global _global_llm
     if _global_llm is not None:
         return _global_llm
@@ -28,26 +76,92 @@ def get_llm() -> ChatOpenAI:
     if not api_key:
         raise ValueError("请设置环境变量 OPENAI_API_KEY")
 
-    _global_llm = ChatOpenAI(
+    governor = RateGovernor.from_env(LLM_METRICS)
+    llm = ChatOpenAI(
         api_key=api_key,
         base_url=base_url,
         model="glm-4-flash",
         streaming=True,
+        # 流式输出的最后一个 chunk 带上 usage，用于统计提示词缓存命中
+        stream_usage=True,
         timeout=30,
+        # 限流时由 RateGovernor 统一退避重试（429、5xx、超时和连接错误）
+        max_retries=0 if governor is not None else 2,
     )
+    if governor is not None:
+        llm = GovernedLLM(llm, governor)
+    hedge_quantile = os.getenv("LLM_HEDGE_QUANTILE")
+    if hedge_quantile:
+        # 对冲请求同样经过限流
+        llm = HedgedLLM(
+            llm, HedgePolicy(quantile=float(hedge_quantile)), metrics=LLM_METRICS
+        )
+    cache_path = os.getenv("LLM_CACHE_PATH")
+    if cache_path:
+        # 缓存在限流之外: 命中时不占用额度
+        llm = CachedLLM(llm, ResponseCache(cache_path))
+    _global_llm = llm
     return _global_llm
 
 
 class AIPlayer:
     """AI 玩家类"""
 
-    def __init__(self, name: str, word: str, is_undercover: bool) -> None:
+    # 描述只要一句话: 服务端在第一个句号处停止，客户端遇到其他句末标点或
+    # 超过字数上限时关闭流
+    DESCRIBE_MAX_CHARS = 40
+    DESCRIBE_MAX_TOKENS = 64
+    DESCRIBE_STOP = ("。",)
+    # 投票只需要一个玩家名，收到合法玩家名即关闭流
+    VOTE_MAX_TOKENS = 16
+    # 结构化投票只需要 {"vote": "玩家名"}，收到右花括号即关闭流
+    STRUCTURED_VOTE_MAX_TOKENS = 16
+
+    def __init__(
+        self,
+        name: str,
+        word: str,
+        is_undercover: bool,
+        llm: Any = None,
+        sink: EventSink | None = None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        """
+        Args:
+            name: 玩家名
+            word: 分配到的词语
+            is_undercover: 是否为卧底
+            llm: 提供 stream / astream 的 LLM，默认使用 get_llm() 的共享实例
+            sink: 事件输出，默认逐 token 打印到终端；批量模拟时传入 NullSink
+            metrics: 记录每次调用耗时的指标注册表，默认不记录
+        """
         self.name = name
         self.word = word
         self.is_undercover = is_undercover
-        self.is_alive = True
         self.descriptions: list[str] = []
-        self.llm = get_llm()
+        self.llm = llm if llm is not None else get_llm()
+        self.sink = sink if sink is not None else ConsoleSink()
+        self.metrics = metrics
+        # 每次 LLM 调用的 (阶段, TTFT, 总耗时)，单位秒
+        self.timings: list[tuple[str, float, float]] = []
+        # 每次 LLM 调用的 (阶段, 轮数, 提示词 token 数, 命中缓存的 token 数)
+        self.prompt_usage: list[tuple[str, int, int, int]] = []
+        # 投票时使用 JSON Schema 结构化输出（可选玩家为枚举），由游戏按需开启
+        self.structured_votes = False
+        self._style: str | None = None
+        self._segment = player_segment(name, word)
+        # 同一局的玩家看到的历史相同，游戏会让所有玩家共用一个 Transcript
+        self.transcript = Transcript()
+
+    @property
+    def style(self) -> str | None:
+        """提示词中的发言风格说明（比较提示词变体时使用），应在第一次调用前设置"""
+        return self._style
+
+    @style.setter
+    def style(self, style: str | None) -> None:
+        self._style = style
+        self._segment = player_segment(self.name, self.word, style)
 
     def describe(self, round_num: int, all_descriptions: dict[str, list[str]]) -> str:
         """
@@ -60,47 +174,30 @@ class AIPlayer:
         Returns:
             本轮描述
         """
-        # 构建历史描述上下文
-        history = ""
-        if all_descriptions:
-            history = "\n之前各玩家的描述:\n"
-            for player_name, descs in all_descriptions.items():
-                if descs:
-                    history += f"  {player_name}: {'; '.join(descs)}\n"
-
-        prompt = f"""你正在玩"谁是卧底"游戏。
-你的词语是: {self.word}
-
-游戏规则:
-- 你需要用一句话描述你的词语，但不能直接说出这个词
-- 描述要足够准确让同伴认出你，但又不能太明显让卧底发现
-- 如果你是卧底，你需要让描述足够模糊，不被发现
-{history}
-这是第 {round_num} 轮。请给出你的描述（一句话，10-20字左右）:"""
-
-        print(f"{self.name}: ", end="", flush=True)
-        start_time = time.time()
-        first_token_time = None
-        full_response = ""
-
-        for chunk in self.llm.stream(prompt):
-            if first_token_time is None and chunk.content:
-                first_token_time = time.time()
-
-            content = chunk.content
-            print(content, end="", flush=True)
-            full_response += content
+        prompt = self._describe_prompt(round_num, all_descriptions)
+        full_response = self._stream(
+            prompt,
+            "describe",
+            until=self._describe_until,
+            max_tokens=self.DESCRIBE_MAX_TOKENS,
+            stop=list(self.DESCRIBE_STOP),
+        )
 
-        end_time = time.time()
+        description = full_response.strip()
+        self.descriptions.append(description)
+        return description
 
-        ttft = (first_token_time - start_time) if first_token_time else 0
-        gen_time = (
-            (end_time - first_token_time)
-            if first_token_time
-            else (end_time - start_time)
-        )
-        print(
-            f" (TTFT: {ttft:.2f}s, 生成: {gen_time:.2f}s, 总计: {end_time - start_time:.2f}s)"
+    async def adescribe(
+        self, round_num: int, all_descriptions: dict[str, list[str]]
+    ) -> str:
+        """describe 的异步版本，基于 llm.astream"""
+        prompt = self._describe_prompt(round_num, all_descriptions)
+        full_response = await self._astream(
+            prompt,
+            "describe",
+            until=self._describe_until,
+            max_tokens=self.DESCRIBE_MAX_TOKENS,
+            stop=list(self.DESCRIBE_STOP),
         )
 
         description = full_response.strip()
@@ -108,7 +205,10 @@ class AIPlayer:
         return description
 
     def vote(
-        self, alive_players: list[str], all_descriptions: dict[str, list[str]]
+        self,
+        alive_players: list[str],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
     ) -> str:
         """
         投票选出最可疑的玩家。
@@ -116,42 +216,278 @@ class AIPlayer:
         Args:
             alive_players: 存活玩家列表（不包含自己）
             all_descriptions: 所有玩家的描述
+            live: 是否逐 token 实时输出；并发投票时设为 False，整行一次性输出
 
         Returns:
             被投票玩家的名字
         """
-        # 构建描述信息
-        desc_info = ""
-        for player_name in alive_players:
-            if player_name in all_descriptions:
-                descs = all_descriptions[player_name]
-                desc_info += f"  {player_name}: {'; '.join(descs)}\n"
+        prompt, llm_kwargs = self._vote_request(alive_players, all_descriptions)
+        full_response = self._stream(prompt, "vote", live=live, **llm_kwargs)
+        return self._parse_vote(full_response, alive_players)
+
+    async def avote(
+        self,
+        alive_players: list[str],
+        all_descriptions: dict[str, list[str]],
+        live: bool = True,
+    ) -> str:
+        """vote 的异步版本，基于 llm.astream"""
+        prompt, llm_kwargs = self._vote_request(alive_players, all_descriptions)
+        full_response = await self._astream(prompt, "vote", live=live, **llm_kwargs)
+        return self._parse_vote(full_response, alive_players)
+
+    def _describe_prompt(
+        self, round_num: int, all_descriptions: dict[str, list[str]]
+    ) -> list[BaseMessage]:
+        """构建描述阶段的提示词"""
+        history = self.transcript.sync(all_descriptions)
+        return build_messages(
+            self._segment,
+            history,
+            describe_task(round_num),
+            self.transcript.max_prompt_tokens,
+        )
+
+    def _vote_request(
+        self, alive_players: list[str], all_descriptions: dict[str, list[str]]
+    ) -> tuple[list[BaseMessage], dict[str, Any]]:
+        """构建投票阶段的提示词和 _stream 参数"""
+        history = self.transcript.sync(all_descriptions)
+        if self.structured_votes:
+            task = structured_vote_task(alive_players)
+            llm_kwargs = {
+                "until": self._json_until,
+                "max_tokens": self.STRUCTURED_VOTE_MAX_TOKENS,
+                "response_format": json_schema_format(
+                    "vote", vote_schema(alive_players)
+                ),
+            }
+        else:
+            task = vote_task(alive_players)
+            llm_kwargs = {
+                "until": self._vote_until(alive_players),
+                "max_tokens": self.VOTE_MAX_TOKENS,
+            }
+        prompt = build_messages(
+            self._segment, history, task, self.transcript.max_prompt_tokens
+        )
+        return prompt, llm_kwargs
+
+    def _describe_until(self, text: str) -> int | None:
+        """描述的提前结束位置: 第一个句末标点之后，或字数上限处"""
+        start = len(text) - len(text.lstrip())
+        match = _SENTENCE_END.search(text, start)
+        if match:
+            return match.end()
+        if len(text) - start >= self.DESCRIBE_MAX_CHARS:
+            return start + self.DESCRIBE_MAX_CHARS
+        return None
+
+    @staticmethod
+    def _vote_until(alive_players: list[str]) -> Callable[[str], int | None]:
+        """投票的提前结束条件: 回复中第一次出现合法玩家名时，截断到该名字末尾"""
+        options = set(alive_players)
+        longest = max(map(len, alive_players), default=0)
+
+        def until(text: str) -> int | None:
+            for match in _PLAYER_NAME.finditer(text):
+                # 名字在文本末尾时可能还没收全（"玩家A" 后面还有 "B"），
+                # 除非已经和最长的可选名字一样长
+                if match.end() == len(text) and len(match.group()) < longest:
+                    return None
+                if match.group() in options:
+                    return match.end()
+            return None
+
+        return until
+
+    @staticmethod
+    def _json_until(text: str) -> int | None:
+        """结构化投票的提前结束位置: 第一个右花括号之后（回复只有一层对象）"""
+        end = text.find("}")
+        return end + 1 if end >= 0 else None
+
+    def _parse_vote(self, response: str, alive_players: list[str]) -> str:
+        """
+        从回复中解析被投票的玩家。
 
-        prompt = f"""你正在玩"谁是卧底"游戏。
-你的词语是: {self.word}
-你的名字是: {self.name}
+        结构化投票先按 JSON 解析；解析失败时和普通投票一样在文本中找玩家名，
+        都找不到时投给第一个可选玩家。两种情况分别计入
+        vote_parse_failures_total 和 vote_fallbacks_total。
+        """
+        mode = "structured" if self.structured_votes else "text"
+        vote = response.strip()
+
+        if self.structured_votes:
+            try:
+                data = json.loads(vote)
+            except json.JSONDecodeError:
+                data = None
+            if isinstance(data, dict) and data.get("vote") in alive_players:
+                return data["vote"]
+            self._count_vote("vote_parse_failures_total", mode)
+
+        # 回复中第一个合法的完整玩家名（"玩家A" 不会误匹配 "玩家AB"）
+        for match in _PLAYER_NAME.finditer(vote):
+            if match.group() in alive_players:
+                return match.group()
 
-各玩家的描述:
-{desc_info}
-请分析谁最可疑，选择一个玩家投票淘汰。
-可选玩家: {", ".join(alive_players)}
+        # 默认返回第一个可选玩家
+        if not self.structured_votes:
+            self._count_vote("vote_parse_failures_total", mode)
+        self._count_vote("vote_fallbacks_total", mode)
+        return alive_players[0] if alive_players else ""
 
-请只回复一个玩家的名字（如: 玩家A）:"""
+    def _count_vote(self, name: str, mode: str) -> None:
+        if self.metrics is not None:
+            self.metrics.inc(name, mode=mode, player=self.name)
+
+    def _stream(
+        self,
+        prompt: list[BaseMessage],
+        phase: str,
+        live: bool = True,
+        until: Callable[[str], int | None] | None = None,
+        **llm_kwargs: Any,
+    ) -> str:
+        """
+        流式调用 LLM，向 sink 发送 token 和耗时统计事件。
 
-        print(f"  > {self.name} 正在投票: ", end="", flush=True)
-        start_time = time.time()
-        first_token_time = None
-        full_response = ""
+        Args:
+            prompt: 提示词
+            phase: 调用阶段，"describe" 或 "vote"
+            live: 是否实时展示；并发调用时为 False，终端输出在结束时整行打印，
+                避免多个玩家的输出交错
+            until: 提前结束条件，传入已收到的文本，返回截断位置时立即关闭流
+            **llm_kwargs: 透传给 llm.stream 的参数，如 max_tokens / stop
 
-        for chunk in self.llm.stream(prompt):
-            if first_token_time is None and chunk.content:
-                first_token_time = time.time()
+        Returns:
+            完整回复
+        """
+        call = _StreamCall(self, phase, live, until, llm_kwargs)
+        # 关闭生成器会中断底层 HTTP 流，服务端随之停止生成
+        with closing(self.llm.stream(prompt, **llm_kwargs)) as stream:
+            for chunk in stream:
+                if call.feed(chunk):
+                    break
+        return call.finish()
+
+    async def _astream(
+        self,
+        prompt: list[BaseMessage],
+        phase: str,
+        live: bool = True,
+        until: Callable[[str], int | None] | None = None,
+        **llm_kwargs: Any,
+    ) -> str:
+        """_stream 的异步版本"""
+        call = _StreamCall(self, phase, live, until, llm_kwargs)
+        async with aclosing(self.llm.astream(prompt, **llm_kwargs)) as stream:
+            async for chunk in stream:
+                if call.feed(chunk):
+                    break
+        return call.finish()
+
+    def call_round(self, phase: str) -> int:
+        """本次调用所属的轮数，用作指标标签"""
+        # describe 在本次调用结束后才记录描述，因此轮数要加 1
+        return len(self.descriptions) + (phase == "describe")
 
-            content = chunk.content
-            print(content, end="", flush=True)
-            full_response += content
+    def __repr__(self) -> str:
+        role = "卧底" if self.is_undercover else "平民"
+        return f"AIPlayer({self.name}, {role})"
+
+
+# 玩家类型 -> 玩家类；构造参数为 (name, word, is_undercover, llm=, sink=, metrics=)，
+# 存活状态由游戏状态中的 PlayerRecord 维护
+PLAYER_KINDS: dict[str, type] = {"ai": AIPlayer}
+
+
+def player_class(kind: str) -> type:
+    """
+    按玩家类型取得玩家类。
+
+    "heuristic" 在第一次用到时才导入（依赖 numpy），不用启发式玩家时不付出导入开销。
+
+    Raises:
+        KeyError: 未知的玩家类型
+    """
+    if kind == "heuristic" and kind not in PLAYER_KINDS:
+        from . import heuristic  # noqa: F401  导入时注册到 PLAYER_KINDS
+    return PLAYER_KINDS[kind]
+
+
+def _model_name(llm: Any) -> str:
+    """LLM 的模型名，用作指标标签"""
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", "unknown"))
+
+
+class _StreamCall:
+    """一次流式调用的状态：计时、事件输出、提前结束和 token 用量"""
+
+    def __init__(
+        self,
+        player: AIPlayer,
+        phase: str,
+        live: bool,
+        until: Callable[[str], int | None] | None,
+        llm_kwargs: dict[str, Any],
+    ) -> None:
+        self.player = player
+        self.phase = phase
+        self.live = live
+        self.until = until
+        self.max_tokens = llm_kwargs.get("max_tokens")
+        self.text = ""
+        self.chunks = 0
+        self.stopped = False
+        self.usage: dict | None = None
+        self.start_time = time.time()
+        self.first_token_time: float | None = None
+        player.sink.emit("call_start", player=player.name, phase=phase, live=live)
+
+    def feed(self, chunk: Any) -> bool:
+        """
+        处理一个 chunk，返回 True 表示满足提前结束条件，应立即关闭流。
 
+        OpenAI 兼容服务在全部内容之后才单独发送 usage，提前关闭的调用通常拿不到，
+        提示词用量记为未知（见 finish）；限流器按预估的 token 数结算。
+        """
+        if chunk.usage_metadata:
+            self.usage = chunk.usage_metadata
+        content = chunk.content
+        if content:
+            self.chunks += 1
+            self._append(content)
+        return self.stopped
+
+    def _append(self, content: str) -> None:
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.text += content
+        cut = self.until(self.text) if self.until else None
+        if cut is not None:
+            # 截掉结束位置之后的部分，只输出保留的内容
+            content = content[: len(content) - (len(self.text) - cut)]
+            self.text = self.text[:cut]
+            self.stopped = True
+        self.player.sink.emit(
+            "token",
+            player=self.player.name,
+            phase=self.phase,
+            live=self.live,
+            text=content,
+        )
+
+    def finish(self) -> str:
+        """
+        记录本次调用的 TTFT / 生成 / 总耗时、token 用量和提前结束节省量；
+        没有收到 usage 时计入 llm_usage_unknown_total
+        """
+        player = self.player
         end_time = time.time()
+        start_time = self.start_time
+        first_token_time = self.first_token_time
 
         ttft = (first_token_time - start_time) if first_token_time else 0
         gen_time = (
@@ -159,26 +495,53 @@ class AIPlayer:
             if first_token_time
             else (end_time - start_time)
         )
-        print(
-            f" [完成] (TTFT: {ttft:.2f}s, 生成: {gen_time:.2f}s, 总计: {end_time - start_time:.2f}s)",
-            flush=True,
+        player.timings.append((self.phase, ttft, end_time - start_time))
+        round_num = player.call_round(self.phase)
+        usage = self.usage
+        if player.metrics is not None:
+            tokens = usage.get("output_tokens", 0) if usage else self.chunks
+            player.metrics.record_call(
+                phase=self.phase,
+                player=player.name,
+                round_num=round_num,
+                model=_model_name(player.llm),
+                ttft=ttft,
+                gen=gen_time,
+                total=end_time - start_time,
+                tokens=tokens or self.chunks,
+                chars=len(self.text),
+            )
+        if usage:
+            cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+            prompt_tokens = usage.get("input_tokens", 0)
+            player.prompt_usage.append((self.phase, round_num, prompt_tokens, cached))
+            if player.metrics is not None:
+                player.metrics.observe(
+                    "llm_prompt_tokens",
+                    prompt_tokens,
+                    phase=self.phase,
+                    round=round_num,
+                )
+        elif player.metrics is not None:
+            # 提前关闭或服务端不返回 usage: 不猜测提示词用量，只计数
+            player.metrics.inc("llm_usage_unknown_total", phase=self.phase)
+
+        saved_tokens = saved_ms = None
+        if self.stopped and self.max_tokens:
+            # 按 1 个 chunk ≈ 1 个 token 估算: 最多还会生成到 max_tokens，
+            # 按本次的平均生成速度换算成毫秒
+            saved_tokens = max(0, self.max_tokens - self.chunks)
+            saved_ms = saved_tokens * gen_time / max(1, self.chunks - 1) * 1000
+        player.sink.emit(
+            "call_end",
+            player=player.name,
+            phase=self.phase,
+            live=self.live,
+            text=self.text,
+            ttft=ttft,
+            gen=gen_time,
+            total=end_time - start_time,
+            saved_tokens=saved_tokens,
+            saved_ms=saved_ms,
         )
-        vote = full_response.strip()
-
-        # 尝试从回复中提取玩家名
-        for player in alive_players:
-            if player in vote:
-                return player
-
-        # 如果无法匹配，检查是否包含 "玩家" + 字母/数字
-        match = re.search(r"玩家[A-Z0-9]", vote)
-        if match and match.group() in alive_players:
-            return match.group()
-
-        # 默认返回第一个可选玩家
-        return alive_players[0] if alive_players else ""
-
-    def __repr__(self) -> str:
-        status = "存活" if self.is_alive else "淘汰"
-        role = "卧底" if self.is_undercover else "平民"
-        return f"AIPlayer({self.name}, {role}, {status})"
+        return self.text
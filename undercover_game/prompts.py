@@ -0,0 +1,303 @@
+"""
+谁是卧底提示词
+
+提示词按缓存友好的顺序拼接:
+1. 系统规则: 所有玩家、所有轮次完全相同
+2. 玩家信息: 同一玩家每次相同
+3. 历史描述: 只在末尾追加，不会改写已有内容
+4. 本次任务: 每次调用不同，放在最后
+
+这样同一玩家相邻两次调用的前缀只会变长，OpenAI 兼容服务的前缀缓存可以命中。
+设置 HistoryPolicy 后，较早的轮次在每轮开始时折叠成摘要，历史只在这时改写一次。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+from itertools import compress
+from operator import ne
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+RULES = """你正在玩"谁是卧底"游戏。
+
+游戏规则:
+- 每名玩家拿到一个词语，平民的词语相同，卧底的词语与之相近但不同
+- 描述阶段: 用一句话描述你的词语，但不能直接说出这个词
+- 描述要足够准确让同伴认出你，但又不能太明显让卧底发现
+- 如果你是卧底，你需要让描述足够模糊，不被发现
+- 投票阶段: 根据所有描述，投票淘汰最可疑的玩家"""
+
+SYSTEM_MESSAGE = SystemMessage(content=RULES)
+
+_HISTORY_HEADER = "\n各玩家的描述:\n"
+
+
+def clip_summary(name: str, descriptions: list[str]) -> str:
+    """默认的玩家摘要: 最近 3 条较早描述，每条取前 16 个字"""
+    return "；".join(desc[:16] for desc in descriptions[-3:])
+
+
+@dataclass(frozen=True)
+class HistoryPolicy:
+    """
+    历史描述的上下文预算。
+
+    Args:
+        recent_rounds: 最近几轮保留原文，更早的轮次折叠进每个玩家的摘要
+        max_prompt_tokens: 每次提示词的 token 上限（按 1 个字符 ≈ 1 个 token 估算），
+            超出时从最早的历史开始按行裁掉；None 表示不限
+        summarize: (玩家名, 该玩家被折叠的全部描述) -> 摘要。每轮折叠时只对有新描述
+            被折叠的玩家调用一次，结果缓存；默认为 clip_summary
+    """
+
+    recent_rounds: int = 2
+    max_prompt_tokens: int | None = None
+    summarize: Callable[[str, list[str]], str] = clip_summary
+
+
+class Transcript:
+    """
+    按时间顺序增量构建的历史描述文本。
+
+    sync 只处理上次之后新增的描述，已生成的文本不再重新拼接。
+    同一局的多个玩家可以共用一个实例（并发投票时会在多个线程中调用）。
+
+    Args:
+        policy: 上下文预算，默认保留全部原文
+    """
+
+    def __init__(self, policy: HistoryPolicy | None = None) -> None:
+        self.policy = policy
+        self._lock = threading.Lock()
+        # 上次 sync 时各玩家（按 all_descriptions 的键顺序）已记录的描述数
+        self._names: list[str] = []
+        self._counts: list[int] = []
+        self._text = ""
+        # 以下只在有 policy 时使用
+        # 未折叠的轮次: 轮数 -> 该轮的 (玩家名, 描述)
+        self._rounds: dict[int, list[tuple[str, str]]] = {}
+        self._recent = ""
+        # 已折叠到第几轮，以及每个玩家被折叠的描述和缓存的摘要
+        self._folded_through = 0
+        self._folded: dict[str, list[str]] = {}
+        self._summaries: dict[str, str] = {}
+        self._summary = ""
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def max_prompt_tokens(self) -> int | None:
+        return self.policy.max_prompt_tokens if self.policy is not None else None
+
+    def sync(self, all_descriptions: dict[str, list[str]]) -> str:
+        """
+        追加 all_descriptions 中尚未记录的描述。
+
+        Args:
+            all_descriptions: 玩家名 -> 描述列表，列表下标 i 对应第 i + 1 轮
+
+        Returns:
+            最新的历史文本
+        """
+        # 每次调用都要看一遍所有玩家，比较描述数只用内置函数，人数多时也很快
+        counts = list(map(len, all_descriptions.values()))
+        with self._lock:
+            if counts != self._counts:
+                new_entries = self._new_entries(all_descriptions, counts)
+                if self.policy is None:
+                    self._text += "".join(
+                        _history_line(i + 1, name, desc)
+                        for i, _, name, desc in new_entries
+                    )
+                elif new_entries:
+                    self._apply_policy(new_entries)
+            return self._text
+
+    def _new_entries(
+        self, all_descriptions: dict[str, list[str]], counts: list[int]
+    ) -> list[tuple[int, int, str, str]]:
+        """新增的 (轮数下标, 座位, 玩家名, 描述)，按发言顺序排列"""
+        names = list(all_descriptions)
+        known = len(self._names)
+        if names[:known] == self._names:
+            # 玩家只会追加到末尾: 按位置找出描述数变化的玩家
+            old = self._counts + [0] * (len(names) - known)
+            changed = compress(range(len(names)), map(ne, counts, old))
+        else:
+            seen = dict(zip(self._names, self._counts))
+            old = [seen.get(name, 0) for name in names]
+            changed = range(len(names))
+
+        new_entries = []
+        for seat in changed:
+            descs = all_descriptions[names[seat]]
+            new_entries.extend(
+                (i, seat, names[seat], descs[i]) for i in range(old[seat], len(descs))
+            )
+        self._names = names
+        self._counts = counts
+        # 多个玩家的新描述按 (轮数, 座位) 排序，保证历史按发言顺序增长
+        new_entries.sort()
+        return new_entries
+
+    def _apply_policy(self, new_entries: list[tuple[int, int, str, str]]) -> None:
+        """最近几轮保留原文，新的一轮开始时把超出窗口的轮次折叠进摘要"""
+        policy = self.policy
+        changed: set[str] = set()
+        appended = ""
+        rebuild = False
+        for i, _, name, desc in new_entries:
+            round_num = i + 1
+            if round_num <= self._folded_through:
+                # 恢复的对局里迟到的旧描述直接进摘要
+                self._folded.setdefault(name, []).append(desc)
+                changed.add(name)
+                continue
+            if self._rounds and round_num < max(self._rounds):
+                rebuild = True
+            self._rounds.setdefault(round_num, []).append((name, desc))
+            appended += _history_line(round_num, name, desc)
+
+        fold_through = max(self._rounds, default=0) - policy.recent_rounds
+        for round_num in sorted(r for r in self._rounds if r <= fold_through):
+            for name, desc in self._rounds.pop(round_num):
+                self._folded.setdefault(name, []).append(desc)
+                changed.add(name)
+            rebuild = True
+        self._folded_through = max(self._folded_through, fold_through)
+
+        if changed:
+            for name in changed:
+                self._summaries[name] = policy.summarize(name, self._folded[name])
+            lines = "".join(
+                f"{name}: {self._summaries[name]}\n" for name in self._folded
+            )
+            self._summary = f"第{self._folded_through}轮及之前（摘要）:\n{lines}"
+        if rebuild:
+            self._recent = "".join(
+                _history_line(r, name, desc)
+                for r in sorted(self._rounds)
+                for name, desc in self._rounds[r]
+            )
+        else:
+            self._recent += appended
+        self._text = self._summary + self._recent
+
+
+def _history_line(round_num: int, name: str, desc: str) -> str:
+    return f"第{round_num}轮 {name}: {desc}\n"
+
+
+def player_segment(name: str, word: str, style: str | None = None) -> str:
+    """玩家信息段；style 为可选的发言风格说明，同一玩家整局不变，不影响前缀缓存"""
+    segment = f"你的名字是: {name}\n你的词语是: {word}\n"
+    return f"{segment}你的发言风格: {style}\n" if style else segment
+
+
+def build_messages(
+    player: str, history: str, task: str, max_tokens: int | None = None
+) -> list[BaseMessage]:
+    """
+    按 系统规则 → 玩家信息 → 历史 → 任务 的顺序组装消息。
+
+    Args:
+        player: player_segment 生成的玩家信息段
+        history: Transcript 的历史文本
+        task: 本次调用的任务说明
+        max_tokens: 提示词 token 上限（按字符数估算），超出时从历史开头按行裁掉
+    """
+    if max_tokens is not None:
+        budget = (
+            max_tokens - len(RULES) - len(player) - len(_HISTORY_HEADER) - len(task) - 1
+        )
+        if len(history) > budget:
+            # 从超出部分之后的第一个换行处开始保留，不留半行
+            start = history.find("\n", len(history) - max(budget, 0) - 1) + 1
+            history = history[start:] if start else ""
+    history_block = f"{_HISTORY_HEADER}{history}" if history else ""
+    return [SYSTEM_MESSAGE, HumanMessage(content=f"{player}{history_block}\n{task}")]
+
+
+def describe_task(round_num: int) -> str:
+    return f"这是第 {round_num} 轮。请给出你的描述（一句话，10-20字左右）:"
+
+
+def vote_task(alive_players: list[str]) -> str:
+    return (
+        "请分析谁最可疑，选择一个玩家投票淘汰。\n"
+        f"可选玩家: {', '.join(alive_players)}\n\n"
+        "请只回复一个玩家的名字（如: 玩家A）:"
+    )
+
+
+def structured_vote_task(alive_players: list[str]) -> str:
+    return (
+        "请分析谁最可疑，选择一个玩家投票淘汰。\n"
+        f"可选玩家: {', '.join(alive_players)}\n\n"
+        '按 JSON 格式回复，如: {"vote": "玩家A"}'
+    )
+
+
+def vote_schema(alive_players: list[str]) -> dict:
+    """单人投票的 JSON Schema: 唯一的 vote 字段，取值限定为可选玩家"""
+    return {
+        "type": "object",
+        "properties": {"vote": {"type": "string", "enum": alive_players}},
+        "required": ["vote"],
+        "additionalProperties": False,
+    }
+
+
+def json_schema_format(name: str, schema: dict) -> dict:
+    """OpenAI 兼容的结构化输出参数 response_format（严格模式）"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema},
+    }
+
+
+def moderator_segment(roster: list[tuple[str, str]]) -> str:
+    """主持人信息段: 全部玩家及其词语，整局不变"""
+    lines = "".join(f"{name} 的词语是: {word}\n" for name, word in roster)
+    return (
+        "你是主持人，需要分别代替每一位存活玩家投票。\n"
+        "每位玩家只知道自己的词语，不知道别人的词语和身份。\n"
+        f"{lines}"
+    )
+
+
+def moderator_task(ballots: dict[str, list[str]]) -> str:
+    """
+    主持人投票任务
+
+    Args:
+        ballots: 投票者 -> 该投票者可以投的玩家
+    """
+    lines = "".join(
+        f"{voter} 可选玩家: {', '.join(options)}\n"
+        for voter, options in ballots.items()
+    )
+    return (
+        "请站在每位投票者自己的角度（只根据其自己的词语和各玩家的描述）"
+        "判断谁最可疑，为每位投票者选出一个要淘汰的玩家。\n"
+        f"{lines}\n"
+        "按 JSON 格式回复，键为投票者，值为被投票的玩家名。"
+    )
+
+
+def ballots_schema(ballots: dict[str, list[str]]) -> dict:
+    """每个投票者一个字段，取值限定为其可选玩家"""
+    return {
+        "type": "object",
+        "properties": {
+            voter: {"type": "string", "enum": options}
+            for voter, options in ballots.items()
+        },
+        "required": list(ballots),
+        "additionalProperties": False,
+    }
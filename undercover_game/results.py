@@ -0,0 +1,365 @@
+"""
+对局结果分析库
+
+把每局结束时的 GameState 连同玩家的模型、调用耗时写入本地 SQLite，
+按词语对、身份、模型统计胜率，按阶段统计延迟分位数:
+    store = ResultStore("results.sqlite")
+    game = UndercoverGame(results=store)
+    game.run()
+    store.win_rate_by_model()
+
+聚合查询都走覆盖索引，不读原始行；延迟在写入时按 metrics.Histogram 的分桶
+累加，随事务提交合并到汇总表，分位数只需读几百个桶，与对局数无关（相对误差约 1%）。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .metrics import QUANTILES, Histogram
+from .players import AIPlayer, _model_name
+
+if TYPE_CHECKING:
+    from .game import GameState, UndercoverGame
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    civilian_word TEXT NOT NULL,
+    undercover_word TEXT NOT NULL,
+    num_players INTEGER NOT NULL,
+    num_undercover INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    winner TEXT NOT NULL,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS games_pair
+    ON games (civilian_word, undercover_word, winner);
+CREATE INDEX IF NOT EXISTS games_winner ON games (winner);
+
+CREATE TABLE IF NOT EXISTS players (
+    game_id INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    undercover INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    model TEXT NOT NULL,
+    won INTEGER NOT NULL,
+    eliminated_round INTEGER,
+    PRIMARY KEY (game_id, seat)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS players_model ON players (model, undercover, won);
+
+CREATE TABLE IF NOT EXISTS descriptions (
+    game_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (game_id, round, seat)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS votes (
+    game_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    voter INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    PRIMARY KEY (game_id, round, voter)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS calls (
+    game_id INTEGER NOT NULL,
+    seat INTEGER,
+    phase TEXT NOT NULL,
+    ttft REAL NOT NULL,
+    total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_game ON calls (game_id);
+
+CREATE TABLE IF NOT EXISTS latency_buckets (
+    phase TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (phase, metric, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS latency_ranges (
+    phase TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (phase, metric)
+) WITHOUT ROWID;
+"""
+
+# 延迟分位数统计的指标: calls 表中的列
+LATENCY_METRICS = ("ttft", "total")
+
+
+@dataclass(frozen=True, slots=True)
+class WinRate:
+    """wins / games"""
+
+    games: int
+    wins: int
+
+    @property
+    def rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+
+def _player_model(player: Any) -> str:
+    """玩家的模型名；启发式等不调用 LLM 的玩家用自己的 MODEL_NAME"""
+    if isinstance(player, AIPlayer):
+        return _model_name(player.llm)
+    return str(getattr(player, "MODEL_NAME", type(player).__name__))
+
+
+class ResultStore:
+    """
+    基于 SQLite 的对局结果库。
+
+    写入先攒在一个事务里，每 COMMIT_EVERY 局或查询、flush、close 时提交；
+    延迟分桶也先在内存中累加，提交时一起写入汇总表。进程崩溃时丢失的只是
+    尚未提交的几局。同一个实例可以被多个线程共用。
+
+    Args:
+        path: 数据库文件路径
+    """
+
+    COMMIT_EVERY = 256
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._pending = 0
+        # 尚未写入汇总表的延迟分桶: (阶段, 指标) -> 直方图
+        self._latencies: dict[tuple[str, str], Histogram] = {}
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def record(
+        self, game: UndercoverGame, state: GameState, seconds: float | None = None
+    ) -> int:
+        """
+        写入一局已结束的对局。
+
+        Args:
+            game: 对局，用于取得每个玩家的模型和调用耗时
+            state: run / arun 返回的最终状态
+            seconds: 对局耗时
+
+        Returns:
+            对局编号
+        """
+        players = state["players"]
+        seats = {player.name: seat for seat, player in enumerate(players)}
+        eliminated_round = {name: i for i, name in enumerate(state["eliminated"], 1)}
+        undercover_won = state["winner"] == "卧底"
+        civilian_word, undercover_word = state["words"]
+
+        player_rows = []
+        for seat, record in enumerate(players):
+            agent = game.agents.get(record.name)
+            model = _player_model(agent) if agent is not None else record.kind
+            player_rows.append(
+                (
+                    seat,
+                    record.name,
+                    int(record.undercover),
+                    record.kind,
+                    model,
+                    int(record.undercover == undercover_won),
+                    eliminated_round.get(record.name),
+                )
+            )
+        description_rows = [
+            (round_num, seats[name], text)
+            for name, descs in state["descriptions"].items()
+            for round_num, text in enumerate(descs, 1)
+        ]
+        vote_rows = [
+            (round_num, seats[voter], seats[target])
+            for round_num, votes in enumerate(state.get("vote_history", ()), 1)
+            for voter, target in votes.items()
+            if target in seats
+        ]
+        agents: list[tuple[int | None, Any]] = [
+            (seats.get(name), agent) for name, agent in game.agents.items()
+        ]
+        if game.active_moderator is not None:
+            agents.append((None, game.active_moderator))
+        call_rows = [
+            (seat, phase, ttft, total)
+            for seat, agent in agents
+            for phase, ttft, total in agent.timings
+        ]
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO games (finished, civilian_word, undercover_word, "
+                "num_players, num_undercover, rounds, winner, seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    civilian_word,
+                    undercover_word,
+                    len(players),
+                    sum(player.undercover for player in players),
+                    state["round_num"],
+                    state["winner"],
+                    seconds,
+                ),
+            )
+            game_id = cursor.lastrowid
+            self._insert(game_id, "players", 8, player_rows)
+            self._insert(game_id, "descriptions", 4, description_rows)
+            self._insert(game_id, "votes", 4, vote_rows)
+            self._insert(game_id, "calls", 5, call_rows)
+            self._add_latencies(call_rows)
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self._commit()
+        return game_id
+
+    def _insert(
+        self, game_id: int, table: str, columns: int, rows: Iterable[tuple]
+    ) -> None:
+        placeholders = ", ".join("?" * columns)
+        self._conn.executemany(
+            f"INSERT INTO {table} VALUES ({placeholders})",
+            [(game_id, *row) for row in rows],
+        )
+
+    def _add_latencies(self, call_rows: list[tuple[Any, str, float, float]]) -> None:
+        """把本局的调用耗时按直方图分桶累加到内存中，提交时再写入汇总表"""
+        histograms = self._latencies
+        for _, phase, ttft, total in call_rows:
+            for metric, value in zip(LATENCY_METRICS, (ttft, total)):
+                histogram = histograms.get((phase, metric))
+                if histogram is None:
+                    histogram = histograms[phase, metric] = Histogram()
+                histogram.record(value)
+
+    def _write_latencies(self) -> None:
+        """把累加的延迟分桶合并进汇总表，每次提交只写一遍"""
+        histograms = self._latencies
+        self._conn.executemany(
+            "INSERT INTO latency_buckets VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (phase, metric, bucket) DO UPDATE SET count = count + excluded.count",
+            [
+                (phase, metric, bucket, count)
+                for (phase, metric), histogram in histograms.items()
+                for bucket, count in histogram.buckets.items()
+            ],
+        )
+        self._conn.executemany(
+            "INSERT INTO latency_ranges VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (phase, metric) DO UPDATE SET min = MIN(min, excluded.min), "
+            "max = MAX(max, excluded.max)",
+            [
+                (phase, metric, histogram.min, histogram.max)
+                for (phase, metric), histogram in histograms.items()
+            ],
+        )
+        histograms.clear()
+
+    def _commit(self) -> None:
+        if self._pending:
+            self._write_latencies()
+            self._conn.commit()
+            self._pending = 0
+
+    def flush(self) -> None:
+        """提交尚未提交的对局"""
+        with self._lock:
+            self._commit()
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            self._commit()
+            return self._conn.execute(sql, params).fetchall()
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM games")[0][0]
+
+    def win_rate_by_pair(self) -> dict[tuple[str, str], WinRate]:
+        """(平民词, 卧底词) -> 卧底胜率，可以用来衡量词语对的难度"""
+        rows = self._query(
+            "SELECT civilian_word, undercover_word, COUNT(*), SUM(winner = '卧底') "
+            "FROM games GROUP BY civilian_word, undercover_word"
+        )
+        return {
+            (civilian, undercover): WinRate(n, wins)
+            for civilian, undercover, n, wins in rows
+        }
+
+    def win_rate_by_role(self) -> dict[str, WinRate]:
+        """ "平民" / "卧底" -> 该方获胜的对局比例"""
+        rows = dict(self._query("SELECT winner, COUNT(*) FROM games GROUP BY winner"))
+        games = sum(rows.values())
+        return {role: WinRate(games, rows.get(role, 0)) for role in ("平民", "卧底")}
+
+    def win_rate_by_model(self) -> dict[tuple[str, str], WinRate]:
+        """(模型, 身份) -> 该模型的玩家以该身份参加的局数和获胜局数"""
+        rows = self._query(
+            "SELECT model, undercover, COUNT(*), SUM(won) "
+            "FROM players GROUP BY model, undercover"
+        )
+        return {
+            (model, "卧底" if undercover else "平民"): WinRate(n, wins)
+            for model, undercover, n, wins in rows
+        }
+
+    def latency_percentiles(
+        self, metric: str = "total", quantiles: Iterable[float] = QUANTILES
+    ) -> dict[str, dict[str, float]]:
+        """
+        各阶段 LLM 调用耗时的分位数（秒）。
+
+        Args:
+            metric: "total"（总耗时）或 "ttft"（首 token 延迟）
+            quantiles: 分位点，如 (0.5, 0.95, 0.99)
+
+        Returns:
+            阶段 -> {"count", "min", "max", "p50", ...}
+        """
+        if metric not in LATENCY_METRICS:
+            raise ValueError(f"未知的延迟指标: {metric}")
+        histograms: dict[str, Histogram] = {}
+        for phase, bucket, count in self._query(
+            "SELECT phase, bucket, count FROM latency_buckets WHERE metric = ?",
+            (metric,),
+        ):
+            histogram = histograms.setdefault(phase, Histogram())
+            histogram.buckets[bucket] = count
+            histogram.count += count
+        for phase, low, high in self._query(
+            "SELECT phase, min, max FROM latency_ranges WHERE metric = ?", (metric,)
+        ):
+            histograms[phase].min = low
+            histograms[phase].max = high
+        return {
+            phase: {
+                "count": histogram.count,
+                "min": histogram.min,
+                "max": histogram.max,
+                **{f"p{round(q * 100)}": histogram.quantile(q) for q in quantiles},
+            }
+            for phase, histogram in sorted(histograms.items())
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self._conn.close()
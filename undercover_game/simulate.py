@@ -0,0 +1,217 @@
+"""
+谁是卧底批量模拟
+
+无界面地（NullSink）运行大量对局，用多进程分片执行，汇总胜率、轮数和延迟统计。
+默认使用离线的 FakeLLM，可以在普通机器上直接测试游戏引擎本身的开销。
+
+运行: uv run python -m undercover_game.simulate -n 1000 -w 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from .fake_llm import FakeLLM
+from .game import UndercoverGame
+from .metrics import Histogram, MetricsRegistry
+from .sinks import NullSink
+
+# 单局结果: (获胜方, 轮数)
+GameRecord = tuple[str, int]
+
+# 每局耗时的直方图；每次调用的耗时由玩家写入 llm_ttft_seconds / llm_total_seconds
+GAME_SECONDS = "simulate_game_seconds"
+CALL_METRICS = {"ttft": "llm_ttft_seconds", "total": "llm_total_seconds"}
+
+
+def latency_stats(histogram: Histogram) -> dict[str, float]:
+    """直方图的次数、均值与 p50/p95/p99"""
+    snapshot = histogram.snapshot()
+    return {key: snapshot[key] for key in ("count", "mean", "p50", "p95", "p99")}
+
+
+@dataclass
+class SimulationReport:
+    """批量模拟的汇总结果"""
+
+    n_games: int
+    wall_seconds: float
+    wins: dict[str, int]
+    rounds: dict[int, int]
+    game_latency: dict[str, float]
+    call_latency: dict[str, dict[str, dict[str, float]]] = field(default_factory=dict)
+
+    @property
+    def win_rates(self) -> dict[str, float]:
+        return {side: count / self.n_games for side, count in self.wins.items()}
+
+    @property
+    def mean_rounds(self) -> float:
+        total = sum(rounds * count for rounds, count in self.rounds.items())
+        return total / self.n_games if self.n_games else 0.0
+
+    @property
+    def games_per_second(self) -> float:
+        return self.n_games / self.wall_seconds if self.wall_seconds else 0.0
+
+    def summary(self) -> str:
+        """生成可读的汇总文本"""
+        lines = [
+            (
+                f"对局数: {self.n_games}  总耗时: {self.wall_seconds:.2f}s  "
+                f"吞吐: {self.games_per_second:.1f} 局/秒"
+            ),
+            "胜率: "
+            + ", ".join(
+                f"{side} {rate:.1%}" for side, rate in sorted(self.win_rates.items())
+            ),
+            f"平均轮数: {self.mean_rounds:.2f}  分布: "
+            + ", ".join(f"{r}轮 {c}" for r, c in sorted(self.rounds.items())),
+            "单局耗时: "
+            + ", ".join(
+                f"{k} {v * 1000:.2f}ms"
+                for k, v in self.game_latency.items()
+                if k != "count"
+            ),
+        ]
+        for phase, stats in self.call_latency.items():
+            for metric, values in stats.items():
+                lines.append(
+                    f"{phase} {metric}: "
+                    + ", ".join(
+                        f"{k} {v * 1000:.2f}ms"
+                        for k, v in values.items()
+                        if k != "count"
+                    )
+                )
+        return "\n".join(lines)
+
+
+def _run_shard(
+    seeds: list[int],
+    num_players: int,
+    num_undercover: int,
+    llm_factory: Callable[[], Any],
+    concurrent_votes: bool,
+) -> tuple[list[GameRecord], MetricsRegistry]:
+    """在当前进程中顺序运行一批对局，返回每局结果和记录了耗时的注册表"""
+    llm = llm_factory()
+    sink = NullSink()
+    metrics = MetricsRegistry()
+    records: list[GameRecord] = []
+    for seed in seeds:
+        game = UndercoverGame(
+            num_players,
+            num_undercover,
+            concurrent_votes=concurrent_votes,
+            llm=llm,
+            sink=sink,
+            seed=seed,
+            metrics=metrics,
+        )
+        start = time.perf_counter()
+        result = game.run()
+        metrics.observe(GAME_SECONDS, time.perf_counter() - start)
+        records.append((result["winner"], result["round_num"]))
+    return records, metrics
+
+
+def simulate(
+    n_games: int,
+    num_players: int = 5,
+    num_undercover: int = 2,
+    workers: int | None = None,
+    llm_factory: Callable[[], Any] = FakeLLM,
+    seed: int = 0,
+    concurrent_votes: bool = False,
+) -> SimulationReport:
+    """
+    批量运行对局并汇总结果。
+
+    Args:
+        n_games: 对局数
+        num_players: 每局玩家数
+        num_undercover: 每局卧底数
+        workers: 进程数，默认 CPU 核数；<= 1 时在当前进程运行
+        llm_factory: 每个工作进程调用一次以创建 LLM，需可 pickle（模块级函数或类）
+        seed: 起始随机种子，第 i 局使用 seed + i
+        concurrent_votes: 是否并发投票
+
+    Returns:
+        汇总结果
+    """
+    workers = workers if workers is not None else os.cpu_count() or 1
+    seeds = list(range(seed, seed + n_games))
+
+    start = time.perf_counter()
+    if workers <= 1:
+        records, metrics = _run_shard(
+            seeds, num_players, num_undercover, llm_factory, concurrent_votes
+        )
+    else:
+        # 分片数多于进程数，避免个别慢分片拖住整体
+        n_shards = min(n_games, workers * 4) or 1
+        shards = [seeds[i::n_shards] for i in range(n_shards)]
+        records = []
+        metrics = MetricsRegistry()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _run_shard,
+                    shard,
+                    num_players,
+                    num_undercover,
+                    llm_factory,
+                    concurrent_votes,
+                )
+                for shard in shards
+            ]
+            for future in futures:
+                shard_records, shard_metrics = future.result()
+                records.extend(shard_records)
+                metrics.merge(shard_metrics)
+    wall_seconds = time.perf_counter() - start
+
+    # 各工作进程的直方图按阶段合并，不传输、也不排序逐次调用的耗时
+    call_latency: dict[str, dict[str, dict[str, float]]] = {}
+    for metric, name in CALL_METRICS.items():
+        for labels, histogram in metrics.merged(name, ("phase",)).items():
+            phase = dict(labels).get("phase", "")
+            call_latency.setdefault(phase, {})[metric] = latency_stats(histogram)
+
+    return SimulationReport(
+        n_games=n_games,
+        wall_seconds=wall_seconds,
+        wins=dict(Counter(winner for winner, _ in records)),
+        rounds=dict(Counter(rounds for _, rounds in records)),
+        game_latency=latency_stats(
+            metrics.merged(GAME_SECONDS, ()).get((), Histogram())
+        ),
+        call_latency=call_latency,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="谁是卧底批量模拟")
+    parser.add_argument("-n", "--games", type=int, default=1000, help="对局数")
+    parser.add_argument("-p", "--players", type=int, default=5, help="每局玩家数")
+    parser.add_argument("-u", "--undercover", type=int, default=2, help="每局卧底数")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    args = parser.parse_args()
+
+    report = simulate(
+        args.games, args.players, args.undercover, workers=args.workers, seed=args.seed
+    )
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
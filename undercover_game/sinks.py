@@ -0,0 +1,182 @@
+"""
+游戏事件输出
+
+游戏和玩家不直接 print，而是把结构化事件交给 EventSink，由具体实现决定
+输出方式: 逐 token 打印到终端、按行/按时间批量写出、写 JSON Lines 文件或丢弃。
+
+事件类型及字段:
+- call_start: player, phase ("describe" / "vote"), live
+- token: player, phase, text
+- call_end: player, phase, live, text, ttft, gen, total, saved_tokens, saved_ms
+- round_start / vote / eliminate / winner / reveal / log: line 为展示文本，
+  其余为结构化字段
+- description: player, round, text
+- node: name
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from typing import Any, TextIO
+
+
+class EventSink:
+    """事件接收器基类"""
+
+    def emit(self, event: str, **data: Any) -> None:
+        """接收一个事件"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """输出剩余内容并释放资源"""
+
+
+class NullSink(EventSink):
+    """丢弃所有事件，用于批量模拟"""
+
+    def emit(self, event: str, **data: Any) -> None:
+        pass
+
+
+class TextSink(EventSink):
+    """
+    把事件渲染成与原来 print 相同的终端文本。
+
+    live 调用逐 token 输出；非 live 调用（并发投票）在结束时整行输出，
+    避免多个玩家的回复交错。子类实现 write 决定文本去向。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> None:
+        raise NotImplementedError
+
+    def emit(self, event: str, **data: Any) -> None:
+        text = self.render(event, data)
+        if text:
+            with self._lock:
+                self.write(text)
+
+    @staticmethod
+    def render(event: str, data: dict[str, Any]) -> str:
+        """把事件渲染成文本，不需要输出时返回空字符串"""
+        if event == "call_start":
+            return _call_prefix(data) if data["live"] else ""
+        if event == "token":
+            return data["text"] if data.get("live", True) else ""
+        if event == "call_end":
+            stats = (
+                f"{' [完成]' if data['phase'].startswith('vote') else ''} "
+                f"(TTFT: {data['ttft']:.2f}s, 生成: {data['gen']:.2f}s, "
+                f"总计: {data['total']:.2f}s"
+            )
+            if data.get("saved_tokens") is not None:
+                stats += (
+                    f", 提前结束: 省≤{data['saved_tokens']}tok/"
+                    f"≈{data['saved_ms']:.0f}ms"
+                )
+            stats += ")\n"
+            if data["live"]:
+                return stats
+            return f"{_call_prefix(data)}{data['text']}{stats}"
+        if event == "node":
+            return f"\n[节点完成: {data['name']}]\n"
+        if "line" in data:
+            return f"{data['line']}\n"
+        return ""
+
+
+def _call_prefix(data: dict[str, Any]) -> str:
+    if data["phase"] == "vote":
+        return f"  > {data['player']} 正在投票: "
+    if data["phase"] == "vote_batch":
+        return f"  > {data['player']} 正在代替所有人投票: "
+    return f"{data['player']}: "
+
+
+class ConsoleSink(TextSink):
+    """逐 token 写到终端并立即 flush（原有行为）"""
+
+    def __init__(self, stream: TextIO | None = None) -> None:
+        super().__init__()
+        self.stream = stream
+
+    def write(self, text: str) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+
+class BufferedSink(TextSink):
+    """
+    先写入内存缓冲，遇到换行或距上次 flush 超过 interval 秒时才写出。
+
+    Args:
+        stream: 输出流，默认 sys.stdout
+        interval: 按时间 flush 的间隔秒数；None 表示只按行 flush
+        line_buffered: 是否在文本含换行时 flush
+    """
+
+    def __init__(
+        self,
+        stream: TextIO | None = None,
+        interval: float | None = None,
+        line_buffered: bool = True,
+    ) -> None:
+        super().__init__()
+        self.stream = stream
+        self.interval = interval
+        self.line_buffered = line_buffered
+        self._buffer: list[str] = []
+        self._last_flush = time.monotonic()
+
+    def write(self, text: str) -> None:
+        self._buffer.append(text)
+        if (self.line_buffered and "\n" in text) or (
+            self.interval is not None
+            and time.monotonic() - self._last_flush >= self.interval
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            stream = self.stream or sys.stdout
+            stream.write("".join(self._buffer))
+            stream.flush()
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+class JsonlSink(EventSink):
+    """
+    每个事件写成一行 JSON，附带时间戳 ts。
+
+    Args:
+        path: 输出文件路径（追加写入）
+        include_tokens: 是否记录逐 token 事件，关闭后文件小得多
+    """
+
+    def __init__(self, path: str, include_tokens: bool = False) -> None:
+        self.include_tokens = include_tokens
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **data: Any) -> None:
+        if event == "token" and not self.include_tokens:
+            return
+        record = {"ts": time.time(), "event": event, **data}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,648 @@
+"""
+谁是卧底观战服务
+
+后台线程连续运行对局，把游戏和玩家的结构化事件（逐 token、节点完成、投票、
+淘汰、胜负）实时推送给任意多个观众，支持 SSE 和 WebSocket:
+    uv run python -m undercover_game.spectator --port 8080 --fake --token-delay 0.05
+    浏览器打开 http://127.0.0.1:8080/，或 curl -N http://127.0.0.1:8080/events
+
+每条事件是一个 JSON 对象，字段与 sinks 模块说明的相同，另加 event 和递增的 seq；
+服务还会发送 game_start / game_end（game 为对局编号），以及观众掉队时的
+dropped（count 为丢弃的事件数）。
+
+对局只有一个生产者 BroadcastSink: 每个事件只序列化一次，追加到共享的定长日志，
+每个观众只持有日志上的游标，发送由各观众的连接线程完成。日志满时覆盖最早的事件
+而不是等待，慢观众只会丢失自己的事件，不会拖慢对局或其他观众。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import heapq
+import itertools
+import json
+import struct
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import attrgetter
+from typing import Any, BinaryIO
+
+from .metrics import MetricsRegistry
+from .sinks import EventSink
+
+# WebSocket 握手用的固定 GUID（RFC 6455）
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B65"
+_WS_TEXT = 0x1
+_WS_CLOSE = 0x8
+_WS_PING = 0x9
+# 关闭帧的状态码: 服务端停止（对局服务关闭）
+_WS_GOING_AWAY = 1001
+# 观众发来的单个帧的大小上限，超过时断开连接
+_WS_MAX_FRAME = 1 << 16
+
+_PAGE = """<!doctype html>
+<meta charset="utf-8">
+<title>谁是卧底 观战</title>
+<style>body{font:14px/1.6 monospace;white-space:pre-wrap;margin:1em}</style>
+<body><div id="log"></div>
+<script>
+const log = document.getElementById("log");
+let line = null;
+function write(text, live) {
+  if (!line || !live) { line = document.createElement("div"); log.append(line); }
+  line.textContent += text;
+  if (!live) line = null;
+  window.scrollTo(0, document.body.scrollHeight);
+}
+new EventSource("/events").onmessage = (msg) => {
+  const e = JSON.parse(msg.data);
+  if (e.event === "call_start" && e.live) write(e.player + ": ", true);
+  else if (e.event === "token" && e.live !== false) write(e.text, true);
+  else if (e.event === "call_end") line = null;
+  else if (e.event === "node") write("[节点完成: " + e.name + "]", false);
+  else if (e.event === "game_start") write("\\n##### 第 " + e.game + " 局 #####", false);
+  else if (e.event === "dropped") write("(网络太慢，跳过 " + e.count + " 条事件)", false);
+  else if (e.line) write(e.line, false);
+};
+</script>
+"""
+
+
+class _Entry:
+    """
+    日志中的一个事件；encoded 为 None 表示还没有序列化（或合并过），取出时序列化。
+    order 为事件的 seq，取出时按它把 token 和其他事件合并回原来的顺序。
+    """
+
+    __slots__ = ("data", "encoded", "event", "order")
+
+    def __init__(
+        self, event: str, data: dict[str, Any], encoded: bytes | None, order: int
+    ) -> None:
+        self.event = event
+        self.data = data
+        self.encoded = encoded
+        self.order = order
+
+
+_ORDER = attrgetter("order")
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, default=str)
+
+
+def _encode(event: str, data: dict[str, Any]) -> bytes:
+    return _ENCODER.encode({"event": event, **data}).encode("utf-8")
+
+
+def _coalesce(entries: list[_Entry]) -> tuple[list[_Entry], int]:
+    """把相邻的同一玩家同一阶段的 token 合并成一条，返回 (事件, 合并次数)"""
+    merged: list[_Entry] = []
+    coalesced = 0
+    for entry in entries:
+        last = merged[-1] if merged else None
+        if (
+            entry.event == "token"
+            and last is not None
+            and last.event == "token"
+            and last.data["player"] == entry.data["player"]
+            and last.data["phase"] == entry.data["phase"]
+        ):
+            text = last.data["text"] + entry.data["text"]
+            merged[-1] = _Entry("token", {**last.data, "text": text}, None, last.order)
+            coalesced += 1
+        else:
+            merged.append(entry)
+    return merged, coalesced
+
+
+class _Ring:
+    """
+    只追加的定长事件日志: 超过 maxsize 时丢弃最早的事件。
+
+    end 为累计追加的事件数，观众用绝对位置作为游标；游标落在 start 之前说明
+    中间的事件已被覆盖。
+    """
+
+    __slots__ = ("end", "entries")
+
+    def __init__(self, maxsize: int) -> None:
+        self.entries: deque[_Entry] = deque(maxlen=maxsize)
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        return self.end - len(self.entries)
+
+    def append(self, entry: _Entry) -> None:
+        self.entries.append(entry)
+        self.end += 1
+
+    def since(self, cursor: int) -> tuple[list[_Entry], int]:
+        """游标之后的事件和被覆盖的事件数；只遍历新事件，与日志长度无关"""
+        gap = max(self.start - cursor, 0)
+        entries = list(
+            itertools.islice(reversed(self.entries), self.end - cursor - gap)
+        )
+        entries.reverse()
+        return entries, gap
+
+
+class Subscriber:
+    """
+    一个观众在 BroadcastSink 事件日志上的游标，由 BroadcastSink.subscribe 创建。
+
+    事件只放进 sink 的共享日志一次，观众不持有自己的队列: get 在观众自己的线程里
+    取出游标之后的事件，生产者从不等待观众，也不随观众数做额外的工作。
+    - token 和其他事件分别存放，日志各保留最近 maxsize 条；token 多得多，
+      观众掉队时总是先丢 token。下次 get 会先收到一条 dropped 说明丢了多少
+    - 取出的事件里相邻的同一玩家同一阶段的 token 合并成一条；观众跟得上时
+      每次只取到一两个事件，不会发生合并
+
+    Args:
+        sink: 所属的 BroadcastSink
+        token_cursor: token 日志的起始位置
+        other_cursor: 其他事件日志的起始位置
+    """
+
+    def __init__(
+        self, sink: BroadcastSink, token_cursor: int, other_cursor: int
+    ) -> None:
+        self.sink = sink
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._token_cursor = token_cursor
+        self._other_cursor = other_cursor
+
+    def __len__(self) -> int:
+        """积压（游标之后仍在日志中）的事件数"""
+        sink = self.sink
+        return (
+            sink._tokens.end
+            - max(self._token_cursor, sink._tokens.start)
+            + sink._others.end
+            - max(self._other_cursor, sink._others.start)
+        )
+
+    def _ready(self) -> bool:
+        return (
+            self.closed
+            or self._token_cursor < self.sink._tokens.end
+            or self._other_cursor < self.sink._others.end
+        )
+
+    def get(self, timeout: float | None = None) -> list[bytes] | None:
+        """
+        取出积压的全部事件（已序列化）。
+
+        Returns:
+            事件列表；超时返回空列表，close 之后返回 None
+        """
+        sink = self.sink
+        with sink._cond:
+            sink._cond.wait_for(self._ready, timeout)
+            if self.closed:
+                return None
+            tokens, token_gap = sink._tokens.since(self._token_cursor)
+            others, other_gap = sink._others.since(self._other_cursor)
+            self._token_cursor = sink._tokens.end
+            self._other_cursor = sink._others.end
+        # 以下都在观众自己的线程里完成，不占用 sink 的锁
+        if tokens and others:
+            entries = list(heapq.merge(tokens, others, key=_ORDER))
+        else:
+            entries = tokens or others
+        entries, coalesced = _coalesce(entries)
+        gap = token_gap + other_gap
+        self.dropped += gap
+        self.coalesced += coalesced
+        if sink.metrics is not None:
+            if gap:
+                sink.metrics.inc("spectator_dropped_total", gap)
+            if coalesced:
+                sink.metrics.inc("spectator_coalesced_total", coalesced)
+        messages = [_encode("dropped", {"count": gap})] if gap else []
+        for entry in entries:
+            if entry.encoded is None:
+                entry.encoded = _encode(entry.event, entry.data)
+            messages.append(entry.encoded)
+        return messages
+
+    def close(self) -> None:
+        with self.sink._cond:
+            self.closed = True
+            self.sink._cond.notify_all()
+
+
+class BroadcastSink(EventSink):
+    """
+    把事件分发给所有观众的 EventSink，可以直接作为 UndercoverGame 的 sink。
+
+    emit 只做一次 JSON 序列化和一次日志追加，不做任何网络 IO，耗时与观众数
+    无关；唤醒等待中的观众由后台线程完成，连续的多个事件只唤醒一次。
+    没有观众时不序列化，token 事件直接丢弃。新观众先收到当前对局中已经发生的
+    事件（不含 token，最多 maxsize 条），再接着收实时事件。
+
+    Args:
+        maxsize: 日志中 token 和其他事件各自保留的条数，即观众最多能落后多少
+        metrics: 记录观众数、丢弃和合并次数的指标注册表
+    """
+
+    def __init__(
+        self, maxsize: int = 256, metrics: MetricsRegistry | None = None
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize 至少为 1")
+        self.maxsize = maxsize
+        self.metrics = metrics
+        self._cond = threading.Condition(threading.Lock())
+        # 只整体替换不原地修改，emit 可以不持锁判断有没有观众
+        self._subscribers: tuple[Subscriber, ...] = ()
+        self._tokens = _Ring(maxsize)
+        self._others = _Ring(maxsize)
+        # 当前对局的 game_start 在 _others 中的位置，新观众从这里开始
+        self._game_start = 0
+        self._seq = itertools.count(1)
+        self._pending = threading.Event()
+        self._closed = False
+        self._waker: threading.Thread | None = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscriber:
+        """加入一个观众；不再需要时调用 unsubscribe"""
+        with self._cond:
+            subscriber = Subscriber(
+                self, self._tokens.end, max(self._game_start, self._others.start)
+            )
+            if self._closed:
+                subscriber.closed = True
+            self._subscribers = (*self._subscribers, subscriber)
+            count = len(self._subscribers)
+            if self._waker is None and not self._closed:
+                self._waker = threading.Thread(target=self._wake, daemon=True)
+                self._waker.start()
+        if self.metrics is not None:
+            self.metrics.set_gauge("spectator_clients", count)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.close()
+        with self._cond:
+            self._subscribers = tuple(
+                s for s in self._subscribers if s is not subscriber
+            )
+            count = len(self._subscribers)
+        if self.metrics is not None:
+            self.metrics.set_gauge("spectator_clients", count)
+
+    def emit(self, event: str, **data: Any) -> None:
+        if event == "token" and not self._subscribers:
+            return
+        with self._cond:
+            # seq 在锁内分配，日志中的 seq 是递增的
+            data["seq"] = seq = next(self._seq)
+            encoded = _encode(event, data) if self._subscribers else None
+            entry = _Entry(event, data, encoded, seq)
+            if event == "token":
+                self._tokens.append(entry)
+            else:
+                if event == "game_start":
+                    self._game_start = self._others.end
+                self._others.append(entry)
+        if self._subscribers:
+            self._pending.set()
+
+    def _wake(self) -> None:
+        """后台线程: 有新事件时唤醒所有等待中的观众"""
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            with self._cond:
+                self._cond.notify_all()
+                if self._closed:
+                    return
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            subscribers, self._subscribers = self._subscribers, ()
+            for subscriber in subscribers:
+                subscriber.closed = True
+            self._cond.notify_all()
+        self._pending.set()
+
+
+def play_forever(
+    sink: BroadcastSink,
+    make_game: Callable[[int, EventSink], Any],
+    games: int | None = None,
+    pause: float = 2.0,
+    stop: threading.Event | None = None,
+) -> None:
+    """
+    依次运行对局，事件发给 sink。
+
+    Args:
+        sink: 观众共用的 BroadcastSink
+        make_game: (对局编号, sink) -> UndercoverGame
+        games: 对局数，None 表示一直运行
+        pause: 两局之间的间隔秒数，让观众看清结果
+        stop: 设置后在当前对局结束时退出
+    """
+    stop = stop or threading.Event()
+    for game_id in itertools.count(1) if games is None else range(1, games + 1):
+        if stop.is_set():
+            break
+        game = make_game(game_id, sink)
+        sink.emit(
+            "game_start",
+            game=game_id,
+            num_players=game.num_players,
+            num_undercover=game.num_undercover,
+        )
+        start = time.perf_counter()
+        state = game.run()
+        sink.emit(
+            "game_end",
+            game=game_id,
+            winner=state["winner"],
+            rounds=state["round_num"],
+            seconds=round(time.perf_counter() - start, 3),
+        )
+        stop.wait(pause)
+
+
+def _ws_frame(payload: bytes, opcode: int = _WS_TEXT) -> bytes:
+    """服务端发出的 WebSocket 帧（不加掩码）"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def _read_ws_frame(rfile: BinaryIO) -> tuple[int, bytes]:
+    """
+    读一个观众发来的 WebSocket 帧（客户端的帧带掩码）。
+
+    Returns:
+        (opcode, 去掉掩码的内容)
+
+    Raises:
+        EOFError: 连接已关闭
+        ValueError: 帧超过 _WS_MAX_FRAME
+    """
+
+    def read(n: int) -> bytes:
+        data = rfile.read(n)
+        if len(data) < n:
+            raise EOFError
+        return data
+
+    first, second = read(2)
+    n = second & 0x7F
+    if n == 126:
+        (n,) = struct.unpack("!H", read(2))
+    elif n == 127:
+        (n,) = struct.unpack("!Q", read(8))
+    if n > _WS_MAX_FRAME:
+        raise ValueError(f"WebSocket 帧过大: {n}")
+    mask = read(4) if second & 0x80 else b""
+    payload = read(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+class SpectatorHandler(BaseHTTPRequestHandler):
+    """
+    观战请求: / 为网页，/events 为 SSE，/ws 为 WebSocket，/stats 为观众统计。
+
+    每个连接占一个线程，只从自己的 Subscriber 取事件；写 socket 慢或阻塞只会
+    让这个观众的游标落后和丢弃。sink 由 make_server() 挂在 server 上。
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "":
+            self._send(200, "text/html; charset=utf-8", _PAGE.encode("utf-8"))
+        elif path == "/events":
+            self._stream_sse()
+        elif path == "/ws":
+            self._stream_ws()
+        elif path == "/stats":
+            sink: BroadcastSink = self.server.sink
+            stats = {"clients": sink.subscribers, "maxsize": sink.maxsize}
+            self._send(200, "application/json", json.dumps(stats).encode())
+        else:
+            self._send(404, "text/plain; charset=utf-8", b"not found")
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_sse(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._pump(
+            lambda messages: b"".join(b"data: %s\n\n" % m for m in messages),
+            b": ping\n\n",
+        )
+
+    def _stream_ws(self) -> None:
+        key = self.headers.get("Sec-WebSocket-Key")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self._send(400, "text/plain; charset=utf-8", b"expected websocket upgrade")
+            return
+        accept = base64.b64encode(
+            hashlib.sha1((key + _WS_GUID).encode()).digest()
+        ).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        # 观众发来的关闭帧中的状态码，回复关闭帧时原样带回
+        close_code: list[bytes] = []
+
+        def read_frames(subscriber: Subscriber) -> None:
+            """
+            在单独的线程里读观众发来的帧: 收到关闭帧或连接断开时结束推送，
+            其他帧（pong 等）忽略
+            """
+            try:
+                while True:
+                    opcode, payload = _read_ws_frame(self.rfile)
+                    if opcode == _WS_CLOSE:
+                        close_code.append(payload[:2])
+                        break
+            except (EOFError, ValueError, OSError):
+                pass
+            finally:
+                subscriber.close()
+
+        finished = self._pump(
+            lambda messages: b"".join(_ws_frame(m) for m in messages),
+            _ws_frame(b"", _WS_PING),
+            reader=read_frames,
+        )
+        if finished:
+            # 回应观众的关闭帧，或者在服务关闭时主动发出关闭帧，然后断开连接
+            code = close_code[0] if close_code else struct.pack("!H", _WS_GOING_AWAY)
+            try:
+                self.wfile.write(_ws_frame(code, _WS_CLOSE))
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def _pump(
+        self,
+        frame: Callable[[list[bytes]], bytes],
+        heartbeat: bytes,
+        reader: Callable[[Subscriber], None] | None = None,
+    ) -> bool:
+        """
+        把观众游标之后的事件写到连接，积压的事件合成一次写入。
+
+        Args:
+            reader: 在后台线程中读取连接的函数，可以关闭 subscriber 来结束推送
+
+        Returns:
+            subscriber 被关闭（观众发来关闭帧或服务关闭）时为 True，连接断开时为 False
+        """
+        self.close_connection = True
+        sink: BroadcastSink = self.server.sink
+        subscriber = sink.subscribe()
+        if reader is not None:
+            threading.Thread(target=reader, args=(subscriber,), daemon=True).start()
+        try:
+            self.wfile.flush()
+            while True:
+                messages = subscriber.get(self.server.heartbeat)
+                if messages is None:
+                    return True
+                self.wfile.write(frame(messages) if messages else heartbeat)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        finally:
+            sink.unsubscribe(subscriber)
+
+
+def make_server(
+    sink: BroadcastSink,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    heartbeat: float = 15.0,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """
+    创建观战服务（尚未开始监听请求）。
+
+    port 为 0 时由系统分配端口，可从 server.server_address 读取。对局由调用方
+    用 play_forever 在另一个线程里运行，事件发给同一个 sink。
+
+    Args:
+        sink: 对局使用的 BroadcastSink
+        heartbeat: 没有事件时发送心跳的间隔秒数，用来及时发现断开的连接
+    """
+    server = ThreadingHTTPServer((host, port), SpectatorHandler)
+    server.daemon_threads = True
+    server.sink = sink
+    server.heartbeat = heartbeat
+    server.verbose = verbose
+    return server
+
+
+def main() -> None:
+    from .fake_llm import FakeLLM
+    from .game import UndercoverGame
+
+    parser = argparse.ArgumentParser(description="谁是卧底观战服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-p", "--players", type=int, default=5, help="每局玩家数")
+    parser.add_argument("-u", "--undercover", type=int, default=1, help="每局卧底数")
+    parser.add_argument("--bots", type=int, default=0, help="启发式玩家数")
+    parser.add_argument("--fake", action="store_true", help="使用离线的 FakeLLM")
+    parser.add_argument("--ttft", type=float, default=0.3, help="FakeLLM 首 token 延迟")
+    parser.add_argument(
+        "--token-delay", type=float, default=0.05, help="FakeLLM 相邻 chunk 的间隔"
+    )
+    parser.add_argument(
+        "-n", "--games", type=int, default=None, help="对局数，默认不限"
+    )
+    parser.add_argument("--pause", type=float, default=3.0, help="两局之间的间隔秒数")
+    parser.add_argument(
+        "--queue", type=int, default=256, help="观众最多落后的事件数（token 另计）"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印请求日志")
+    args = parser.parse_args()
+
+    if not 0 <= args.bots <= args.players:
+        parser.error("--bots 必须在 0 到玩家数之间")
+    if not args.fake:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    llm = FakeLLM(ttft=args.ttft, token_delay=args.token_delay) if args.fake else None
+    kinds = ["heuristic"] * args.bots + ["ai"] * (args.players - args.bots)
+    metrics = MetricsRegistry()
+    sink = BroadcastSink(args.queue, metrics)
+
+    def make_game(game_id: int, sink: EventSink) -> UndercoverGame:
+        return UndercoverGame(
+            args.players,
+            args.undercover,
+            llm=llm,
+            sink=sink,
+            metrics=metrics,
+            kinds=kinds,
+        )
+
+    server = make_server(sink, args.host, args.port, verbose=args.verbose)
+    host, port = server.server_address[:2]
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=play_forever,
+        args=(sink, make_game, args.games, args.pause, stop),
+        daemon=True,
+    )
+    producer.start()
+    print(f"观战服务已启动: http://{host}:{port}/ (SSE: /events, WebSocket: /ws)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        sink.close()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+谁是卧底锦标赛
+
+在一组玩家配置（模型、温度、提示风格、启发式玩家或 LLM 玩家）之间两两对战，
+按 Elo 排名，尽量少花 LLM 请求:
+
+- 每个配对轮流由一方当卧底、另一方坐满其余座位；两局一组，同一词语对、
+  同样的座位，只交换身份，卧底座位按组轮换
+- 多局并发运行（arun），已花费和进行中预留的请求数不超过全局预算
+- 每局结束立即更新 Elo；某个配对的胜率置信区间不再包含 50% 时不再为它安排新对局
+
+运行（离线示例，启发式玩家对假 LLM）:
+    uv run python -m undercover_game.tournament --fake -c bot=heuristic -c fake=ai
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import math
+import time
+import zlib
+from collections.abc import AsyncIterator, Iterator, Sequence
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from .game import GameState, PlayerRecord, UndercoverGame
+from .metrics import MetricsRegistry
+from .players import AIPlayer, get_llm, player_name
+from .sinks import EventSink, NullSink
+
+
+@dataclass(frozen=True)
+class PlayerConfig:
+    """
+    一种参赛配置。
+
+    Args:
+        name: 排名中显示的名字，需唯一
+        kind: 玩家类型（PLAYER_KINDS 的键），"ai" 或 "heuristic"
+        model / temperature: 覆盖 LLM 的请求参数，None 表示使用 LLM 自己的设置
+        style: 提示词中的发言风格说明
+        llm: 该配置专用的 LLM，默认使用锦标赛的 LLM
+    """
+
+    name: str
+    kind: str = "ai"
+    model: str | None = None
+    temperature: float | None = None
+    style: str | None = None
+    llm: Any = field(default=None, compare=False, repr=False)
+
+    @classmethod
+    def parse(cls, spec: str) -> PlayerConfig:
+        """
+        从命令行格式解析: "名字=类型[,model=...][,temperature=...][,style=...]"，
+        如 "glm-hot=ai,model=glm-4-flash,temperature=1.2"
+        """
+        name, _, rest = spec.partition("=")
+        kind, *options = rest.split(",") if rest else ["ai"]
+        params: dict[str, Any] = {}
+        for option in options:
+            key, _, value = option.partition("=")
+            if key not in ("model", "temperature", "style"):
+                raise ValueError(f"未知的配置项: {key}")
+            params[key] = float(value) if key == "temperature" else value
+        return cls(name, kind or "ai", **params)
+
+
+def config_matrix(
+    models: Sequence[str | None] = (None,),
+    temperatures: Sequence[float | None] = (None,),
+    styles: dict[str, str | None] | None = None,
+    bots: int = 0,
+) -> list[PlayerConfig]:
+    """
+    模型 × 温度 × 提示风格的全部组合，再加上 bots 个启发式玩家配置。
+
+    Args:
+        models / temperatures: 取值列表，None 表示不覆盖
+        styles: 风格名 -> 风格说明，默认只有不加说明的 "default"
+        bots: 启发式玩家配置数（相同的启发式玩家，用作排名的基准）
+    """
+    styles = styles if styles is not None else {"default": None}
+    configs = []
+    for model, temperature, (style_name, style) in itertools.product(
+        models, temperatures, styles.items()
+    ):
+        parts = [model or "llm"]
+        if temperature is not None:
+            parts.append(f"t{temperature:g}")
+        if len(styles) > 1:
+            parts.append(style_name)
+        configs.append(PlayerConfig("/".join(parts), "ai", model, temperature, style))
+    configs.extend(
+        PlayerConfig(f"heuristic{i + 1}" if bots > 1 else "heuristic", "heuristic")
+        for i in range(bots)
+    )
+    return configs
+
+
+class ConfiguredLLM:
+    """
+    给 LLM 的每次请求加上固定参数（model、temperature 等），其余透传。
+
+    参数作为 stream / astream 的关键字参数传下去，外层的缓存、限流和对冲
+    包装照常生效，不同配置共用同一个连接池和请求额度。
+
+    Args:
+        llm: 被包装的 LLM
+        params: 追加到每次请求的参数，调用方显式传入的同名参数优先
+    """
+
+    def __init__(self, llm: Any, **params: Any) -> None:
+        self.llm = llm
+        self.params = params
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    @property
+    def model_name(self) -> str:
+        # 指标按模型名分组，覆盖了 model 时使用新的模型名
+        return self.params.get("model") or getattr(self.llm, "model_name", "unknown")
+
+    def stream(self, prompt: Any, **kwargs: Any) -> Iterator[Any]:
+        return self.llm.stream(prompt, **{**self.params, **kwargs})
+
+    def astream(self, prompt: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        return self.llm.astream(prompt, **{**self.params, **kwargs})
+
+
+class TournamentGame(UndercoverGame):
+    """
+    座位和身份由锦标赛指定的对局。
+
+    Args:
+        seats: 每个座位的配置
+        undercover_seats: 卧底所在的座位
+        llms: 每个座位使用的 LLM（启发式玩家为 None）
+        **kwargs: 传给 UndercoverGame
+    """
+
+    def __init__(
+        self,
+        seats: Sequence[PlayerConfig],
+        undercover_seats: set[int],
+        llms: Sequence[Any],
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            len(seats),
+            len(undercover_seats),
+            kinds=[config.kind for config in seats],
+            **kwargs,
+        )
+        self.seats = {player_name(i): config for i, config in enumerate(seats)}
+        self.undercover_seats = undercover_seats
+        self._llms = {player_name(i): llm for i, llm in enumerate(llms)}
+
+    def create_players(self) -> tuple[tuple[str, str], list[PlayerRecord]]:
+        words, players = super().create_players()
+        return words, [
+            replace(player, undercover=i in self.undercover_seats)
+            for i, player in enumerate(players)
+        ]
+
+    def llm_requests(self) -> int:
+        """本局发出的 LLM 请求数"""
+        return sum(
+            len(player.timings)
+            for player in self.agents.values()
+            if isinstance(player, AIPlayer)
+        )
+
+    def seat_llm(self, record: PlayerRecord) -> Any:
+        return self._llms[record.name]
+
+    def agent(self, record: PlayerRecord, state: GameState) -> AIPlayer:
+        created = record.name not in self.agents
+        player = super().agent(record, state)
+        style = self.seats[record.name].style
+        if created and style and isinstance(player, AIPlayer):
+            player.style = style
+        return player
+
+
+def wilson_interval(wins: int, games: int, z: float = 1.96) -> tuple[float, float]:
+    """胜率的 Wilson 置信区间；z=1.96 为 95%"""
+    if games == 0:
+        return 0.0, 1.0
+    p = wins / games
+    denominator = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denominator
+    half = (
+        z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    )
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+@dataclass
+class Pairing:
+    """两个配置之间的对战记录；胜负都以 a 的角度记录"""
+
+    a: PlayerConfig
+    b: PlayerConfig
+    scheduled: int = 0
+    games: int = 0
+    a_wins: int = 0
+    requests: int = 0
+    # 进行中的对局预留的请求数
+    reserved: int = 0
+    separated: bool = False
+
+    @property
+    def interval(self) -> tuple[float, float]:
+        return wilson_interval(self.a_wins, self.games)
+
+
+@dataclass
+class TournamentReport:
+    """锦标赛结果"""
+
+    ratings: dict[str, float]
+    pairings: list[Pairing]
+    games: int
+    requests: int
+    budget: int | None
+    wall_seconds: float
+
+    def summary(self) -> str:
+        """生成可读的汇总文本"""
+        budget = f"/{self.budget}" if self.budget is not None else ""
+        lines = [
+            (
+                f"对局数: {self.games}  LLM 请求: {self.requests}{budget}  "
+                f"总耗时: {self.wall_seconds:.2f}s"
+            ),
+            "排名:",
+        ]
+        ranked = sorted(self.ratings.items(), key=lambda item: -item[1])
+        lines.extend(
+            f"  {i}. {name:<20} {rating:>7.1f}"
+            for i, (name, rating) in enumerate(ranked, 1)
+        )
+        lines.append("配对:")
+        for pairing in self.pairings:
+            low, high = pairing.interval
+            mark = " 已分出" if pairing.separated else ""
+            lines.append(
+                f"  {pairing.a.name} vs {pairing.b.name}: "
+                f"{pairing.a_wins}/{pairing.games} 胜 "
+                f"[{low:.0%}, {high:.0%}] 请求 {pairing.requests}{mark}"
+            )
+        return "\n".join(lines)
+
+
+class Tournament:
+    """
+    配置之间的循环赛。
+
+    Args:
+        configs: 参赛配置，至少两个，名字不能重复
+        num_players: 每局玩家数
+        num_undercover: 每局卧底数
+        llm: LLM 玩家默认使用的 LLM，默认为 get_llm()（只在有 LLM 配置时创建）；
+            需要限流时传入 GovernedLLM，或设置 get_llm() 读取的环境变量
+        budget: 整个锦标赛最多发出的 LLM 请求数，None 表示不限
+        max_concurrent_games: 同时进行的对局数
+        min_games / max_games: 每个配对至少、至多进行的局数（按两局一组取偶数）
+        z: 提前结束的置信水平，1.96 为 95%
+        k_factor / initial_rating: Elo 参数
+        seed: 词语和平票的随机种子
+        sink: 对局事件的输出，默认不输出
+        metrics: 所有对局共用的指标注册表（按模型分组的延迟等）
+        **game_options: 传给 UndercoverGame，如 structured_votes=True；
+            不支持 moderator_votes（主持人用一个 LLM 替所有座位投票，
+            对战双方的投票就不再来自各自的配置）
+    """
+
+    def __init__(
+        self,
+        configs: Sequence[PlayerConfig],
+        num_players: int = 5,
+        num_undercover: int = 1,
+        llm: Any = None,
+        budget: int | None = None,
+        max_concurrent_games: int = 4,
+        min_games: int = 6,
+        max_games: int = 40,
+        z: float = 1.96,
+        k_factor: float = 24.0,
+        initial_rating: float = 1500.0,
+        seed: int = 0,
+        sink: EventSink | None = None,
+        metrics: MetricsRegistry | None = None,
+        **game_options: Any,
+    ) -> None:
+        if len(configs) < 2:
+            raise ValueError("至少需要 2 个配置")
+        if len({config.name for config in configs}) != len(configs):
+            raise ValueError("配置名不能重复")
+        if num_undercover * 2 >= num_players:
+            raise ValueError("卧底数量必须少于玩家数的一半")
+        if game_options.get("moderator_votes"):
+            raise ValueError(
+                "锦标赛不支持 moderator_votes，各座位需要用自己配置的 LLM 投票"
+            )
+        self.configs = list(configs)
+        self.num_players = num_players
+        self.num_undercover = num_undercover
+        self.budget = budget
+        self.max_concurrent_games = max_concurrent_games
+        self.min_games = min_games + min_games % 2
+        self.max_games = max_games + max_games % 2
+        self.z = z
+        self.k_factor = k_factor
+        self.seed = seed
+        self.sink = sink if sink is not None else NullSink()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.game_options = game_options
+        self.ratings = {config.name: initial_rating for config in configs}
+        self.pairings = [Pairing(a, b) for a, b in itertools.combinations(configs, 2)]
+        self.requests = 0
+        self.games = 0
+
+        if llm is None and any(
+            config.kind == "ai" and config.llm is None for config in configs
+        ):
+            llm = get_llm()
+        self.llm = llm
+        self._llms = {config.name: self._config_llm(config) for config in configs}
+
+    def _config_llm(self, config: PlayerConfig) -> Any:
+        if config.kind != "ai":
+            return None
+        llm = config.llm if config.llm is not None else self.llm
+        params = {
+            name: value
+            for name, value in (
+                ("model", config.model),
+                ("temperature", config.temperature),
+            )
+            if value is not None
+        }
+        return ConfiguredLLM(llm, **params) if params else llm
+
+    def max_requests(self, pairing: Pairing, game: int) -> int:
+        """
+        一局最多发出的 LLM 请求数。开局前按它预留预算，结束后按实际数结算，
+        因此已花费的请求数不会超过预算。
+
+        每轮淘汰一人。平民和卧底都可能被淘汰，最长的对局先淘汰 num_undercover - 1
+        名卧底，再淘汰平民直到只剩 1 名，共 num_players - 2 轮；每轮每个存活的
+        LLM 玩家描述、投票各一次。
+        """
+        llm_seats = sum(
+            config.kind == "ai" for config in self._seat_configs(pairing, game)
+        )
+        return sum(
+            2 * min(llm_seats, self.num_players - r)
+            for r in range(self.num_players - 2)
+        )
+
+    def _seat_configs(self, pairing: Pairing, game: int) -> list[PlayerConfig]:
+        undercover = self._undercover_seats(game)
+        spy, civilian = (
+            (pairing.a, pairing.b) if game % 2 == 0 else (pairing.b, pairing.a)
+        )
+        return [
+            spy if seat in undercover else civilian for seat in range(self.num_players)
+        ]
+
+    def _undercover_seats(self, game: int) -> set[int]:
+        # 两局一组共用座位，组间轮换，卧底在每个座位上的次数相同
+        offset = (game // 2 * self.num_undercover) % self.num_players
+        return {(offset + i) % self.num_players for i in range(self.num_undercover)}
+
+    def _next_game(self) -> tuple[Pairing, int, int] | None:
+        """
+        选出下一局: 尚未分出胜负、已安排局数最少、剩余预算够预留的配对。
+
+        Returns:
+            (配对, 该配对的第几局, 为这局预留的请求数)；没有可安排的对局时为 None
+        """
+        reserved = sum(pairing.reserved for pairing in self.pairings)
+        candidates = sorted(
+            (
+                pairing
+                for pairing in self.pairings
+                if not pairing.separated and pairing.scheduled < self.max_games
+            ),
+            key=lambda pairing: pairing.scheduled,
+        )
+        for pairing in candidates:
+            game = pairing.scheduled
+            cost = self.max_requests(pairing, game)
+            if self.budget is None or self.requests + reserved + cost <= self.budget:
+                pairing.scheduled += 1
+                pairing.reserved += cost
+                return pairing, game, cost
+        return None
+
+    async def _play(self, pairing: Pairing, game_index: int) -> tuple[bool, int]:
+        """进行一局，返回 (a 是否获胜, LLM 请求数)"""
+        seats = self._seat_configs(pairing, game_index)
+        # 同一组的两局用同一个种子，词语对相同
+        seed = zlib.crc32(
+            f"{self.seed}/{pairing.a.name}/{pairing.b.name}/{game_index // 2}".encode()
+        )
+        game = TournamentGame(
+            seats,
+            self._undercover_seats(game_index),
+            [self._llms[config.name] for config in seats],
+            sink=self.sink,
+            seed=seed,
+            metrics=self.metrics,
+            **self.game_options,
+        )
+        state = await game.arun()
+        spy_won = state["winner"] == "卧底"
+        a_is_spy = game_index % 2 == 0
+        return spy_won == a_is_spy, game.llm_requests()
+
+    def _record(self, pairing: Pairing, a_won: bool, requests: int) -> None:
+        """记录一局结果，更新 Elo，检查是否可以提前结束该配对"""
+        pairing.games += 1
+        pairing.a_wins += a_won
+        pairing.requests += requests
+        self.games += 1
+        self.requests += requests
+        self.metrics.inc("tournament_games_total")
+        self.metrics.inc("tournament_requests_total", requests)
+
+        winner, loser = (pairing.a, pairing.b) if a_won else (pairing.b, pairing.a)
+        expected = 1 / (
+            1 + 10 ** ((self.ratings[loser.name] - self.ratings[winner.name]) / 400)
+        )
+        delta = self.k_factor * (1 - expected)
+        self.ratings[winner.name] += delta
+        self.ratings[loser.name] -= delta
+
+        # 只在完整的一组（双方各当一次卧底）之后判断，避免身份不对称带来的偏差
+        if pairing.games >= self.min_games and pairing.games % 2 == 0:
+            low, high = wilson_interval(pairing.a_wins, pairing.games, self.z)
+            pairing.separated = low > 0.5 or high < 0.5
+
+    async def arun(self) -> TournamentReport:
+        """异步运行锦标赛，直到所有配对分出胜负、达到局数上限或预算用完"""
+        start = time.perf_counter()
+        # 进行中的对局 -> (配对, 预留的请求数)
+        running: dict[asyncio.Task, tuple[Pairing, int]] = {}
+        try:
+            while True:
+                while len(running) < self.max_concurrent_games:
+                    scheduled = self._next_game()
+                    if scheduled is None:
+                        break
+                    pairing, game_index, reserved = scheduled
+                    task = asyncio.create_task(self._play(pairing, game_index))
+                    running[task] = (pairing, reserved)
+                if not running:
+                    break
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pairing, reserved = running.pop(task)
+                    a_won, requests = task.result()
+                    pairing.reserved -= reserved
+                    self._record(pairing, a_won, requests)
+        finally:
+            # 某局出错或锦标赛被取消时，取消其余进行中的对局并等它们结束再向上抛出
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        return TournamentReport(
+            ratings=dict(self.ratings),
+            pairings=self.pairings,
+            games=self.games,
+            requests=self.requests,
+            budget=self.budget,
+            wall_seconds=time.perf_counter() - start,
+        )
+
+    def run(self) -> TournamentReport:
+        """同步运行锦标赛"""
+        return asyncio.run(self.arun())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="谁是卧底锦标赛")
+    parser.add_argument(
+        "-c",
+        "--config",
+        action="append",
+        type=PlayerConfig.parse,
+        help='参赛配置，如 "bot=heuristic" 或 "hot=ai,temperature=1.2"，可重复',
+    )
+    parser.add_argument("-p", "--players", type=int, default=5, help="每局玩家数")
+    parser.add_argument("-u", "--undercover", type=int, default=1, help="每局卧底数")
+    parser.add_argument("--budget", type=int, default=None, help="LLM 请求预算")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的对局数")
+    parser.add_argument("--max-games", type=int, default=40, help="每个配对最多局数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--fake", action="store_true", help="使用离线的 FakeLLM")
+    args = parser.parse_args()
+
+    configs = args.config or [
+        PlayerConfig("heuristic", "heuristic"),
+        PlayerConfig("llm"),
+    ]
+    llm = None
+    if args.fake:
+        from .fake_llm import FakeLLM
+
+        llm = FakeLLM()
+    tournament = Tournament(
+        configs,
+        args.players,
+        args.undercover,
+        llm=llm,
+        budget=args.budget,
+        max_concurrent_games=args.concurrency,
+        max_games=args.max_games,
+        seed=args.seed,
+    )
+    print(tournament.run().summary())
+
+
+if __name__ == "__main__":
+    main()
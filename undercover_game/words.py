@@ -2,9 +2,32 @@
 谁是卧底游戏词库
 
 包含平民词和卧底词的配对列表。
+
+WORD_PAIRS 是内置的小词库；大规模模拟可以使用 WordCorpus 加载的语料库文件:
+    corpus = WordCorpus("pairs.wpc")
+    game = UndercoverGame(words=corpus.select(category="食物", difficulty=2))
+
+语料库文件由 build_corpus 从 TSV（平民词、卧底词、类别、难度）生成:
+    uv run python -m undercover_game.words build pairs.tsv pairs.wpc
+
+文件按需内存映射，打开时只读文件头；词语对和索引都是按偏移量直接读取，
+启动时间和常驻内存与语料库大小无关。
 """
 
-# 词语配对: (平民词, 卧底词)
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import mmap
+import random
+import struct
+import threading
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Any, overload
+
+# 词语对: (平民词, 卧底词)
 WORD_PAIRS: list[tuple[str, str]] = [
     ("苹果", "梨"),
     ("篮球", "足球"),
@@ -22,3 +45,347 @@ WORD_PAIRS: list[tuple[str, str]] = [
     ("筷子", "叉子"),
     ("月亮", "太阳"),
 ]
+
+# 文件头: 魔数、版本、词语对数，以及各段的位置
+#   offsets: count + 1 个 u64，第 i 个词语对在数据段中的 [offsets[i], offsets[i + 1])
+#   by_category: count 个 u32 编号，按 (类别, 难度, 编号) 排序
+#   by_difficulty: count 个 u32 编号，按 (难度, 类别, 编号) 排序
+#   meta: JSON，各类别 / 难度 / (类别, 难度) 在上面两个数组中的 [start, end)
+#   data: UTF-8 的 "平民词\x1f卧底词"，首尾相接
+_MAGIC = b"UCWP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sII6Q")
+_SEPARATOR = "\x1f"
+
+
+class WordCorpus(Sequence[tuple[str, str]]):
+    """
+    内存映射的词语对语料库，可以直接作为 UndercoverGame 的 words。
+
+    第一次访问时才打开文件；多线程共用同一个实例是安全的。
+    可以 pickle 传给其他进程，pickle 中只有文件路径，在新进程中重新映射。
+
+    Args:
+        path: build_corpus 生成的文件
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mm: mmap.mmap | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(state["path"])
+
+    def _open(self) -> None:
+        # _mm 最后赋值，不为 None 时其他字段都已就绪，不必加锁
+        if self._mm is not None:
+            return
+        with self._lock:
+            if self._mm is not None:
+                return
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count, *positions = _HEADER.unpack_from(mm)
+            if magic != _MAGIC or version != _VERSION:
+                mm.close()
+                raise ValueError(f"不是词语对语料库文件: {self.path}")
+            offsets, by_category, by_difficulty, meta, meta_len, data = positions
+            view = memoryview(mm)
+            self._count = count
+            self._offsets = view[offsets : offsets + 8 * (count + 1)].cast("Q")
+            self._by_category = view[by_category : by_category + 4 * count].cast("I")
+            self._by_difficulty = view[by_difficulty : by_difficulty + 4 * count].cast(
+                "I"
+            )
+            self._meta = json.loads(bytes(view[meta : meta + meta_len]))
+            self._data = data
+            self._mm = mm
+
+    @property
+    def categories(self) -> list[str]:
+        self._open()
+        return list(self._meta["categories"])
+
+    @property
+    def difficulties(self) -> list[int]:
+        self._open()
+        return [int(d) for d in self._meta["difficulties"]]
+
+    def __len__(self) -> int:
+        self._open()
+        return self._count
+
+    @overload
+    def __getitem__(self, index: int) -> tuple[str, str]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[tuple[str, str]]: ...
+
+    def __getitem__(self, index: int | slice) -> Any:
+        self._open()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._data + self._offsets[index]
+        end = self._data + self._offsets[index + 1]
+        civilian, undercover = self._mm[start:end].decode("utf-8").split(_SEPARATOR)
+        return civilian, undercover
+
+    def select(
+        self, category: str | None = None, difficulty: int | None = None
+    ) -> Sequence[tuple[str, str]]:
+        """
+        按类别和 / 或难度筛选，返回只读视图。
+
+        索引在生成文件时已经排好，筛选和从视图中取一个都是 O(1)。
+
+        Raises:
+            KeyError: 没有这个类别或难度
+        """
+        self._open()
+        if category is None and difficulty is None:
+            return self
+        if difficulty is None:
+            start, end = self._meta["categories"][category]
+            return _IndexView(self, "_by_category", start, end)
+        if category is None:
+            start, end = self._meta["difficulties"][str(difficulty)]
+            return _IndexView(self, "_by_difficulty", start, end)
+        start, end = self._meta["groups"][f"{category}/{difficulty}"]
+        return _IndexView(self, "_by_category", start, end)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                # 先释放指向映射的视图，否则 mmap 不能关闭
+                self._offsets.release()
+                self._by_category.release()
+                self._by_difficulty.release()
+                self._mm.close()
+                self._mm = None
+
+
+class _IndexView(Sequence[tuple[str, str]]):
+    """语料库按索引数组（index 为 WordCorpus 的属性名）中一段编号组成的视图"""
+
+    def __init__(self, corpus: WordCorpus, index: str, start: int, end: int) -> None:
+        corpus._open()
+        self.corpus = corpus
+        self._index = index
+        self._ids: memoryview = getattr(corpus, index)
+        self._start = start
+        self._end = end
+
+    def __getstate__(self) -> dict[str, Any]:
+        # memoryview 不能 pickle，保存属性名，在新进程中从重新映射的语料库取得
+        return {
+            "corpus": self.corpus,
+            "index": self._index,
+            "start": self._start,
+            "end": self._end,
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, index: int) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.corpus[self._ids[self._start + index]]
+
+
+class WindowSampler:
+    """
+    不重复抽样: 连续 len(pairs) 次抽取内不会出现重复的词语对。
+
+    第 k 次抽取返回 pairs[(a * k + b) % n]，a 与 n 互质时这是 [0, n) 的一个排列，
+    不需要记录抽过哪些。计数器在进程内共享（线程安全）；多进程并行时必须用 shard
+    把计数器空间按进程错开，或者直接用对局编号调用 pair。shard 得到的抽样器
+    pickle 时连同计数器的当前位置一起保存；未分片的抽样器 pickle 后复制到几个进程，
+    各自的计数器会从同一位置开始抽到相同的序列，所以还原出的副本只能调用 pair，
+    draw 会报错。
+
+    Args:
+        pairs: 词语对序列，如 WORD_PAIRS、WordCorpus 或 select 的结果
+        seed: 决定排列的随机种子
+        start / stride: draw 使用计数器中 start + stride * j 的位置，见 shard
+    """
+
+    def __init__(
+        self,
+        pairs: Sequence[tuple[str, str]],
+        seed: int = 0,
+        start: int = 0,
+        stride: int = 1,
+    ) -> None:
+        if not pairs:
+            raise ValueError("词语对为空")
+        self.pairs = pairs
+        self.seed = seed
+        self.start = start
+        self.stride = stride
+        n = len(pairs)
+        rng = random.Random(seed)
+        # 步长取 n 的黄金分割点附近且与 n 互质，相邻两次抽到的位置相距较远
+        a = max(1, int(n * 0.618) + rng.randrange(max(1, n // 16)))
+        while math.gcd(a, n) != 1:
+            a += 1
+        self._a = a
+        self._b = rng.randrange(n)
+        self._drawn = 0  # draw 已经抽取的次数
+        self._sharded = False  # 由 shard 创建
+        self._copied = False  # 由未分片的抽样器 pickle 还原，不能 draw
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, Any]:
+        with self._lock:
+            state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._sharded = state.get("_sharded", False)
+        self._copied = not self._sharded
+        self._lock = threading.Lock()
+
+    def pair(self, k: int) -> tuple[str, str]:
+        """第 k 次抽取的结果；k 相差小于 len(pairs) 的两次不会重复"""
+        n = len(self.pairs)
+        return self.pairs[(self._a * k + self._b) % n]
+
+    def shard(self, index: int, count: int) -> WindowSampler:
+        """
+        多进程并行时第 index 个（共 count 个）进程使用的抽样器。
+
+        各进程只使用计数器中 index + count * j 的位置，合起来仍是同一个排列。
+        """
+        sampler = WindowSampler(self.pairs, self.seed, index, count)
+        sampler._sharded = True
+        return sampler
+
+    def draw(self) -> tuple[str, str]:
+        """按共享计数器抽取下一个词语对"""
+        if self._copied:
+            raise RuntimeError(
+                "未分片的 WindowSampler 经 pickle 复制后不能 draw，多个进程会抽到"
+                "相同的词语对；先用 shard(index, count) 为每个进程创建抽样器，"
+                "或者按对局编号调用 pair(k)"
+            )
+        with self._lock:
+            j = self._drawn
+            self._drawn += 1
+        return self.pair(self.start + self.stride * j)
+
+
+def build_corpus(path: str | Path, rows: Iterable[tuple[str, str, str, int]]) -> int:
+    """
+    生成语料库文件。
+
+    Args:
+        path: 输出文件
+        rows: (平民词, 卧底词, 类别, 难度)
+
+    Returns:
+        写入的词语对数
+    """
+    data = bytearray()
+    offsets = [0]
+    keys: list[tuple[str, int]] = []
+    for civilian, undercover, category, difficulty in rows:
+        if _SEPARATOR in civilian or _SEPARATOR in undercover:
+            raise ValueError(f"词语中不能包含分隔符: {civilian!r}, {undercover!r}")
+        data += f"{civilian}{_SEPARATOR}{undercover}".encode()
+        offsets.append(len(data))
+        keys.append((category, int(difficulty)))
+    count = len(keys)
+
+    by_category = sorted(range(count), key=lambda i: keys[i])
+    by_difficulty = sorted(range(count), key=lambda i: (keys[i][1], keys[i][0]))
+    meta: dict[str, dict[str, list[int]]] = {
+        "categories": {},
+        "difficulties": {},
+        "groups": {},
+    }
+    for pos, i in enumerate(by_category):
+        category, difficulty = keys[i]
+        meta["categories"].setdefault(category, [pos, pos])[1] = pos + 1
+        meta["groups"].setdefault(f"{category}/{difficulty}", [pos, pos])[1] = pos + 1
+    for pos, i in enumerate(by_difficulty):
+        meta["difficulties"].setdefault(str(keys[i][1]), [pos, pos])[1] = pos + 1
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode()
+
+    sections = [
+        struct.pack(f"<{count + 1}Q", *offsets),
+        struct.pack(f"<{count}I", *by_category),
+        struct.pack(f"<{count}I", *by_difficulty),
+        meta_bytes,
+        bytes(data),
+    ]
+    positions = []
+    pos = _HEADER.size
+    for section in sections:
+        pos += -pos % 8  # 各段按 8 字节对齐
+        positions.append(pos)
+        pos += len(section)
+
+    with open(path, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                _MAGIC, _VERSION, count, *positions[:4], len(meta_bytes), positions[4]
+            )
+        )
+        for position, section in zip(positions, sections):
+            f.write(b"\0" * (position - f.tell()))
+            f.write(section)
+    return count
+
+
+def read_tsv(path: str | Path) -> Iterable[tuple[str, str, str, int]]:
+    """读取 "平民词\\t卧底词\\t类别\\t难度" 格式的 TSV，类别和难度可省略"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2 or not fields[0]:
+                continue
+            category = fields[2] if len(fields) > 2 and fields[2] else "未分类"
+            difficulty = int(fields[3]) if len(fields) > 3 and fields[3] else 1
+            yield fields[0], fields[1], category, difficulty
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="谁是卧底词库")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="从 TSV 生成语料库文件")
+    build.add_argument("tsv", help="平民词\\t卧底词\\t类别\\t难度")
+    build.add_argument("output", help="输出的 .wpc 文件")
+    info = sub.add_parser("info", help="查看语料库文件")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_corpus(args.output, read_tsv(args.tsv))
+        print(f"已写入 {count} 个词语对: {args.output}")
+    else:
+        corpus = WordCorpus(args.path)
+        print(f"{len(corpus)} 个词语对")
+        print(f"类别: {', '.join(corpus.categories)}")
+        print(f"难度: {', '.join(map(str, corpus.difficulties))}")
+
+
+if __name__ == "__main__":
+    main()